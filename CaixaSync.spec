@@ -5,7 +5,7 @@ a = Analysis(
     ['main.py'],
     pathex=[],
     binaries=[],
-    datas=[('icons', 'icons')],
+    datas=[('icons', 'icons'), ('config', 'config')],
     hiddenimports=[
         'html_reader', 
         'compare_movements', 
@@ -24,7 +24,21 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Módulos que não são usados: menos arquivos para descompactar a cada início do one-file
+    excludes=[
+        'tkinter',
+        'matplotlib',
+        'scipy',
+        'IPython',
+        'PyQt5.QtWebEngine',
+        'PyQt5.QtWebEngineCore',
+        'PyQt5.QtWebEngineWidgets',
+        'PyQt5.QtMultimedia',
+        'PyQt5.QtQml',
+        'PyQt5.QtQuick',
+        'PyQt5.QtSql',
+        'PyQt5.QtTest'
+    ],
     noarchive=False,
     optimize=0,
 )
@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+from app_config import caminho_config, carregar_json
+from log_config import obter_logger
+
+logger = obter_logger('account_rules')
+
+ARQUIVO_CONTAS = 'contas.json'
+
+COLUNAS_SEM_CONTA = ['Filial', 'Forma de Pagamento', 'Lançamentos', 'Valor']
+
+def _como_texto(serie: pd.Series) -> pd.Series:
+    return serie.astype(object).where(serie.notna(), '').astype(str).str.strip()
+
+class RegrasContas:
+    """
+    Tabela (Filial, Forma de Pagamento) → Conta Bancária.
+
+    A tabela é compilada em uma matriz de códigos: filial e forma viram
+    categorias, e a conta de cada linha sai de uma única indexação da matriz,
+    sem laço em Python por linha. Combinações fora da tabela ficam sem conta.
+
+    Args:
+        regras: Conta por par (filial, forma de pagamento)
+    """
+
+    def __init__(self, regras: Dict[Tuple[str, str], str]):
+        self.regras = dict(regras)
+        self._filiais = pd.Index(sorted({filial for filial, _ in self.regras}))
+        self._formas = pd.Index(sorted({forma for _, forma in self.regras}))
+        # A última posição de cada eixo (código -1) e a última conta ('') representam "sem regra"
+        self._contas = np.array(sorted(set(self.regras.values())) + [''], dtype=object)
+        codigo_conta = {conta: indice for indice, conta in enumerate(self._contas)}
+        self._matriz = np.full((len(self._filiais) + 1, len(self._formas) + 1), len(self._contas) - 1, dtype=np.int32)
+        for (filial, forma), conta in self.regras.items():
+            self._matriz[self._filiais.get_loc(filial), self._formas.get_loc(forma)] = codigo_conta[conta]
+
+    @classmethod
+    def de_config(cls, config: Dict) -> 'RegrasContas':
+        """
+        Cria as regras a partir do conteúdo do arquivo de configuração.
+
+        Formato: {"contas": {"Loja 1": {"Dinheiro": "CAIXA 01", ...}, ...}}
+
+        Args:
+            config: Configuração já carregada
+
+        Returns:
+            Regras compiladas
+        """
+        contas = config.get('contas')
+        if not isinstance(contas, dict):
+            raise ValueError("Configuração de contas inválida: esperado um objeto 'contas' por filial")
+        regras = {}
+        for filial, formas in contas.items():
+            if not isinstance(formas, dict):
+                raise ValueError(f"Configuração de contas inválida para a filial '{filial}': esperado forma → conta")
+            for forma, conta in formas.items():
+                regras[(str(filial).strip(), str(forma).strip())] = str(conta).strip()
+        return cls(regras)
+
+    @classmethod
+    def de_arquivo(cls, caminho: Optional[str] = None) -> 'RegrasContas':
+        """
+        Carrega as regras de um arquivo JSON.
+
+        Args:
+            caminho: Caminho do arquivo (None = config/contas.json, ver app_config)
+
+        Returns:
+            Regras compiladas
+        """
+        caminho = caminho or caminho_config(ARQUIVO_CONTAS)
+        regras = cls.de_config(carregar_json(caminho))
+        logger.debug("Regras de conta carregadas de %s: %d combinação(ões)", caminho, len(regras.regras))
+        return regras
+
+    def conta(self, forma_pagamento: str, filial: str) -> str:
+        """Conta bancária de uma única combinação ('' se não houver regra)."""
+        chave = ('' if pd.isna(filial) else str(filial).strip(), '' if pd.isna(forma_pagamento) else str(forma_pagamento).strip())
+        return self.regras.get(chave, '')
+
+    def aplicar(self, filiais: pd.Series, formas: pd.Series) -> pd.Series:
+        """
+        Conta bancária de cada linha em uma única operação vetorizada.
+
+        Args:
+            filiais: Coluna Filial
+            formas: Coluna Forma de Pagamento, alinhada com filiais
+
+        Returns:
+            Série com a conta de cada linha ('' para combinações sem regra)
+        """
+        codigos_filial = pd.Categorical(_como_texto(filiais), categories=self._filiais).codes
+        codigos_forma = pd.Categorical(_como_texto(formas), categories=self._formas).codes
+        contas = self._contas[self._matriz[codigos_filial, codigos_forma]]
+        return pd.Series(contas, index=filiais.index, name='Conta Bancária', dtype=object)
+
+    def relatorio_sem_conta(
+        self,
+        filiais: pd.Series,
+        formas: pd.Series,
+        contas: pd.Series,
+        centavos: pd.Series,
+        ordenar: bool = True
+    ) -> pd.DataFrame:
+        """
+        Resume as combinações de filial e forma de pagamento que ficaram sem conta.
+
+        Args:
+            filiais: Coluna Filial
+            formas: Coluna Forma de Pagamento
+            contas: Resultado de aplicar
+            centavos: Valor de cada linha em centavos
+            ordenar: False mantém as combinações na ordem em que aparecem, para
+                juntar resumos parciais com juntar_relatorios_sem_conta
+
+        Returns:
+            DataFrame com Filial, Forma de Pagamento, Lançamentos e Valor (centavos),
+            do maior número de lançamentos para o menor
+        """
+        sem_conta = contas == ''
+        resumo = pd.DataFrame({
+            'Filial': _como_texto(filiais[sem_conta]),
+            'Forma de Pagamento': _como_texto(formas[sem_conta]),
+            'Valor': centavos[sem_conta].astype('int64'),
+        }).groupby(['Filial', 'Forma de Pagamento'], sort=False).agg(
+            Lançamentos=('Valor', 'size'), Valor=('Valor', 'sum')
+        ).reset_index()[COLUNAS_SEM_CONTA]
+        return _ordenar_sem_conta(resumo) if ordenar else resumo
+
+def _ordenar_sem_conta(resumo: pd.DataFrame) -> pd.DataFrame:
+    return resumo.sort_values('Lançamentos', ascending=False, kind='stable').reset_index(drop=True)
+
+def juntar_relatorios_sem_conta(parciais: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Junta os resumos sem conta de cada bloco de linhas (relatorio_sem_conta com
+    ordenar=False), com o mesmo resultado do resumo feito sobre todas as linhas.
+
+    Args:
+        parciais: Resumos parciais, na ordem dos blocos
+
+    Returns:
+        Resumo no formato de relatorio_sem_conta
+    """
+    if not parciais:
+        return pd.DataFrame(columns=COLUNAS_SEM_CONTA)
+    resumo = pd.concat(parciais, ignore_index=True).groupby(
+        ['Filial', 'Forma de Pagamento'], sort=False
+    ).agg(Lançamentos=('Lançamentos', 'sum'), Valor=('Valor', 'sum')).reset_index()
+    return _ordenar_sem_conta(resumo[COLUNAS_SEM_CONTA])
+
+_regras_padrao: Optional[RegrasContas] = None
+
+def obter_regras_contas() -> RegrasContas:
+    """Regras carregadas do arquivo de configuração padrão (lido uma única vez)."""
+    global _regras_padrao
+    if _regras_padrao is None:
+        _regras_padrao = RegrasContas.de_arquivo()
+    return _regras_padrao
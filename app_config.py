@@ -0,0 +1,52 @@
+import json
+import os
+import sys
+from typing import Any, List
+
+PASTA_CONFIG = 'config'
+VARIAVEL_PASTA_CONFIG = 'CAIXASYNC_CONFIG'
+
+def pastas_config() -> List[str]:
+    """
+    Pastas onde os arquivos de configuração são procurados, em ordem de prioridade.
+
+    1. Pasta indicada na variável de ambiente CAIXASYNC_CONFIG
+    2. Pasta 'config' ao lado do executável (permite editar a versão empacotada)
+    3. Pasta 'config' distribuída junto com o código
+
+    Returns:
+        Lista de pastas candidatas
+    """
+    pastas = []
+    if os.environ.get(VARIAVEL_PASTA_CONFIG):
+        pastas.append(os.environ[VARIAVEL_PASTA_CONFIG])
+    if getattr(sys, 'frozen', False):
+        pastas.append(os.path.join(os.path.dirname(sys.executable), PASTA_CONFIG))
+    base = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    pastas.append(os.path.join(base, PASTA_CONFIG))
+    return pastas
+
+def caminho_config(nome_arquivo: str) -> str:
+    """
+    Localiza um arquivo de configuração.
+
+    Args:
+        nome_arquivo: Nome do arquivo (ex.: 'lojas.json')
+
+    Returns:
+        Caminho do primeiro arquivo encontrado
+
+    Raises:
+        FileNotFoundError: Se o arquivo não existir em nenhuma das pastas
+    """
+    pastas = pastas_config()
+    for pasta in pastas:
+        caminho = os.path.join(pasta, nome_arquivo)
+        if os.path.isfile(caminho):
+            return caminho
+    raise FileNotFoundError(f"Arquivo de configuração '{nome_arquivo}' não encontrado em: {', '.join(pastas)}")
+
+def carregar_json(caminho: str) -> Any:
+    """Lê um arquivo de configuração JSON (UTF-8)."""
+    with open(caminho, 'r', encoding='utf-8') as arquivo:
+        return json.load(arquivo)
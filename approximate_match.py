@@ -0,0 +1,242 @@
+import numpy as np
+import pandas as pd
+from typing import List, Optional
+from log_config import obter_logger
+
+logger = obter_logger('approximate_match')
+
+# Candidatos mantidos por movimentação, dos mais próximos para os mais distantes
+LIMITE_CANDIDATOS_PADRAO = 20
+
+# Pares candidatos expandidos de cada vez; limita a memória quando há muitos valores iguais
+PARES_POR_BLOCO = 1_000_000
+
+COLUNAS_PARES = ['linha_mov', 'linha_formatada', 'Diferença (centavos)', 'Diferença (dias)']
+
+COLUNAS_RELATORIO_APROXIMADOS = [
+    'Código', 'Movimentação', 'Filial', 'Valor Movimentação', 'Valor Caixa', 'Diferença',
+    'Data Movimentação', 'Data Caixa', 'Diferença (dias)', 'Forma de Pagamento', 'Cliente/Fornecedor'
+]
+
+class CriteriosAproximacao:
+    """
+    Critérios do cruzamento aproximado, aplicado ao que sobra do cruzamento exato.
+
+    Um par é aceito quando a filial é a mesma, a diferença de valor não passa
+    da tolerância e, com janela_dias, a data do caixa e a data da movimentação
+    não se afastam mais do que a janela (sem data em um dos lados, o par é
+    recusado).
+
+    Args:
+        tolerancia_centavos: Diferença máxima de valor, em centavos
+        janela_dias: Diferença máxima entre as datas, em dias (None = datas não são comparadas)
+        limite_candidatos: Candidatos mantidos por movimentação, dos mais próximos
+
+    Raises:
+        ValueError: Se algum dos limites for negativo (ou limite_candidatos for 0)
+    """
+
+    def __init__(
+        self,
+        tolerancia_centavos: int = 0,
+        janela_dias: Optional[int] = None,
+        limite_candidatos: int = LIMITE_CANDIDATOS_PADRAO
+    ):
+        if tolerancia_centavos < 0:
+            raise ValueError(f"Tolerância inválida: {tolerancia_centavos} centavos")
+        if janela_dias is not None and janela_dias < 0:
+            raise ValueError(f"Janela de datas inválida: {janela_dias} dias")
+        if limite_candidatos < 1:
+            raise ValueError(f"Limite de candidatos inválido: {limite_candidatos}")
+        self.tolerancia_centavos = int(tolerancia_centavos)
+        self.janela_dias = janela_dias
+        self.limite_candidatos = int(limite_candidatos)
+
+    def __repr__(self) -> str:
+        return (
+            f"CriteriosAproximacao(tolerancia_centavos={self.tolerancia_centavos}, "
+            f"janela_dias={self.janela_dias}, limite_candidatos={self.limite_candidatos})"
+        )
+
+def em_dias(datas: pd.Series) -> np.ndarray:
+    """Datas como dias desde 1970 (float, NaN para datas vazias), para comparar janelas de datas."""
+    datas = pd.to_datetime(datas)
+    return ((datas - pd.Timestamp(0)) / pd.Timedelta(days=1)).to_numpy(dtype=float, na_value=np.nan)
+
+# Chave composta (valor, dia): o dia ocupa os bits baixos, então a ordem é por valor e depois por data
+FATOR_CHAVE = 1 << 20
+
+def _chave(valores: np.ndarray, dias: np.ndarray, dia_base: float) -> np.ndarray:
+    """Chave int64 ordenada por valor e depois por data (sem data vai para o fim de cada valor)."""
+    deslocamento = np.nan_to_num(dias - dia_base, nan=FATOR_CHAVE - 1).astype('int64')
+    return valores * FATOR_CHAVE + np.clip(deslocamento, 0, FATOR_CHAVE - 1)
+
+def _candidatos(
+    valores_mov: np.ndarray,
+    dias_mov: np.ndarray,
+    posicoes_mov: np.ndarray,
+    valores_f: np.ndarray,
+    dias_f: np.ndarray,
+    posicoes_f: np.ndarray,
+    criterios: CriteriosAproximacao
+) -> List[np.ndarray]:
+    """
+    Pares candidatos de uma filial, por busca binária na planilha formatada
+    ordenada por (valor, data).
+
+    O intervalo de cada movimentação é o dos valores dentro da tolerância,
+    limitado às 4 * limite_candidatos linhas mais próximas da posição de
+    (valor, data) da movimentação; assim muitos valores iguais não fazem a
+    quantidade de pares crescer com o quadrado das linhas.
+
+    Returns:
+        Lista de blocos [movimentação, linha formatada, diferença de valor, diferença de dias]
+    """
+    dia_base = np.nanmin(np.concatenate([dias_mov[posicoes_mov], dias_f[posicoes_f], [0.0]])) - 1
+    chaves_f = _chave(valores_f[posicoes_f], dias_f[posicoes_f], dia_base)
+    ordem = np.argsort(chaves_f, kind='stable')
+    chaves_ordenadas = chaves_f[ordem]
+
+    valores = valores_mov[posicoes_mov]
+    inicio = np.searchsorted(chaves_ordenadas, (valores - criterios.tolerancia_centavos) * FATOR_CHAVE, 'left')
+    fim = np.searchsorted(chaves_ordenadas, (valores + criterios.tolerancia_centavos + 1) * FATOR_CHAVE, 'left')
+    posicao = np.searchsorted(chaves_ordenadas, _chave(valores, dias_mov[posicoes_mov], dia_base), 'left')
+    expansao = 4 * criterios.limite_candidatos
+    inicio = np.maximum(inicio, posicao - expansao)
+    fim = np.maximum(np.minimum(fim, posicao + expansao), inicio)
+    quantidades = fim - inicio
+    acumulado = np.cumsum(quantidades)
+
+    blocos = []
+    primeiro = 0
+    while primeiro < len(posicoes_mov):
+        base = acumulado[primeiro - 1] if primeiro else 0
+        ultimo = max(int(np.searchsorted(acumulado, base + PARES_POR_BLOCO, 'right')), primeiro + 1)
+        quantidade = quantidades[primeiro:ultimo]
+        total = int(quantidade.sum())
+        if total:
+            # Expande cada intervalo [inicio, fim) sem laço por movimentação
+            deslocamento = np.arange(total) - np.repeat(np.cumsum(quantidade) - quantidade, quantidade)
+            mov = np.repeat(posicoes_mov[primeiro:ultimo], quantidade)
+            formatada = posicoes_f[ordem[np.repeat(inicio[primeiro:ultimo], quantidade) + deslocamento]]
+            diferenca = valores_mov[mov] - valores_f[formatada]
+            dias = dias_mov[mov] - dias_f[formatada]
+            if criterios.janela_dias is not None:
+                dentro = np.abs(dias) <= criterios.janela_dias  # NaN (sem data) fica de fora
+                mov, formatada, diferenca, dias = mov[dentro], formatada[dentro], diferenca[dentro], dias[dentro]
+            # Só os mais próximos de cada movimentação seguem para a atribuição
+            ordem_custo = np.lexsort((formatada, np.nan_to_num(np.abs(dias), nan=np.inf), np.abs(diferenca), mov))
+            mov, formatada, diferenca, dias = mov[ordem_custo], formatada[ordem_custo], diferenca[ordem_custo], dias[ordem_custo]
+            posicao_no_grupo = np.arange(len(mov)) - np.searchsorted(mov, mov, 'left')
+            manter = posicao_no_grupo < criterios.limite_candidatos
+            blocos.append(np.stack([mov[manter], formatada[manter], diferenca[manter], dias[manter]]))
+        primeiro = ultimo
+    return blocos
+
+def _atribuir(mov: np.ndarray, formatada: np.ndarray) -> np.ndarray:
+    """
+    Posições dos pares aceitos pela atribuição gulosa, com os pares já em
+    ordem de custo.
+
+    Uma única passada pelos pares marca a movimentação e a linha formatada de
+    cada par aceito; um par é aceito quando nenhuma das duas já foi tomada.
+    """
+    tomada_mov = np.zeros(int(mov.max()) + 1 if len(mov) else 0, dtype=bool).tolist()
+    tomada_f = np.zeros(int(formatada.max()) + 1 if len(formatada) else 0, dtype=bool).tolist()
+    aceitos = []
+    for posicao, (m, f) in enumerate(zip(mov.tolist(), formatada.tolist())):
+        if not tomada_mov[m] and not tomada_f[f]:
+            tomada_mov[m] = tomada_f[f] = True
+            aceitos.append(posicao)
+    return np.array(aceitos, dtype='int64')
+
+def parear_aproximados(
+    movimentacoes: pd.DataFrame,
+    formatada: pd.DataFrame,
+    criterios: CriteriosAproximacao
+) -> pd.DataFrame:
+    """
+    Pares um para um entre movimentações e linhas da planilha formatada que
+    ficaram sem correspondência exata.
+
+    Em cada filial a planilha formatada é ordenada por (valor, data) e cada
+    movimentação encontra por busca binária o intervalo de valores dentro da
+    tolerância; só esses candidatos são comparados, nunca todos contra todos.
+    Os candidatos fora da janela de datas são descartados e os demais são
+    aceitos do mais próximo para o mais distante (diferença de valor, depois de
+    datas, depois a ordem das planilhas), cada linha em no máximo um par.
+
+    Args:
+        movimentacoes: Colunas 'Valor (R$)' (centavos), 'Filial' e 'Data Movimentação' (datetime)
+        formatada: Colunas 'Valor' (centavos), 'Filial' e 'Data' (datetime)
+        criterios: Tolerância de valor, janela de datas e limite de candidatos
+
+    Returns:
+        DataFrame com COLUNAS_PARES: rótulo da linha de cada lado, diferença de
+        valor (movimentação menos caixa, em centavos) e de datas em dias (NaN
+        quando falta alguma data), na ordem das movimentações
+    """
+    valores_mov = movimentacoes['Valor (R$)'].to_numpy(dtype='int64')
+    valores_f = formatada['Valor'].to_numpy(dtype='int64')
+    dias_mov = em_dias(movimentacoes['Data Movimentação'])
+    dias_f = em_dias(formatada['Data'])
+    filiais_mov = movimentacoes['Filial'].astype(object).to_numpy()
+    filiais_f = formatada['Filial'].astype(object).to_numpy()
+
+    blocos = []
+    posicoes_por_filial = pd.Series(np.arange(len(filiais_f))).groupby(filiais_f, sort=False).indices
+    for filial, posicoes_mov in pd.Series(np.arange(len(filiais_mov))).groupby(filiais_mov, sort=False).indices.items():
+        posicoes_f = posicoes_por_filial.get(filial)
+        if posicoes_f is not None:
+            blocos += _candidatos(valores_mov, dias_mov, posicoes_mov, valores_f, dias_f, posicoes_f, criterios)
+
+    if not blocos:
+        return pd.DataFrame(columns=COLUNAS_PARES)
+    mov, linha_formatada, diferenca, dias = np.concatenate(blocos, axis=1)
+    mov, linha_formatada = mov.astype('int64'), linha_formatada.astype('int64')
+
+    # Atribuição gulosa do par mais próximo para o mais distante
+    ordem = np.lexsort((linha_formatada, mov, np.nan_to_num(np.abs(dias), nan=np.inf), np.abs(diferenca)))
+    aceitos = _atribuir(mov[ordem], linha_formatada[ordem])
+    aceitos = ordem[aceitos]
+
+    aceitos = np.sort(np.array(aceitos, dtype='int64'))
+    aceitos = aceitos[np.argsort(mov[aceitos], kind='stable')]
+    return pd.DataFrame({
+        'linha_mov': movimentacoes.index[mov[aceitos]],
+        'linha_formatada': formatada.index[linha_formatada[aceitos]],
+        'Diferença (centavos)': diferenca[aceitos].astype('int64'),
+        'Diferença (dias)': dias[aceitos],
+    }, columns=COLUNAS_PARES)
+
+def montar_relatorio_aproximados(
+    movimentacoes: pd.DataFrame,
+    formatada: pd.DataFrame,
+    pares: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Relatório dos pares aceitos, com o quanto cada um se afastou do cruzamento exato.
+
+    Args:
+        movimentacoes: Movimentações usadas em parear_aproximados
+        formatada: Linhas da planilha formatada usadas em parear_aproximados
+        pares: Resultado de parear_aproximados
+
+    Returns:
+        DataFrame com COLUNAS_RELATORIO_APROXIMADOS (valores em centavos)
+    """
+    mov = movimentacoes.loc[pares['linha_mov']].reset_index(drop=True)
+    caixa = formatada.loc[pares['linha_formatada']].reset_index(drop=True)
+    return pd.DataFrame({
+        'Código': mov['Código'],
+        'Movimentação': caixa['Movimentação'],
+        'Filial': mov['Filial'].astype(object),
+        'Valor Movimentação': mov['Valor (R$)'].astype('int64'),
+        'Valor Caixa': caixa['Valor'].astype('int64'),
+        'Diferença': pares['Diferença (centavos)'].to_numpy(dtype='int64'),
+        'Data Movimentação': mov['Data Movimentação'],
+        'Data Caixa': caixa['Data'],
+        'Diferença (dias)': pares['Diferença (dias)'].to_numpy(),
+        'Forma de Pagamento': caixa['Forma de Pagamento'].fillna(''),
+        'Cliente/Fornecedor': mov['Cliente/Fornecedor'],
+    }, columns=COLUNAS_RELATORIO_APROXIMADOS)
@@ -0,0 +1,298 @@
+"""
+Execução das etapas pela linha de comando, sem interface gráfica.
+
+Usado nas execuções agendadas em servidor: não importa PyQt5 nem qtawesome,
+devolve um código de saída e grava um resumo da execução em JSON.
+
+    python cli.py transformar caixa.xls -o saida
+    python cli.py cruzar "Planilha Formatada.xlsx" movimentacoes.xlsx -o saida
+    python cli.py completo caixa.xls movimentacoes.xlsx -o saida --trabalhadores 4
+    python cli.py completo caixa.xls movimentacoes.xlsx -o saida --livro conciliacao.sqlite
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from approximate_match import LIMITE_CANDIDATOS_PADRAO, CriteriosAproximacao
+from grouped_match import MAXIMO_MEMBROS_PADRAO, TEMPO_LIMITE_PADRAO, CriteriosAgrupamento
+from compare_movements import ErroEscritaContas, cruzar_planilhas_movimentacao
+from excel_writer import ESCRITORES, obter_escritor
+from html_reader import MOTORES_TRANSFORMACAO, transformar_planilha
+from ledger import LivroConciliacao
+from log_config import ContadoresExecucao, configurar_log, obter_logger, verboso_pelo_ambiente
+from parse_cache import LIMITE_PADRAO_MB, CacheLeituras, obter_cache_padrao, pasta_cache_padrao
+from pipeline import transformar_para_cruzamento
+from progress import OperacaoCancelada, Progresso
+from utils import caminho_temporario
+
+logger = obter_logger('cli')
+
+ARQUIVO_FORMATADA = 'Planilha Formatada.xlsx'
+ARQUIVO_RESUMO = 'Resumo da Execução.json'
+
+# Códigos de saída
+SAIDA_SUCESSO = 0
+SAIDA_ERRO = 1
+SAIDA_ARGUMENTOS = 2  # Usado pelo argparse
+SAIDA_CONTAS_COM_FALHA = 3
+SAIDA_CANCELADA = 130
+
+def _criar_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='caixasync',
+        description='Processamento das planilhas do CaixaSync sem interface gráfica.'
+    )
+    comum = argparse.ArgumentParser(add_help=False)
+    comum.add_argument('-o', '--saida', required=True, help='Pasta de saída')
+    comum.add_argument('--escritor', choices=tuple(ESCRITORES), default='streaming',
+                       help='Escritor das planilhas (padrão: streaming)')
+    comum.add_argument('--compressao', type=int, default=None, help='Nível de compressão do .xlsx (0 a 9)')
+    comum.add_argument('--resumo', help=f'Arquivo JSON do resumo (padrão: "{ARQUIVO_RESUMO}" na pasta de saída)')
+    comum.add_argument('-v', '--verbose', action='store_true', help='Log detalhado')
+    comum.add_argument('--log', help='Grava o log neste arquivo em vez do stderr')
+    comum.add_argument('--sem-cache', action='store_true', help='Não usa o cache de arquivos já lidos')
+    comum.add_argument('--cache-pasta', help='Pasta do cache (padrão: pasta de cache do usuário)')
+    comum.add_argument('--cache-limite-mb', type=int, help='Tamanho máximo do cache em MB (padrão: 512)')
+
+    transformacao = argparse.ArgumentParser(add_help=False)
+    transformacao.add_argument('--motor', choices=MOTORES_TRANSFORMACAO, default='vetorizado',
+                               help='Motor da transformação (padrão: vetorizado)')
+
+    cruzamento = argparse.ArgumentParser(add_help=False)
+    cruzamento.add_argument('--trabalhadores', type=int, default=1,
+                            help='Planilhas de conta salvas simultaneamente (padrão: 1)')
+    cruzamento.add_argument('--processos', action='store_true', help='Usa processos em vez de threads na gravação')
+    cruzamento.add_argument('--lote', type=int, default=None,
+                            help='Lê e cruza as movimentações em blocos de N linhas, com memória limitada '
+                                 '(sem cache, trabalhadores nem processos)')
+    cruzamento.add_argument('--tolerancia-centavos', type=int, default=None,
+                            help='Cruza por aproximação o que sobrar do cruzamento exato, aceitando '
+                                 'esta diferença de valor em centavos')
+    cruzamento.add_argument('--janela-dias', type=int, default=None,
+                            help='No cruzamento aproximado, diferença máxima entre as datas do caixa e da movimentação')
+    cruzamento.add_argument('--limite-candidatos', type=int, default=LIMITE_CANDIDATOS_PADRAO,
+                            help=f'Candidatos considerados por movimentação no cruzamento aproximado '
+                                 f'(padrão: {LIMITE_CANDIDATOS_PADRAO})')
+    cruzamento.add_argument('--agrupar', action='store_true',
+                            help='Relaciona lançamentos que somam várias movimentações do caixa da mesma filial e conta')
+    cruzamento.add_argument('--agrupar-janela-dias', type=int, default=None,
+                            help='No cruzamento agrupado, diferença máxima entre as datas')
+    cruzamento.add_argument('--agrupar-maximo', type=int, default=MAXIMO_MEMBROS_PADRAO,
+                            help=f'Movimentações do caixa por grupo, no máximo (padrão: {MAXIMO_MEMBROS_PADRAO})')
+    cruzamento.add_argument('--agrupar-tempo-limite', type=float, default=TEMPO_LIMITE_PADRAO,
+                            help=f'Segundos de busca por filial e conta (padrão: {TEMPO_LIMITE_PADRAO:g})')
+    cruzamento.add_argument('--livro', metavar='ARQUIVO', default=None,
+                            help='Conciliação diária incremental: guarda o que já foi processado neste arquivo '
+                                 'SQLite e grava só o que é novo ou mudou (sem lote, aproximação nem agrupamento)')
+    cruzamento.add_argument('--reiniciar-livro', action='store_true',
+                            help='Esvazia o livro antes do cruzamento, que volta a processar tudo')
+
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    cmd = comandos.add_parser('transformar', parents=[comum, transformacao],
+                              help='Etapa 1: transforma o relatório HTML do caixa')
+    cmd.add_argument('entrada', help='Relatório do caixa (HTML, .xls, .xlsx ou .csv)')
+
+    cmd = comandos.add_parser('cruzar', parents=[comum, cruzamento],
+                              help='Etapa 2: cruza a planilha formatada com as movimentações')
+    cmd.add_argument('formatada', help='Planilha formatada da etapa 1')
+    cmd.add_argument('movimentacoes', help='Planilha de movimentações')
+
+    cmd = comandos.add_parser('completo', parents=[comum, transformacao, cruzamento],
+                              help='Etapas 1 e 2 em sequência')
+    cmd.add_argument('entrada', help='Relatório do caixa (HTML, .xls, .xlsx ou .csv)')
+    cmd.add_argument('movimentacoes', help='Planilha de movimentações')
+    cmd.add_argument('--sem-formatada', action='store_true',
+                     help=f'Não grava "{ARQUIVO_FORMATADA}" (a planilha passa direto para o cruzamento)')
+    return parser
+
+def _absolutos(arquivos: Dict[str, str]) -> Dict[str, str]:
+    return {conta: os.path.abspath(caminho) for conta, caminho in arquivos.items()}
+
+def _criar_cache(args) -> Optional[CacheLeituras]:
+    if args.sem_cache:
+        return None
+    if args.cache_pasta is None and args.cache_limite_mb is None:
+        return obter_cache_padrao()
+    if args.cache_limite_mb is not None and args.cache_limite_mb <= 0:
+        return None
+    limite_mb = args.cache_limite_mb if args.cache_limite_mb is not None else LIMITE_PADRAO_MB
+    return CacheLeituras(args.cache_pasta or pasta_cache_padrao(), limite_mb << 20)
+
+def _etapa_transformacao(args, escritor, progresso: Progresso, cache: Optional[CacheLeituras]) -> Dict[str, Any]:
+    caminho_saida = os.path.join(args.saida, ARQUIVO_FORMATADA)
+    contadores = transformar_planilha(
+        args.entrada, caminho_saida, motor=args.motor, escritor=escritor, progresso=progresso, cache=cache
+    )
+    return {
+        'entrada': os.path.abspath(args.entrada),
+        'saida': os.path.abspath(caminho_saida),
+        'motor': args.motor,
+        'contadores': dict(contadores),
+        'sucesso': not contadores['erros'],
+    }
+
+def _etapa_transformacao_em_memoria(
+    args, escritor, progresso: Progresso, cache: Optional[CacheLeituras]
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    caminho_saida = None if args.sem_formatada else os.path.join(args.saida, ARQUIVO_FORMATADA)
+    formatada, contadores = transformar_para_cruzamento(args.entrada, caminho_saida, args.motor, escritor, progresso, cache)
+    return formatada, {
+        'entrada': os.path.abspath(args.entrada),
+        'saida': os.path.abspath(caminho_saida) if caminho_saida else None,
+        'motor': args.motor,
+        'contadores': dict(contadores),
+        'sucesso': True,
+    }
+
+def _criar_aproximacao(args) -> Optional[CriteriosAproximacao]:
+    """Critérios do cruzamento aproximado, ligado por --tolerancia-centavos ou --janela-dias."""
+    if args.tolerancia_centavos is None and args.janela_dias is None:
+        return None
+    return CriteriosAproximacao(args.tolerancia_centavos or 0, args.janela_dias, args.limite_candidatos)
+
+def _criar_agrupamento(args) -> Optional[CriteriosAgrupamento]:
+    """Critérios do cruzamento agrupado, ligado por --agrupar."""
+    if not args.agrupar:
+        return None
+    return CriteriosAgrupamento(args.agrupar_janela_dias, args.agrupar_maximo, tempo_limite_segundos=args.agrupar_tempo_limite)
+
+def _etapa_cruzamento(
+    args, formatada: Union[str, pd.DataFrame], escritor, progresso: Progresso, cache: Optional[CacheLeituras]
+) -> Dict[str, Any]:
+    contadores = ContadoresExecucao()
+    aproximacao = _criar_aproximacao(args)
+    agrupamento = _criar_agrupamento(args)
+    resultado = {
+        'formatada': 'em memória' if isinstance(formatada, pd.DataFrame) else os.path.abspath(formatada),
+        'movimentacoes': os.path.abspath(args.movimentacoes),
+        'trabalhadores': args.trabalhadores,
+        'processos': args.processos,
+        'lote': args.lote,
+        'aproximacao': repr(aproximacao) if aproximacao else None,
+        'agrupamento': repr(agrupamento) if agrupamento else None,
+        'livro': os.path.abspath(args.livro) if args.livro else None,
+    }
+    livro = LivroConciliacao(args.livro) if args.livro else None
+    try:
+        if livro is not None and args.reiniciar_livro:
+            livro.reiniciar()
+        arquivos = cruzar_planilhas_movimentacao(
+            formatada, args.movimentacoes, args.saida,
+            trabalhadores=args.trabalhadores, usar_processos=args.processos,
+            escritor=escritor, progresso=progresso, contadores=contadores, cache=cache,
+            tamanho_lote=args.lote, aproximacao=aproximacao, agrupamento=agrupamento, livro=livro
+        )
+        resultado.update(arquivos=_absolutos(arquivos), falhas={}, sucesso=True)
+    except ErroEscritaContas as e:
+        resultado.update(arquivos=_absolutos(e.arquivos), falhas=e.falhas, sucesso=False)
+    finally:
+        if livro is not None:
+            resultado['situacao_livro'] = livro.resumo()
+            livro.fechar()
+    resultado['contadores'] = dict(contadores)
+    return resultado
+
+def _gravar_resumo(resumo: Dict[str, Any], caminho: str) -> None:
+    """Grava o resumo via arquivo temporário, para nunca deixar um JSON pela metade."""
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    caminho_temp = caminho_temporario(caminho)
+    with open(caminho_temp, 'w', encoding='utf-8') as arquivo:
+        json.dump(resumo, arquivo, ensure_ascii=False, indent=2, default=str)
+    os.replace(caminho_temp, caminho)
+
+def executar(argv: Optional[List[str]] = None) -> int:
+    """
+    Executa o comando e grava o resumo da execução.
+
+    Args:
+        argv: Argumentos da linha de comando (None = sys.argv[1:])
+
+    Returns:
+        Código de saída: 0 sucesso, 1 erro, 2 argumentos inválidos,
+        3 alguma conta não foi salva, 130 cancelado (Ctrl+C)
+    """
+    parser = _criar_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, 'livro', None) and (args.lote or args.agrupar or _criar_aproximacao(args)):
+        parser.error('--livro não pode ser combinado com --lote, aproximação ou --agrupar')
+    if getattr(args, 'reiniciar_livro', False) and not args.livro:
+        parser.error('--reiniciar-livro exige --livro')
+    configurar_log(verboso=args.verbose or verboso_pelo_ambiente(), arquivo=args.log)
+
+    # Ctrl+C pede o cancelamento em vez de interromper no meio de uma gravação
+    progresso = Progresso()
+    signal.signal(signal.SIGINT, lambda *_: progresso.cancelar())
+
+    inicio = time.monotonic()
+    resumo: Dict[str, Any] = {
+        'comando': args.comando,
+        'inicio': datetime.now().isoformat(timespec='seconds'),
+        'pasta_saida': os.path.abspath(args.saida),
+        'etapas': {},
+    }
+    codigo = SAIDA_SUCESSO
+    cache = None
+    try:
+        cache = _criar_cache(args)
+        opcoes_escritor = {} if args.compressao is None else {'compressao': args.compressao}
+        escritor = obter_escritor(args.escritor, **opcoes_escritor)
+        os.makedirs(args.saida, exist_ok=True)
+
+        formatada = getattr(args, 'formatada', None)
+        if args.comando == 'transformar':
+            etapa = _etapa_transformacao(args, escritor, progresso, cache)
+            resumo['etapas']['transformacao'] = etapa
+            if not etapa['sucesso']:
+                codigo = SAIDA_ERRO
+        elif args.comando == 'completo':
+            # A planilha formatada passa em memória para o cruzamento, sem reler o .xlsx
+            formatada, etapa = _etapa_transformacao_em_memoria(args, escritor, progresso, cache)
+            resumo['etapas']['transformacao'] = etapa
+
+        if args.comando in ('cruzar', 'completo') and codigo == SAIDA_SUCESSO:
+            etapa = _etapa_cruzamento(args, formatada, escritor, progresso, cache)
+            resumo['etapas']['cruzamento'] = etapa
+            if not etapa['sucesso']:
+                codigo = SAIDA_CONTAS_COM_FALHA
+    except OperacaoCancelada:
+        logger.warning('Execução cancelada')
+        resumo['erro'] = 'Execução cancelada'
+        codigo = SAIDA_CANCELADA
+    except Exception as e:
+        logger.error('Erro na execução: %s', e)
+        resumo['erro'] = f'{type(e).__name__}: {e}'
+        codigo = SAIDA_ERRO
+
+    if cache is not None:
+        cache.estatisticas.registrar_resumo(logger, 'Cache de leituras')
+        resumo['cache'] = cache.resumo()
+    resumo['fim'] = datetime.now().isoformat(timespec='seconds')
+    resumo['duracao_segundos'] = round(time.monotonic() - inicio, 3)
+    resumo['sucesso'] = codigo == SAIDA_SUCESSO
+    resumo['codigo_saida'] = codigo
+    caminho_resumo = args.resumo or os.path.join(args.saida, ARQUIVO_RESUMO)
+    try:
+        _gravar_resumo(resumo, caminho_resumo)
+        logger.info('Resumo da execução salvo em: %s', caminho_resumo)
+    except OSError as e:
+        logger.error('Não foi possível gravar o resumo da execução: %s', e)
+        codigo = codigo or SAIDA_ERRO
+    return codigo
+
+def main() -> None:
+    sys.exit(executar())
+
+if __name__ == '__main__':
+    # Necessário para o pool de processos no executável do PyInstaller
+    multiprocessing.freeze_support()
+    main()
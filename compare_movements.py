@@ -1,12 +1,32 @@
 import re
+from collections import Counter
+import numpy as np
 import pandas as pd
 import os
-from typing import Dict, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple, Union
 from utils import (
-    normalizar_filial, sanitizar_nome_arquivo,
-    formatar_data, obter_conta_bancaria,
-    obter_centro_custo
+    sanitizar_nome_arquivo, caminho_temporario, parse_centavos, converter_datas,
+    centavos_para_reais, valores_para_centavos
 )
+from excel_writer import (
+    EscritorPlanilha, salvar_atomicamente, obter_escritor,
+    FORMATO_DATA, FORMATO_VALOR, FORMATO_TEXTO
+)
+from log_config import ContadoresExecucao, obter_logger
+from account_rules import RegrasContas, juntar_relatorios_sem_conta, obter_regras_contas
+from progress import OperacaoCancelada, Progresso, avancar, iniciar_fase
+from parse_cache import CacheLeituras, ler_com_cache
+from input_reader import ler_colunas, ler_colunas_em_lotes
+from approximate_match import CriteriosAproximacao, montar_relatorio_aproximados, parear_aproximados
+from grouped_match import CriteriosAgrupamento, agrupar_liquidacoes, montar_relatorio_agrupados
+from ledger import LivroConciliacao
+from unmatched_report import (
+    COLUNAS_NAO_RELACIONADOS, DiagnosticoChaves, contar_motivos, em_reais, linhas_caixa, linhas_movimentacoes,
+    montar_relatorio_nao_relacionados, resumir_motivos
+)
+
+logger = obter_logger('compare_movements')
 
 def normalizar_filial_formatada(filial):
     if pd.isnull(filial):
@@ -24,163 +44,1081 @@ def normalizar_filial_movimentacoes(filial):
         return f'Loja {int(match.group(1))}'
     return ''
 
-def sanitizar_nome_arquivo(nome):
-    caracteres_invalidos = r'[\/:*?"<>|]'
-    return re.sub(caracteres_invalidos, '_', nome)
+def _avisar_valores_invalidos(falhas, valores_originais, arquivo):
+    if falhas.any():
+        exemplos = ', '.join(repr(v) for v in valores_originais[falhas].head(5))
+        logger.warning('%d valor(es) não reconhecido(s) em %s foram considerados 0 (%s)', int(falhas.sum()), arquivo, exemplos)
+    return int(falhas.sum())
 
-def formatar_data(data):
-    if pd.isnull(data) or data == '':
-        return ''
-    return pd.to_datetime(data, dayfirst=True).strftime('%d/%m/%Y')
-
-def conta_bancaria(fp, filial):
-    if filial == "Loja 1":
-        if fp == "Dinheiro":
-            return "CAIXA 01"
-        elif fp == "Transferência Pix":
-            return "SICOOB"
-        elif fp in ["Cartão de Débito VISA/ MASTER", "Cartão de Crédito VISA / MASTER"]:
-            return "MAQUINETA ÚNICA PETROLINA"
-        elif fp == "Cartão de Débito ELO":
-            return "MAQUINETA ÚNICA PETROLINA"
-        elif fp == "Cartão de Crédito ELO":
-            return "MAQUINETA ÚNICA PETROLINA"
-        elif fp == "CHEQUE RECEBIDO":
-            return "Cheque"
+def _centavos_escritos(df_conta: pd.DataFrame) -> int:
+    """Total em centavos da coluna Valor (reais) entregue ao escritor."""
+    return int(valores_para_centavos(df_conta['Valor']).sum())
+
+def _verificar_total_conta(conta: str, esperado: int, escrito: int) -> None:
+    """Garante que o total entregue ao escritor é o total das movimentações atribuídas à conta."""
+    if esperado != escrito:
+        raise ValueError(
+            f'Total divergente na conta "{conta}": movimentações {esperado} centavos, planilha {escrito} centavos'
+        )
+    logger.debug('Total conferido para conta "%s": R$ %.2f', conta, escrito / 100)
+
+def _verificar_total_geral(
+    entrada: Tuple[int, int],
+    contas: Tuple[int, int],
+    sem_conta: Tuple[int, int],
+    nao_relacionadas: Tuple[int, int]
+) -> None:
+    """
+    Garante que nenhuma movimentação foi perdida ou duplicada: as linhas e o
+    total lidos são a soma das planilhas das contas, do resumo sem conta e das
+    movimentações não relacionadas.
+    
+    Args:
+        entrada: (linhas, centavos) das movimentações lidas
+        contas: (linhas, centavos) entregues ao escritor, somadas as contas
+        sem_conta: (lançamentos, centavos) do resumo sem conta
+        nao_relacionadas: (linhas, centavos) das movimentações sem linha do caixa
         
-    elif filial == "Loja 2":
-        if fp == "Dinheiro":
-            return "CAIXA 02"
-        elif fp == "Transferência Pix":
-            return "BRADESCO C/C"
-        elif fp == "PIx Instantâneo Bradesco LJ02":
-            return "BRADESCO C/C"
-        elif fp in ["Cartão de Débito VISA/ MASTER", "Cartão de Crédito VISA / MASTER"]:
-            return "MAQUINETA ÚNICA SÃO FRANCISCO"
-        elif fp == "Cartão de Débito ELO":
-            return "MAQUINETA ÚNICA SÃO FRANCISCO"
-        elif fp == "Cartão de Crédito ELO":
-            return "MAQUINETA ÚNICA SÃO FRANCISCO"
-        elif fp == "CHEQUE RECEBIDO":
-            return "Cheque"
-    return ""
-
-def cruzar_planilhas_movimentacao(arquivo_formatado: str, arquivo_movimentacoes: str, pasta_saida: str) -> None:
+    Raises:
+        ValueError: Se as linhas ou os totais divergirem
     """
-    Cruza as planilhas de movimentação e gera os arquivos de saída.
+    saida = tuple(map(sum, zip(contas, sem_conta, nao_relacionadas)))
+    if tuple(entrada) != saida:
+        raise ValueError(
+            f'Total divergente: movimentações {entrada[0]} linha(s) e {entrada[1]} centavos, saída {saida[0]} '
+            f'linha(s) e {saida[1]} centavos (contas {contas}, sem conta {sem_conta}, não relacionadas {nao_relacionadas})'
+        )
+    logger.debug('Total geral conferido: %d movimentações, R$ %.2f', entrada[0], entrada[1] / 100)
+
+def _linhas_e_centavos(centavos: pd.Series) -> Tuple[int, int]:
+    return len(centavos), int(centavos.sum())
+
+# Resumo das combinações filial/forma de pagamento sem regra de conta
+ARQUIVO_SEM_CONTA = 'Sem Conta Bancária.xlsx'
+
+# Pares aceitos pelo cruzamento aproximado, com a diferença de cada um
+ARQUIVO_APROXIMADOS = 'Relacionados por Aproximação.xlsx'
+
+# Lançamentos que liquidam várias movimentações do caixa, com os números delas
+ARQUIVO_AGRUPADOS = 'Relacionados por Agrupamento.xlsx'
+
+COLUNAS_SAIDA_CONTA = [
+    'Data de Competência', 'Data de Vencimento', 'Data de Pagamento',
+    'Valor', 'Categoria', 'Descrição', 'Cliente/Fornecedor',
+    'CNPJ/CPF Cliente/Fornecedor', 'Centro de Custo', 'Observações'
+]
+
+FORMATOS_SAIDA_CONTA = {
+    'Data de Competência': FORMATO_DATA,
+    'Data de Vencimento': FORMATO_DATA,
+    'Data de Pagamento': FORMATO_DATA,
+    'Valor': FORMATO_VALOR,
+    **{coluna: FORMATO_TEXTO for coluna in COLUNAS_SAIDA_CONTA[4:]}
+}
+
+def montar_colunas_saida(df_mov: pd.DataFrame) -> pd.DataFrame:
+    """
+    Monta as colunas das planilhas por conta bancária para todas as linhas de uma vez.
     
     Args:
-        arquivo_formatado: Caminho do arquivo formatado da etapa anterior
-        arquivo_movimentacoes: Caminho do arquivo de movimentações
-        pasta_saida: Pasta onde serão salvos os arquivos resultantes
+        df_mov: Movimentações (valores em centavos) já com conta bancária definida
+        
+    Returns:
+        DataFrame com COLUNAS_SAIDA_CONTA, no mesmo índice de df_mov
+    """
+    # Datas tipadas: o Excel recebe datas de verdade, exibidas no formato dd/mm/yyyy
+    datas = df_mov['Data Movimentação']
+    if not pd.api.types.is_datetime64_any_dtype(datas):
+        datas, _ = converter_datas(datas)
+    centro_custo = pd.Series('Loja 02 - São Francisco', index=df_mov.index).where(
+        df_mov['Filial'] != 'Loja 1', 'Loja 01 - Petrolina'
+    )
+    return pd.DataFrame({
+        'Data de Competência': datas,
+        'Data de Vencimento': datas,
+        'Data de Pagamento': '',  # Mantém vazio
+        'Valor': centavos_para_reais(df_mov['Valor (R$)']),  # Garante exatamente 2 casas decimais
+        'Categoria': 'Receitas de Vendas',
+        'Descrição': 'Recebimento Mov. Nº ' + df_mov['Código'].fillna('').astype(str),
+        'Cliente/Fornecedor': df_mov['Cliente/Fornecedor'],
+        'CNPJ/CPF Cliente/Fornecedor': '',
+        'Centro de Custo': centro_custo,
+        'Observações': '',  # Mantém vazio
+    }, index=df_mov.index, columns=COLUNAS_SAIDA_CONTA)
+
+def preparar_planilha_formatada(
+    formatada: Union[str, pd.DataFrame],
+    contadores: Optional[ContadoresExecucao] = None
+) -> pd.DataFrame:
+    """
+    Planilha formatada pronta para o cruzamento: Movimentação sem espaços,
+    Valor em centavos e Filial normalizada.
+    
+    Args:
+        formatada: Caminho do arquivo da etapa 1 ou a tabela devolvida por
+            html_reader.gerar_planilha_formatada (Valor já em centavos), que
+            dispensa a leitura do .xlsx
+        contadores: Recebe os valores inválidos encontrados (opcional)
+        
+    Returns:
+        Nova tabela; a recebida não é alterada
     """
-    df_formatada = pd.read_excel(arquivo_formatado, dtype=str)
-    df_mov = pd.read_excel(arquivo_movimentacoes, dtype=str)
+    if isinstance(formatada, pd.DataFrame):
+        df_formatada, origem = formatada.copy(), 'planilha formatada em memória'
+    else:
+        df_formatada, origem = pd.read_excel(formatada, dtype=str), formatada
 
     df_formatada['Movimentação'] = df_formatada['Movimentação'].str.strip()
-    df_formatada['Valor'] = pd.to_numeric(df_formatada['Valor'].replace(',', '.', regex=True)).round(2)
+    # Valores circulam em centavos inteiros até a escrita das planilhas
+    if not pd.api.types.is_integer_dtype(df_formatada['Valor']):
+        valores, falhas = parse_centavos(df_formatada['Valor'])
+        invalidos = _avisar_valores_invalidos(falhas, df_formatada['Valor'], origem)
+        if contadores is not None:
+            contadores['valores_invalidos'] += invalidos
+        df_formatada['Valor'] = valores
     df_formatada['Filial'] = df_formatada['Filial'].apply(normalizar_filial_formatada)
+    return df_formatada
+
+# Versão da leitura de movimentações guardada no cache; mudar a normalização exige incrementar
+VERSAO_LEITURA_MOVIMENTACOES = '3'
 
+# Únicas colunas da planilha de movimentações usadas no cruzamento
+COLUNAS_MOVIMENTACOES = ['Código', 'Valor (R$)', 'Filial', 'Data Movimentação', 'Cliente/Fornecedor']
+# Lidas como texto, como no pd.read_excel com dtype=str (ver input_reader.ler_colunas_em_lotes)
+COLUNAS_TEXTO_MOVIMENTACOES = ['Código', 'Cliente/Fornecedor']
+
+def _normalizar_movimentacoes(df_mov: pd.DataFrame, arquivo_movimentacoes: str, contadores: Dict[str, int]) -> pd.DataFrame:
+    """Normaliza as colunas lidas (ver ler_movimentacoes), somando os inválidos em contadores."""
     df_mov['Código'] = df_mov['Código'].astype(str).str.strip()
-    df_mov['Valor (R$)'] = pd.to_numeric(df_mov['Valor (R$)'].replace(',', '.', regex=True)).round(2)
-    df_mov['Filial'] = df_mov['Filial'].apply(normalizar_filial_movimentacoes)
+    valores, falhas = parse_centavos(df_mov['Valor (R$)'])
+    contadores['valores_invalidos'] = contadores.get('valores_invalidos', 0) + _avisar_valores_invalidos(
+        falhas, df_mov['Valor (R$)'], arquivo_movimentacoes
+    )
+    df_mov['Valor (R$)'] = valores
+    df_mov['Filial'] = df_mov['Filial'].apply(normalizar_filial_movimentacoes).astype('category')
+    datas, falhas = converter_datas(df_mov['Data Movimentação'])
+    if falhas.any():
+        contadores['datas_invalidas'] = contadores.get('datas_invalidas', 0) + int(falhas.sum())
+        exemplos = ', '.join(repr(v) for v in df_mov.loc[falhas, 'Data Movimentação'].unique()[:5])
+        logger.warning('%d data(s) não reconhecida(s) em %s ficaram vazias (%s)', int(falhas.sum()), arquivo_movimentacoes, exemplos)
+    df_mov['Data Movimentação'] = datas
+    return df_mov
+
+def ler_movimentacoes(
+    arquivo_movimentacoes: str,
+    progresso: Optional[Progresso] = None
+) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """
+    Lê e normaliza a planilha de movimentações.
+    
+    Só as COLUNAS_MOVIMENTACOES são lidas, e o cabeçalho é conferido antes das
+    linhas (ver input_reader.ler_colunas). Código sem espaços, Valor (R$) em
+    centavos, Filial normalizada e categórica (poucas lojas para muitas linhas)
+    e Data Movimentação convertida uma única vez para o arquivo inteiro.
+    
+    Args:
+        arquivo_movimentacoes: Caminho do arquivo de movimentações
+        progresso: Acompanhamento da leitura (opcional)
+        
+    Returns:
+        Tupla (movimentações, contadores da leitura: valores e datas inválidos)
+        
+    Raises:
+        ValueError: Se faltar alguma das COLUNAS_MOVIMENTACOES no cabeçalho
+    """
+    contadores = {'valores_invalidos': 0}
+    df_mov = ler_colunas(arquivo_movimentacoes, COLUNAS_MOVIMENTACOES, progresso, COLUNAS_TEXTO_MOVIMENTACOES)
+    return _normalizar_movimentacoes(df_mov, arquivo_movimentacoes, contadores), contadores
+
+CHAVE_FORMATADA = ['Movimentação', 'Valor', 'Filial']
+CHAVE_MOVIMENTACOES = ['Código', 'Valor (R$)', 'Filial']
+SUFIXO_FORMATADA = ' (formatada)'
 
-    forma_pagamento_map = {
-        (str(linha['Movimentação']), linha['Valor'], linha['Filial']): linha['Forma de Pagamento']
-        for _, linha in df_formatada.iterrows()
+def relacionar_movimentacoes(df_formatada: pd.DataFrame, df_mov: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Relaciona as duas planilhas com um único merge pela chave (movimentação, valor, filial).
+    
+    Chaves duplicadas na planilha formatada: prevalece a última linha de cada
+    chave, tanto para a forma de pagamento quanto para o relatório de não
+    relacionados (as demais são descartadas e contadas em um aviso). Chaves
+    repetidas na planilha de movimentações recebem todas a mesma forma de pagamento.
+    
+    Args:
+        df_formatada: Planilha formatada com valores em centavos
+        df_mov: Planilha de movimentações com valores em centavos
+        
+    Returns:
+        Tupla (movimentações com 'Forma de Pagamento', linhas da planilha formatada
+        sem movimentação correspondente), ambas na ordem original
+    """
+    movimentos, nao_relacionados, _ = _relacionar(df_formatada, df_mov)
+    return movimentos, nao_relacionados
+
+def _relacionar(df_formatada: pd.DataFrame, df_mov: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, np.ndarray]:
+    """relacionar_movimentacoes, com a máscara das movimentações que tiveram correspondente."""
+    duplicadas = df_formatada.duplicated(subset=CHAVE_FORMATADA, keep='last')
+    if duplicadas.any():
+        logger.warning('%d linha(s) da planilha formatada com chave repetida; prevalece a última ocorrência', int(duplicadas.sum()))
+
+    unido = df_mov.assign(_linha_mov=range(len(df_mov))).merge(
+        df_formatada[~duplicadas].assign(_linha_formatada=range(int((~duplicadas).sum()))),
+        left_on=CHAVE_MOVIMENTACOES, right_on=CHAVE_FORMATADA,
+        how='outer', suffixes=('', SUFIXO_FORMATADA),
+        indicator='_origem', validate='many_to_one'
+    )
+
+    movimentos = unido[unido['_origem'] != 'right_only'].sort_values('_linha_mov', kind='stable')
+    relacionadas = (movimentos['_origem'] == 'both').to_numpy()
+    movimentos = movimentos[list(df_mov.columns)].assign(
+        **{'Forma de Pagamento': movimentos['Forma de Pagamento'].fillna('')}
+    )
+    movimentos['Valor (R$)'] = movimentos['Valor (R$)'].astype('int64')
+
+    colunas_formatada = {
+        coluna + SUFIXO_FORMATADA if coluna + SUFIXO_FORMATADA in unido.columns else coluna: coluna
+        for coluna in df_formatada.columns
     }
+    nao_relacionados = unido[unido['_origem'] == 'right_only'].sort_values('_linha_formatada', kind='stable')
+    nao_relacionados = nao_relacionados[list(colunas_formatada)].rename(columns=colunas_formatada)
+    nao_relacionados['Valor'] = nao_relacionados['Valor'].astype('int64')
 
-    chaves_formatada = set(forma_pagamento_map.keys())
-    chaves_mov = set((str(linha['Código']), linha['Valor (R$)'], linha['Filial']) for _, linha in df_mov.iterrows())
-    chaves_nao_relacionadas = chaves_formatada - chaves_mov
-
-    nao_relacionados = df_formatada[
-        df_formatada.apply(lambda linha: (linha['Movimentação'], linha['Valor'], linha['Filial']) in chaves_nao_relacionadas, axis=1)
-    ]
-
-    if not nao_relacionados.empty:
-        caminho_arquivo_nao_relacionados = os.path.join(pasta_saida, 'Não Relacionados.xlsx')
-        nao_relacionados.to_excel(caminho_arquivo_nao_relacionados, index=False)
-        print(f'Planilha de lançamentos não relacionados salva em: {caminho_arquivo_nao_relacionados}')
-
-    formas = []
-    for _, linha in df_mov.iterrows():
-        chave = (str(linha['Código']), linha['Valor (R$)'], linha['Filial'])
-        forma = forma_pagamento_map.get(chave, '')
-        formas.append(forma)
-    df_mov['Forma de Pagamento'] = formas
-
-    df_mov['Conta Bancária'] = [
-        conta_bancaria(fp, filial)
-        for fp, filial in zip(df_mov['Forma de Pagamento'], df_mov['Filial'])
-    ]
-
-    contas = [conta for conta in df_mov['Conta Bancária'].dropna().unique() if str(conta).strip() != ""]
-
-    if not contas:
-        print("Nenhum dado compatível encontrado. Nenhuma planilha foi gerada.")
-        return
-
-    for conta in contas:
-        df_conta = df_mov[df_mov['Conta Bancária'] == conta].copy()
-
-        # Reordenar e formatar as colunas
-        df_conta['Data de Competência'] = df_conta['Data Movimentação'].apply(formatar_data)
-        df_conta['Data de Vencimento'] = df_conta['Data Movimentação'].apply(formatar_data)
-        df_conta['Data de Pagamento'] = ''  # Mantém vazio
-        df_conta['Valor'] = pd.to_numeric(df_conta['Valor (R$)']).round(2)  # Garante exatamente 2 casas decimais
-        df_conta['Categoria'] = 'Receitas de Vendas'
-        df_conta['Descrição'] = df_conta['Código'].apply(lambda x: f"Recebimento Mov. Nº {x}")
-        df_conta['Centro de Custo'] = df_conta['Filial'].apply(lambda f: "Loja 01 - Petrolina" if f == "Loja 1" else "Loja 02 - São Francisco")
-        df_conta['Observações'] = ''  # Mantém vazio
-        df_conta['CNPJ/CPF Cliente/Fornecedor'] = ''
-
-        # Seleciona e reordena as colunas
-        df_conta = df_conta[[
-            'Data de Competência', 'Data de Vencimento', 'Data de Pagamento',
-            'Valor', 'Categoria', 'Descrição', 'Cliente/Fornecedor',
-            'CNPJ/CPF Cliente/Fornecedor', 'Centro de Custo', 'Observações'
-        ]]
+    logger.info('Movimentações relacionadas: %d de %d', int((unido['_origem'] == 'both').sum()), len(df_mov))
+    return movimentos.reset_index(drop=True), nao_relacionados.reset_index(drop=True), relacionadas
 
-        nome_arquivo = f"{sanitizar_nome_arquivo(conta)}.xlsx"
-        caminho_arquivo = os.path.join(pasta_saida, nome_arquivo)
+class IndiceFormatada:
+    """
+    Planilha formatada indexada pela chave (movimentação, valor, filial), para
+    relacionar as movimentações bloco a bloco no cruzamento em lotes.
+    
+    O índice é montado uma única vez e cada bloco é resolvido por uma busca
+    vetorizada na tabela hash, sem refazer o merge. Chaves duplicadas seguem
+    relacionar_movimentacoes: prevalece a última linha de cada chave.
+    
+    Args:
+        df_formatada: Planilha formatada com valores em centavos
+    """
+
+    def __init__(self, df_formatada: pd.DataFrame):
+        duplicadas = df_formatada.duplicated(subset=CHAVE_FORMATADA, keep='last')
+        if duplicadas.any():
+            logger.warning('%d linha(s) da planilha formatada com chave repetida; prevalece a última ocorrência', int(duplicadas.sum()))
+        self.linhas = df_formatada[~duplicadas].reset_index(drop=True)
+        self._indice = pd.MultiIndex.from_frame(self.linhas[CHAVE_FORMATADA])
+        self._formas = self.linhas['Forma de Pagamento'].astype(object).where(
+            self.linhas['Forma de Pagamento'].notna(), ''
+        ).to_numpy()
+        self._relacionadas = np.zeros(len(self.linhas), dtype=bool)
+        self.movimentacoes = 0
+        self.movimentacoes_relacionadas = 0
+
+    def relacionar(self, df_mov: pd.DataFrame) -> Tuple[pd.Series, np.ndarray]:
+        """
+        Forma de pagamento de cada movimentação do bloco ('' sem correspondente),
+        marcando as linhas da planilha formatada que foram usadas.
         
-        # Criar um ExcelWriter para formatar as células
-        with pd.ExcelWriter(caminho_arquivo, engine='openpyxl') as writer:
-            df_conta.to_excel(writer, index=False)
-            
-            # Obter a planilha ativa
-            worksheet = writer.sheets['Sheet1']
-            
-            # Formatar colunas de data (A, B, C)
-            for col in ['A', 'B', 'C']:
-                for row in range(2, len(df_conta) + 2):  # +2 porque o Excel começa em 1 e tem cabeçalho
-                    cell = f"{col}{row}"
-                    if worksheet[cell].value:  # Só formata se tiver valor
-                        worksheet[cell].number_format = 'dd/mm/yyyy'
-            
-            # Formatar coluna de valor (D) - Agora com formato brasileiro
-            for row in range(2, len(df_conta) + 2):
-                cell = f"D{row}"
-                worksheet[cell].number_format = '0.00'  # Formato mais simples para garantir 2 casas decimais
-            
-            # Formatar colunas de texto (E até J)
-            for col in ['E', 'F', 'G', 'H', 'I', 'J']:
-                for row in range(2, len(df_conta) + 2):
-                    cell = f"{col}{row}"
-                    worksheet[cell].number_format = '@'
+        Args:
+            df_mov: Bloco de movimentações normalizado (ver ler_movimentacoes)
             
-            # Ajustar largura das colunas
-            for col in worksheet.columns:
-                max_length = 0
-                column = col[0].column_letter
-                for cell in col:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = (max_length + 2)
-                worksheet.column_dimensions[column].width = adjusted_width
-
-        print(f'Arquivo separado salvo para conta "{conta}": {caminho_arquivo}')
\ No newline at end of file
+        Returns:
+            Tupla (série 'Forma de Pagamento' no índice do bloco, máscara das
+            movimentações que tiveram correspondente)
+        """
+        chaves = pd.MultiIndex.from_arrays([
+            df_mov['Código'], df_mov['Valor (R$)'], df_mov['Filial'].astype(object)
+        ])
+        posicoes = self._indice.get_indexer(chaves)
+        encontradas = posicoes >= 0
+        self._relacionadas[posicoes[encontradas]] = True
+        self.movimentacoes += len(df_mov)
+        self.movimentacoes_relacionadas += int(encontradas.sum())
+        formas = np.full(len(df_mov), '', dtype=object)
+        formas[encontradas] = self._formas[posicoes[encontradas]]
+        return pd.Series(formas, index=df_mov.index, name='Forma de Pagamento'), encontradas
+
+    def pendentes(self) -> pd.DataFrame:
+        """Linhas ainda sem movimentação, indexadas pela posição em self.linhas (ver marcar)."""
+        return self.linhas[~self._relacionadas]
+
+    def marcar(self, posicoes) -> None:
+        """Marca como relacionadas as linhas dessas posições (pares do cruzamento aproximado)."""
+        self._relacionadas[np.asarray(posicoes, dtype='int64')] = True
+
+    def nao_relacionadas(self) -> pd.DataFrame:
+        """Linhas da planilha formatada sem nenhuma movimentação, na ordem original."""
+        return self.linhas[~self._relacionadas].reset_index(drop=True)
+
+def salvar_planilha_conta(
+    df_conta: pd.DataFrame,
+    caminho_arquivo: str,
+    escritor: Optional[EscritorPlanilha] = None,
+    progresso: Optional[Progresso] = None
+) -> str:
+    """
+    Salva a planilha de uma conta bancária de forma atômica (arquivo temporário + rename).
+    
+    Função de módulo para poder ser executada em threads ou processos.
+    
+    Args:
+        df_conta: Linhas da conta com COLUNAS_SAIDA_CONTA
+        caminho_arquivo: Caminho final do arquivo .xlsx
+        escritor: Escritor de planilhas (None = escritor padrão)
+        progresso: Verificado antes de publicar o arquivo (cancelamento); opcional
+        
+    Returns:
+        Caminho do arquivo salvo
+    """
+    # Formatos aplicados por coluna durante a escrita (datas só quando preenchidas)
+    return salvar_atomicamente(
+        escritor, df_conta, caminho_arquivo, progresso=progresso,
+        formatos=FORMATOS_SAIDA_CONTA,
+        somente_preenchidas=['Data de Competência', 'Data de Vencimento', 'Data de Pagamento']
+    )
+
+class ErroEscritaContas(Exception):
+    """Uma ou mais planilhas de conta não puderam ser salvas (as demais foram salvas)."""
+
+    def __init__(self, falhas: Dict[str, str], arquivos: Dict[str, str]):
+        self.falhas = falhas
+        self.arquivos = arquivos
+        detalhes = '; '.join(f'{conta}: {erro}' for conta, erro in falhas.items())
+        super().__init__(f'Falha ao salvar {len(falhas)} conta(s): {detalhes}')
+
+def _salvar_planilhas_contas(
+    tarefas,
+    trabalhadores: int,
+    usar_processos: bool,
+    escritor,
+    progresso: Optional[Progresso] = None
+) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Salva as planilhas das contas, em paralelo quando trabalhadores > 1.
+    
+    Uma falha em uma conta não interrompe as demais. Um cancelamento deixa de
+    iniciar as contas pendentes e descarta as que estão sendo escritas; as já
+    concluídas ficam completas.
+    
+    Returns:
+        Tupla (arquivos salvos por conta, mensagem de erro por conta)
+        
+    Raises:
+        OperacaoCancelada: Se o cancelamento for pedido
+    """
+    arquivos, falhas = {}, {}
+    iniciar_fase(progresso, 'Gravando as planilhas por conta', len(tarefas))
+
+    def registrar(conta, executar):
+        try:
+            arquivos[conta] = executar()
+            logger.debug('Arquivo separado salvo para conta "%s": %s', conta, arquivos[conta])
+        except OperacaoCancelada:
+            raise
+        except Exception as e:
+            falhas[conta] = f'{type(e).__name__}: {e}'
+            logger.error('Erro ao salvar a planilha da conta "%s": %s', conta, falhas[conta])
+        avancar(progresso)
+
+    if trabalhadores <= 1 or len(tarefas) <= 1:
+        for conta, (df_conta, caminho) in tarefas.items():
+            registrar(conta, lambda: salvar_planilha_conta(df_conta, caminho, escritor, progresso))
+        return arquivos, falhas
+
+    # O progresso não atravessa processos: nesse modo o cancelamento é verificado entre as contas
+    progresso_tarefa = None if usar_processos else progresso
+    executor_cls = ProcessPoolExecutor if usar_processos else ThreadPoolExecutor
+    with executor_cls(max_workers=trabalhadores) as executor:
+        futuros = {
+            executor.submit(salvar_planilha_conta, df_conta, caminho, escritor, progresso_tarefa): conta
+            for conta, (df_conta, caminho) in tarefas.items()
+        }
+        try:
+            for futuro in as_completed(futuros):
+                registrar(futuros[futuro], futuro.result)
+        except OperacaoCancelada:
+            for futuro in futuros:
+                futuro.cancel()
+            raise
+    return arquivos, falhas
+
+def _montar_nao_relacionados(
+    diagnostico: DiagnosticoChaves,
+    nao_relacionados: pd.DataFrame,
+    movimentacoes: pd.DataFrame,
+    contadores: ContadoresExecucao
+) -> Optional[pd.DataFrame]:
+    """
+    Junta os dois lados sem correspondente em um único relatório, com o motivo
+    de cada linha (ver unmatched_report).
+    
+    Args:
+        diagnostico: Chaves parciais da planilha formatada, com todas as movimentações registradas
+        nao_relacionados: Linhas da planilha formatada sem movimentação
+        movimentacoes: Movimentações sem linha do caixa
+        
+    Returns:
+        Relatório para _salvar_nao_relacionados (None se os dois lados estiverem vazios)
+    """
+    contadores['nao_relacionados'] = len(nao_relacionados)
+    contadores['movimentacoes_nao_relacionadas'] = len(movimentacoes)
+    if nao_relacionados.empty and movimentacoes.empty:
+        return None
+    relatorio = montar_relatorio_nao_relacionados(
+        linhas_caixa(nao_relacionados, diagnostico.motivos_caixa(nao_relacionados['Movimentação'], nao_relacionados['Valor'])),
+        linhas_movimentacoes(movimentacoes, diagnostico.motivos_movimentacoes(movimentacoes['Código'], movimentacoes['Valor (R$)']))
+    )
+    logger.info('Não relacionados por motivo: %s', contar_motivos(relatorio))
+    return relatorio
+
+def _salvar_nao_relacionados(
+    relatorio: pd.DataFrame,
+    pasta_saida: str,
+    escritor: Optional[EscritorPlanilha],
+    progresso: Optional[Progresso]
+) -> None:
+    """Grava o relatório de _montar_nao_relacionados em Não Relacionados.xlsx."""
+    caminho_arquivo_nao_relacionados = os.path.join(pasta_saida, 'Não Relacionados.xlsx')
+    salvar_atomicamente(escritor, relatorio, caminho_arquivo_nao_relacionados, progresso=progresso)
+    logger.info('Planilha de lançamentos não relacionados salva em: %s', caminho_arquivo_nao_relacionados)
+
+def _sem_regra(df_mov: pd.DataFrame, sem_correspondente: np.ndarray) -> pd.Series:
+    """
+    Movimentações relacionadas cuja combinação de filial e forma de pagamento
+    não tem conta. As sem correspondente no caixa ficam de fora: já estão em
+    Não Relacionados e não são uma combinação sem regra.
+    
+    Args:
+        df_mov: Movimentações com Conta Bancária
+        sem_correspondente: Máscara das movimentações sem linha do caixa
+    """
+    return (df_mov['Conta Bancária'] == '') & ~np.asarray(sem_correspondente, dtype=bool)
+
+def _salvar_sem_conta(
+    sem_conta: pd.DataFrame,
+    pasta_saida: str,
+    escritor: Optional[EscritorPlanilha],
+    progresso: Optional[Progresso],
+    contadores: ContadoresExecucao
+) -> None:
+    """Grava o resumo das combinações sem conta bancária e conta os lançamentos."""
+    contadores['sem_conta'] = int(sem_conta['Lançamentos'].sum())
+    logger.warning(
+        '%d lançamento(s) sem conta bancária em %d combinação(ões) de filial e forma de pagamento',
+        contadores['sem_conta'], len(sem_conta)
+    )
+    caminho_sem_conta = os.path.join(pasta_saida, ARQUIVO_SEM_CONTA)
+    salvar_atomicamente(
+        escritor, sem_conta.assign(Valor=centavos_para_reais(sem_conta['Valor'])),
+        caminho_sem_conta, progresso=progresso
+    )
+    logger.info('Combinações sem conta bancária salvas em: %s', caminho_sem_conta)
+
+def _relacionar_aproximados(
+    movimentacoes: pd.DataFrame,
+    caixa: pd.DataFrame,
+    criterios: CriteriosAproximacao,
+    pasta_saida: str,
+    escritor: Optional[EscritorPlanilha],
+    progresso: Optional[Progresso],
+    contadores: ContadoresExecucao
+) -> pd.DataFrame:
+    """
+    Cruzamento aproximado das sobras do cruzamento exato (ver approximate_match),
+    gravando os pares aceitos em ARQUIVO_APROXIMADOS.
+    
+    Args:
+        movimentacoes: Movimentações sem correspondente exato
+        caixa: Linhas da planilha formatada sem movimentação, com 'Data' convertida
+        
+    Returns:
+        Pares aceitos (approximate_match.COLUNAS_PARES), com os rótulos das
+        linhas de cada lado
+    """
+    pares = parear_aproximados(movimentacoes, caixa, criterios)
+    contadores['relacionados_aproximados'] = len(pares)
+    logger.info('Movimentações relacionadas por aproximação: %d de %d (%s)', len(pares), len(movimentacoes), criterios)
+    if pares.empty:
+        return pares
+
+    relatorio = montar_relatorio_aproximados(movimentacoes, caixa, pares)
+    colunas_valor = ['Valor Movimentação', 'Valor Caixa', 'Diferença']
+    relatorio[colunas_valor] = relatorio[colunas_valor].apply(centavos_para_reais)
+    caminho = os.path.join(pasta_saida, ARQUIVO_APROXIMADOS)
+    salvar_atomicamente(
+        escritor, relatorio, caminho, progresso=progresso,
+        formatos={
+            'Data Movimentação': FORMATO_DATA, 'Data Caixa': FORMATO_DATA,
+            **{coluna: FORMATO_VALOR for coluna in colunas_valor}
+        },
+        somente_preenchidas=['Data Movimentação', 'Data Caixa']
+    )
+    logger.info('Planilha de relacionados por aproximação salva em: %s', caminho)
+    return pares
+
+def _relacionar_agrupados(
+    movimentacoes: pd.DataFrame,
+    caixa: pd.DataFrame,
+    criterios: CriteriosAgrupamento,
+    regras_contas: RegrasContas,
+    pasta_saida: str,
+    escritor: Optional[EscritorPlanilha],
+    progresso: Optional[Progresso],
+    contadores: ContadoresExecucao
+) -> pd.DataFrame:
+    """
+    Cruzamento agrupado das sobras (ver grouped_match), gravando os grupos
+    aceitos em ARQUIVO_AGRUPADOS.
+    
+    Args:
+        movimentacoes: Movimentações ainda sem correspondente
+        caixa: Linhas da planilha formatada ainda sem movimentação, com 'Data' convertida
+        
+    Returns:
+        Grupos aceitos (grouped_match.COLUNAS_GRUPOS), com os rótulos das
+        linhas de cada lado
+    """
+    contas = regras_contas.aplicar(caixa['Filial'], caixa['Forma de Pagamento'].fillna(''))
+    grupos = agrupar_liquidacoes(movimentacoes, caixa, contas, criterios, contadores)
+    contadores['relacionados_agrupados'] = len(grupos)
+    logger.info(
+        'Movimentações relacionadas por agrupamento: %d de %d, somando %d linha(s) do caixa (%s)',
+        len(grupos), len(movimentacoes), int(grupos['linhas_formatada'].map(len).sum()), criterios
+    )
+    if grupos.empty:
+        return grupos
+
+    relatorio = montar_relatorio_agrupados(movimentacoes, caixa, grupos)
+    relatorio['Valor'] = centavos_para_reais(relatorio['Valor'])
+    caminho = os.path.join(pasta_saida, ARQUIVO_AGRUPADOS)
+    salvar_atomicamente(
+        escritor, relatorio, caminho, progresso=progresso,
+        formatos={'Data Movimentação': FORMATO_DATA, 'Valor': FORMATO_VALOR},
+        somente_preenchidas=['Data Movimentação']
+    )
+    logger.info('Planilha de relacionados por agrupamento salva em: %s', caminho)
+    return grupos
+
+def _relacionar_sobras(
+    movimentacoes: pd.DataFrame,
+    nao_relacionados: pd.DataFrame,
+    aproximacao: Optional[CriteriosAproximacao],
+    agrupamento: Optional[CriteriosAgrupamento],
+    regras_contas: RegrasContas,
+    pasta_saida: str,
+    escritor: Optional[EscritorPlanilha],
+    progresso: Optional[Progresso],
+    contadores: ContadoresExecucao
+) -> Tuple[pd.Series, List[Any]]:
+    """
+    Cruzamentos aproximado e agrupado, nessa ordem, do que sobrou do cruzamento exato.
+    
+    Returns:
+        Tupla (forma de pagamento das movimentações relacionadas, no rótulo de
+        cada uma; rótulos das linhas da planilha formatada usadas)
+    """
+    if 'Data' in nao_relacionados.columns:
+        datas, _ = converter_datas(nao_relacionados['Data'])
+    else:
+        datas = pd.Series(pd.NaT, index=nao_relacionados.index, dtype='datetime64[ns]')
+        if any(criterios is not None and criterios.janela_dias is not None for criterios in (aproximacao, agrupamento)):
+            logger.warning(
+                'A planilha formatada não tem a coluna Data (gerada por uma versão anterior); '
+                'com janela de datas nenhum par ou grupo é aceito'
+            )
+    caixa = nao_relacionados.assign(Data=datas)
+    formas: List[pd.Series] = []
+    usadas: List[Any] = []
+
+    if aproximacao is not None:
+        pares = _relacionar_aproximados(movimentacoes, caixa, aproximacao, pasta_saida, escritor, progresso, contadores)
+        formas.append(pd.Series(
+            caixa.loc[pares['linha_formatada'], 'Forma de Pagamento'].fillna('').to_numpy(),
+            index=pares['linha_mov'].to_numpy(), dtype=object
+        ))
+        usadas += list(pares['linha_formatada'])
+        movimentacoes = movimentacoes.drop(index=pares['linha_mov'])
+        caixa = caixa.drop(index=pares['linha_formatada'])
+
+    if agrupamento is not None:
+        grupos = _relacionar_agrupados(
+            movimentacoes, caixa, agrupamento, regras_contas, pasta_saida, escritor, progresso, contadores
+        )
+        # Os membros de um grupo são da mesma conta: a forma de pagamento do primeiro leva o lançamento a ela
+        primeiros = [linhas[0] for linhas in grupos['linhas_formatada']]
+        formas.append(pd.Series(
+            caixa.loc[primeiros, 'Forma de Pagamento'].fillna('').to_numpy(),
+            index=grupos['linha_mov'].to_numpy(), dtype=object
+        ))
+        usadas += [linha for linhas in grupos['linhas_formatada'] for linha in linhas]
+
+    return pd.concat(formas), usadas
+
+def _remover_temporario(caminho: str) -> None:
+    caminho_temp = caminho_temporario(caminho)
+    if os.path.exists(caminho_temp):
+        os.remove(caminho_temp)
+
+def _cruzar_em_lotes(
+    df_formatada: pd.DataFrame,
+    arquivo_movimentacoes: str,
+    pasta_saida: str,
+    escritor: Optional[EscritorPlanilha],
+    regras_contas: RegrasContas,
+    progresso: Optional[Progresso],
+    contadores: ContadoresExecucao,
+    tamanho_lote: int,
+    aproximacao: Optional[CriteriosAproximacao] = None,
+    agrupamento: Optional[CriteriosAgrupamento] = None
+) -> Dict[str, str]:
+    """
+    Cruzamento com a planilha de movimentações lida em blocos (ver cruzar_planilhas_movimentacao).
+    
+    Só a planilha formatada fica inteira em memória, como IndiceFormatada. Cada
+    bloco de movimentações é relacionado, recebe a conta e é acrescentado à
+    planilha da sua conta, aberta para escrita incremental em um arquivo
+    temporário; as planilhas só são publicadas depois do último bloco.
+    
+    Com aproximacao ou agrupamento, as movimentações sem correspondente exato
+    são guardadas até o fim da leitura, cruzadas com as linhas da planilha
+    formatada que sobraram e só então acrescentadas às planilhas das contas.
+
+    Não Relacionados também é escrito de forma incremental: as movimentações
+    sem correspondente de cada bloco entram nele logo depois do bloco, e as
+    linhas do caixa só depois do último, quando todas as movimentações já foram
+    registradas no diagnóstico. Por isso, nesse modo, as movimentações vêm
+    antes das linhas do caixa no relatório.
+    """
+    escritor = escritor or obter_escritor()
+    indice = IndiceFormatada(df_formatada)
+    diagnostico = DiagnosticoChaves(indice.linhas['Movimentação'], indice.linhas['Valor'])
+    abertas: Dict[str, Tuple[Any, str]] = {}  # conta → (planilha em escrita, caminho final)
+    arquivos, falhas = {}, {}
+    parciais_sem_conta: List[pd.DataFrame] = []
+    sem_par: List[pd.DataFrame] = []  # Movimentações guardadas para os cruzamentos aproximado e agrupado
+    caminho_nao_relacionados = os.path.join(pasta_saida, 'Não Relacionados.xlsx')
+    nao_relacionados: Optional[Any] = None  # Não Relacionados em escrita, até ser publicado
+    motivos: Counter = Counter()  # (origem, motivo) → linhas
+    leitura: Dict[str, int] = {'valores_invalidos': 0}
+    # Linhas e centavos lidos e não relacionados; por conta, centavos atribuídos e entregues ao escritor
+    totais = Counter()
+    esperados: Counter = Counter()
+    escritos: Counter = Counter()
+
+    def registrar_falha(conta: str, erro: Exception) -> None:
+        falhas[conta] = f'{type(erro).__name__}: {erro}'
+        logger.error('Erro ao salvar a planilha da conta "%s": %s', conta, falhas[conta])
+        if conta in abertas:
+            planilha, caminho = abertas.pop(conta)
+            planilha.descartar()
+            _remover_temporario(caminho)
+
+    def escrever_nao_relacionados(linhas: pd.DataFrame) -> None:
+        """Acrescenta linhas (de linhas_caixa ou linhas_movimentacoes) a Não Relacionados."""
+        if linhas.empty:
+            return
+        motivos.update(zip(linhas['Origem'], linhas['Motivo']))
+        nao_relacionados.escrever(em_reais(linhas))
+
+    def movimentacoes_sem_par(df_mov: pd.DataFrame) -> None:
+        """Registra as movimentações sem linha do caixa em Não Relacionados e nos totais."""
+        totais.update(nao_relacionadas=int(df_mov['Valor (R$)'].sum()), linhas_nao_relacionadas=len(df_mov))
+        escrever_nao_relacionados(linhas_movimentacoes(
+            df_mov, diagnostico.motivos_movimentacoes(df_mov['Código'], df_mov['Valor (R$)'])
+        ))
+
+    def acrescentar(df_mov: pd.DataFrame, sem_correspondente: np.ndarray) -> None:
+        """Aplica a conta às movimentações e as acrescenta às planilhas das contas."""
+        df_mov['Conta Bancária'] = regras_contas.aplicar(df_mov['Filial'], df_mov['Forma de Pagamento'])
+        com_conta = df_mov['Conta Bancária'] != ''
+        sem_regra = _sem_regra(df_mov, sem_correspondente)
+        if sem_regra.any():
+            sem_conta = df_mov[sem_regra]
+            parciais_sem_conta.append(regras_contas.relatorio_sem_conta(
+                sem_conta['Filial'], sem_conta['Forma de Pagamento'], sem_conta['Conta Bancária'],
+                sem_conta['Valor (R$)'], ordenar=False
+            ))
+        if not com_conta.any():
+            return
+        contadores['lancamentos'] += int(com_conta.sum())
+
+        df_saida = montar_colunas_saida(df_mov[com_conta])
+        contas = df_mov.loc[com_conta, 'Conta Bancária']
+        esperados.update(df_mov.loc[com_conta, 'Valor (R$)'].groupby(contas, sort=False).sum().to_dict())
+        for conta, df_conta in df_saida.groupby(contas, sort=False):
+            if conta in falhas:
+                continue
+            try:
+                if conta not in abertas:
+                    caminho = os.path.join(pasta_saida, f"{sanitizar_nome_arquivo(conta)}.xlsx")
+                    planilha = escritor.abrir(
+                        caminho_temporario(caminho), COLUNAS_SAIDA_CONTA, formatos=FORMATOS_SAIDA_CONTA,
+                        somente_preenchidas=['Data de Competência', 'Data de Vencimento', 'Data de Pagamento']
+                    )
+                    abertas[conta] = (planilha, caminho)
+                abertas[conta][0].escrever(df_conta)
+                escritos[conta] += _centavos_escritos(df_conta)
+                totais['linhas_contas'] += len(df_conta)
+            except OperacaoCancelada:
+                raise
+            except Exception as e:
+                registrar_falha(conta, e)
+
+    try:
+        iniciar_fase(progresso, 'Relacionando as movimentações')
+        nao_relacionados = escritor.abrir(caminho_temporario(caminho_nao_relacionados), COLUNAS_NAO_RELACIONADOS)
+        lotes = ler_colunas_em_lotes(
+            arquivo_movimentacoes, COLUNAS_MOVIMENTACOES, tamanho_lote, progresso, COLUNAS_TEXTO_MOVIMENTACOES
+        )
+        for lote in lotes:
+            df_mov = _normalizar_movimentacoes(lote, arquivo_movimentacoes, leitura)
+            totais.update(entrada=int(df_mov['Valor (R$)'].sum()), linhas_entrada=len(df_mov))
+            df_mov['Forma de Pagamento'], encontradas = indice.relacionar(df_mov)
+            diagnostico.registrar(df_mov['Código'], df_mov['Valor (R$)'])
+            if (aproximacao is not None or agrupamento is not None) and not encontradas.all():
+                sem_par.append(df_mov[~encontradas])
+                df_mov, encontradas = df_mov[encontradas].copy(), encontradas[encontradas]
+            elif not encontradas.all():
+                movimentacoes_sem_par(df_mov[~encontradas])
+            acrescentar(df_mov, ~encontradas)
+        logger.info('Movimentações relacionadas: %d de %d', indice.movimentacoes_relacionadas, indice.movimentacoes)
+
+        if sem_par:
+            df_mov = pd.concat(sem_par, ignore_index=True)
+            formas, usadas = _relacionar_sobras(
+                df_mov, indice.pendentes(), aproximacao, agrupamento,
+                regras_contas, pasta_saida, escritor, progresso, contadores
+            )
+            df_mov.loc[formas.index, 'Forma de Pagamento'] = formas
+            indice.marcar(usadas)
+            movimentacoes_sem_par(df_mov.drop(index=formas.index))
+            acrescentar(df_mov, ~df_mov.index.isin(formas.index))
+
+        contadores.update(leitura)
+        caixa = indice.nao_relacionadas()
+        escrever_nao_relacionados(linhas_caixa(caixa, diagnostico.motivos_caixa(caixa['Movimentação'], caixa['Valor'])))
+        contadores['nao_relacionados'] = len(caixa)
+        contadores['movimentacoes_nao_relacionadas'] = totais['linhas_nao_relacionadas']
+        if motivos:
+            logger.info('Não relacionados por motivo: %s', resumir_motivos(motivos))
+        sem_conta = juntar_relatorios_sem_conta(parciais_sem_conta) if parciais_sem_conta else None
+
+        # Totais conferidos antes de publicar Não Relacionados e as planilhas das contas
+        for conta in list(abertas):
+            try:
+                _verificar_total_conta(conta, int(esperados[conta]), escritos[conta])
+            except ValueError as e:
+                registrar_falha(conta, e)
+        if not falhas:
+            _verificar_total_geral(
+                (totais['linhas_entrada'], totais['entrada']),
+                (totais['linhas_contas'], sum(escritos.values())),
+                (0, 0) if sem_conta is None else (int(sem_conta['Lançamentos'].sum()), int(sem_conta['Valor'].sum())),
+                (totais['linhas_nao_relacionadas'], totais['nao_relacionadas'])
+            )
+        if nao_relacionados.linhas_escritas:
+            nao_relacionados.fechar()
+            if progresso is not None:
+                progresso.verificar()
+            os.replace(caminho_temporario(caminho_nao_relacionados), caminho_nao_relacionados)
+            logger.info('Planilha de lançamentos não relacionados salva em: %s', caminho_nao_relacionados)
+        else:
+            nao_relacionados.descartar()
+            _remover_temporario(caminho_nao_relacionados)
+        nao_relacionados = None
+        if sem_conta is not None:
+            _salvar_sem_conta(sem_conta, pasta_saida, escritor, progresso, contadores)
+
+        if not contadores['lancamentos']:
+            logger.warning("Nenhum dado compatível encontrado. Nenhuma planilha foi gerada.")
+            contadores.registrar_resumo(logger, 'Resumo do cruzamento')
+            return {}
+
+        iniciar_fase(progresso, 'Gravando as planilhas por conta', len(abertas))
+        for conta in list(abertas):
+            planilha, caminho = abertas[conta]
+            try:
+                planilha.fechar()
+                if progresso is not None:
+                    progresso.verificar()
+                os.replace(caminho_temporario(caminho), caminho)
+                del abertas[conta]
+                arquivos[conta] = caminho
+                logger.debug('Arquivo separado salvo para conta "%s": %s', conta, caminho)
+            except OperacaoCancelada:
+                raise
+            except Exception as e:
+                registrar_falha(conta, e)
+            avancar(progresso)
+    except Exception:
+        # Erro de leitura ou cancelamento: nenhuma planilha pela metade fica na pasta
+        for planilha, caminho in abertas.values():
+            planilha.descartar()
+            _remover_temporario(caminho)
+        if nao_relacionados is not None:
+            nao_relacionados.descartar()
+            _remover_temporario(caminho_nao_relacionados)
+        raise
+
+    contadores['contas'] = len(arquivos)
+    contadores.registrar_resumo(logger, 'Resumo do cruzamento')
+    if falhas:
+        raise ErroEscritaContas(falhas, arquivos)
+    return arquivos
+
+def _gravar_contas(
+    df_mov: pd.DataFrame,
+    sem_correspondente: np.ndarray,
+    entrada: Tuple[int, int],
+    pasta_saida: str,
+    trabalhadores: int,
+    usar_processos: bool,
+    escritor: Optional[EscritorPlanilha],
+    regras_contas: RegrasContas,
+    progresso: Optional[Progresso],
+    contadores: ContadoresExecucao,
+    nao_relacionados: Optional[pd.DataFrame] = None
+) -> Dict[str, str]:
+    """
+    Aplica a conta às movimentações já relacionadas e grava o resumo sem conta
+    e uma planilha por conta bancária (ver cruzar_planilhas_movimentacao).
+    
+    Antes de gravar, confere o total de cada conta e o total geral (ver
+    _verificar_total_conta e _verificar_total_geral).
+    
+    Args:
+        df_mov: Movimentações com Forma de Pagamento
+        sem_correspondente: Máscara das movimentações sem linha do caixa (ver _sem_regra)
+        entrada: (linhas, centavos) das movimentações lidas, antes do cruzamento
+        nao_relacionados: Relatório de _montar_nao_relacionados, gravado com o
+            resumo sem conta depois de conferidos os totais (None = não grava)
+        
+    Raises:
+        ValueError: Se algum total divergir (nenhuma planilha é gravada)
+    """
+    df_mov['Conta Bancária'] = regras_contas.aplicar(df_mov['Filial'], df_mov['Forma de Pagamento'])
+
+    com_conta = df_mov['Conta Bancária'] != ''
+    sem_regra = _sem_regra(df_mov, sem_correspondente)
+    sem_conta = None
+    if sem_regra.any():
+        linhas_sem_conta = df_mov[sem_regra]
+        sem_conta = regras_contas.relatorio_sem_conta(
+            linhas_sem_conta['Filial'], linhas_sem_conta['Forma de Pagamento'],
+            linhas_sem_conta['Conta Bancária'], linhas_sem_conta['Valor (R$)']
+        )
+
+    # Colunas de saída calculadas uma única vez para todas as contas
+    df_saida = montar_colunas_saida(df_mov[com_conta])
+    contas = df_mov.loc[com_conta, 'Conta Bancária']
+    esperados = df_mov.loc[com_conta, 'Valor (R$)'].groupby(contas, sort=False).sum()
+
+    # Totais conferidos antes de gravar qualquer planilha de conta
+    tarefas, escritos = {}, {}
+    for conta, df_conta in df_saida.groupby(contas, sort=False):
+        escritos[conta] = _centavos_escritos(df_conta)
+        nome_arquivo = f"{sanitizar_nome_arquivo(conta)}.xlsx"
+        tarefas[conta] = (df_conta, os.path.join(pasta_saida, nome_arquivo))
+    for conta, esperado in esperados.items():
+        _verificar_total_conta(conta, int(esperado), escritos.get(conta, 0))
+    _verificar_total_geral(
+        entrada,
+        (len(df_saida), sum(escritos.values())),
+        (0, 0) if sem_conta is None else (int(sem_conta['Lançamentos'].sum()), int(sem_conta['Valor'].sum())),
+        _linhas_e_centavos(df_mov.loc[np.asarray(sem_correspondente, dtype=bool), 'Valor (R$)'])
+    )
+
+    if nao_relacionados is not None:
+        _salvar_nao_relacionados(nao_relacionados, pasta_saida, escritor, progresso)
+    if sem_conta is not None:
+        _salvar_sem_conta(sem_conta, pasta_saida, escritor, progresso, contadores)
+
+    if not com_conta.any():
+        logger.warning("Nenhum dado compatível encontrado. Nenhuma planilha foi gerada.")
+        contadores.registrar_resumo(logger, 'Resumo do cruzamento')
+        return {}
+
+    arquivos, falhas = _salvar_planilhas_contas(tarefas, trabalhadores, usar_processos, escritor, progresso)
+    contadores['lancamentos'] = int(com_conta.sum())
+    contadores['contas'] = len(arquivos)
+    contadores.registrar_resumo(logger, 'Resumo do cruzamento')
+
+    if falhas:
+        raise ErroEscritaContas(falhas, arquivos)
+    return arquivos
+
+def _cruzar_incremental(
+    df_formatada: pd.DataFrame,
+    arquivo_movimentacoes: str,
+    pasta_saida: str,
+    trabalhadores: int,
+    usar_processos: bool,
+    escritor: Optional[EscritorPlanilha],
+    regras_contas: RegrasContas,
+    progresso: Optional[Progresso],
+    contadores: ContadoresExecucao,
+    cache: Optional[CacheLeituras],
+    livro: LivroConciliacao
+) -> Dict[str, str]:
+    """
+    Cruzamento diário pelo livro de conciliação (ver cruzar_planilhas_movimentacao).
+    
+    As duas planilhas são gravadas no livro, que guarda só o que é novo ou
+    mudou; as movimentações em aberto são relacionadas no próprio SQLite com as
+    linhas do caixa, antigas ou novas. As planilhas das contas recebem só o
+    delta, e Não Relacionados lista tudo o que continua em aberto no livro. Não
+    Relacionados só é gravado depois das planilhas das contas, e o livro só é
+    confirmado depois que todas as planilhas foram salvas.
+    """
+    df_mov, contadores_leitura = ler_com_cache(
+        cache, 'movimentacoes', arquivo_movimentacoes, VERSAO_LEITURA_MOVIMENTACOES,
+        lambda: ler_movimentacoes(arquivo_movimentacoes, progresso)
+    )
+    contadores.update(contadores_leitura)
+
+    iniciar_fase(progresso, 'Atualizando o livro de conciliação')
+    try:
+        execucao = livro.iniciar_execucao()
+        contadores['caixa_novas'], contadores['caixa_alteradas'] = livro.registrar_caixa(df_formatada)
+        contadores['movimentacoes_novas'], contadores['movimentacoes_alteradas'] = livro.registrar_movimentos(df_mov)
+        contadores['relacionadas_agora'] = livro.relacionar_abertos()
+        delta = livro.movimentos_delta()
+        contadores['emitidas'] = livro.marcar_emitidos(execucao)
+        logger.info('Movimentações a emitir nesta execução: %d de %d lidas', len(delta), len(df_mov))
+
+        caixa = livro.caixa()
+        diagnostico = DiagnosticoChaves(caixa['Movimentação'], caixa['Valor'])
+        chaves = livro.chaves_movimentos()
+        diagnostico.registrar(chaves['Código'], chaves['Valor (R$)'])
+        relatorio = _montar_nao_relacionados(
+            diagnostico, livro.caixa(somente_abertas=True), livro.movimentos_abertos(), contadores
+        )
+        arquivos = _gravar_contas(
+            delta, ~delta['Relacionada'].to_numpy(), _linhas_e_centavos(delta['Valor (R$)']), pasta_saida, trabalhadores, usar_processos,
+            escritor, regras_contas, progresso, contadores
+        )
+        # Só depois das contas: Não Relacionados reflete o livro que vai ser confirmado
+        if relatorio is not None:
+            _salvar_nao_relacionados(relatorio, pasta_saida, escritor, progresso)
+    except Exception:
+        # Nada desta execução fica no livro: a próxima emite o mesmo delta
+        livro.desfazer()
+        raise
+    livro.confirmar()
+    return arquivos
+
+def cruzar_planilhas_movimentacao(
+    arquivo_formatado: Union[str, pd.DataFrame],
+    arquivo_movimentacoes: str,
+    pasta_saida: str,
+    trabalhadores: int = 1,
+    usar_processos: bool = False,
+    escritor: Optional[EscritorPlanilha] = None,
+    regras_contas: Optional[RegrasContas] = None,
+    progresso: Optional[Progresso] = None,
+    contadores: Optional[ContadoresExecucao] = None,
+    cache: Optional[CacheLeituras] = None,
+    tamanho_lote: Optional[int] = None,
+    aproximacao: Optional[CriteriosAproximacao] = None,
+    agrupamento: Optional[CriteriosAgrupamento] = None,
+    livro: Optional[LivroConciliacao] = None
+) -> Dict[str, str]:
+    """
+    Cruza as planilhas de movimentação e gera os arquivos de saída.
+    
+    Com tamanho_lote, a planilha de movimentações é lida e cruzada em blocos
+    dessa quantidade de linhas e cada conta é escrita de forma incremental, então
+    a memória depende do tamanho do bloco e não do arquivo (só a planilha
+    formatada fica inteira em memória). Nesse modo o cache, trabalhadores e
+    usar_processos não se aplicam, e as larguras das colunas de cada conta vêm
+    do primeiro bloco; o conteúdo das planilhas é o mesmo do modo em memória.
+    
+    Com aproximacao, as movimentações e linhas da planilha formatada que
+    sobram do cruzamento exato passam por um cruzamento aproximado (mesma
+    filial, valor dentro da tolerância e datas dentro da janela, um para um;
+    ver approximate_match). Os pares aceitos recebem a forma de pagamento da
+    linha do caixa, saem de Não Relacionados e são listados com a diferença de
+    valor e de datas em ARQUIVO_APROXIMADOS.
+    
+    Com agrupamento, o que ainda sobrar passa pelo cruzamento agrupado: um
+    lançamento é relacionado a várias movimentações do caixa da mesma filial
+    e conta cuja soma é exatamente o valor dele (ver grouped_match). O
+    lançamento vai para a conta do grupo, as movimentações saem de Não
+    Relacionados e os grupos são listados em ARQUIVO_AGRUPADOS.
+    
+    Em lotes, as movimentações sem correspondente exato ficam em memória até o
+    fim da leitura e entram no final da planilha de cada conta.
+    
+    Com livro, o cruzamento é incremental (ver ledger.LivroConciliacao): as
+    planilhas das contas recebem só as movimentações novas ou alteradas desde
+    a execução anterior e as antigas que encontraram agora a linha do caixa, e
+    Não Relacionados lista tudo o que continua em aberto no livro. Só o
+    cruzamento exato é feito nesse modo. Reiniciar o livro volta a processar
+    tudo, como o cruzamento completo.
+    
+    Args:
+        arquivo_formatado: Caminho do arquivo formatado da etapa anterior, ou a tabela
+            em memória de html_reader.gerar_planilha_formatada (ver pipeline)
+        arquivo_movimentacoes: Caminho do arquivo de movimentações
+        pasta_saida: Pasta onde serão salvos os arquivos resultantes
+        trabalhadores: Quantidade de planilhas de conta salvas simultaneamente
+        usar_processos: Usa um pool de processos em vez de threads
+        escritor: Escritor das planilhas de saída (None = streaming, ver excel_writer.obter_escritor)
+        regras_contas: Tabela filial/forma de pagamento → conta (None = config/contas.json)
+        progresso: Recebe o andamento e permite cancelar (ver progress.Progresso)
+        contadores: Recebe os contadores do cruzamento (None = só registrados no log)
+        cache: Cache das movimentações já lidas (None = sempre lê o arquivo, ver parse_cache)
+        tamanho_lote: Linhas de movimentações por bloco (None = arquivo inteiro em memória)
+        aproximacao: Critérios do cruzamento aproximado (None = não faz)
+        agrupamento: Critérios do cruzamento agrupado (None = não faz)
+        livro: Livro de conciliação do cruzamento incremental (None = cruza tudo)
+        
+    Returns:
+        Caminho da planilha salva para cada conta bancária
+        
+    Raises:
+        ValueError: Se livro for combinado com tamanho_lote, aproximacao ou agrupamento
+        ErroEscritaContas: Se alguma conta falhar (as demais são salvas)
+        OperacaoCancelada: Se o cancelamento for pedido (nenhum arquivo parcial é deixado)
+    """
+    if livro is not None and (tamanho_lote or aproximacao is not None or agrupamento is not None):
+        raise ValueError('O livro de conciliação não pode ser combinado com lotes, aproximação ou agrupamento')
+    iniciar_fase(progresso, 'Lendo as planilhas')
+    contadores = contadores if contadores is not None else ContadoresExecucao()
+    contadores.update(valores_invalidos=0, nao_relacionados=0, lancamentos=0, contas=0)
+    df_formatada = preparar_planilha_formatada(arquivo_formatado, contadores)
+    regras_contas = regras_contas or obter_regras_contas()
+    if livro is not None:
+        return _cruzar_incremental(
+            df_formatada, arquivo_movimentacoes, pasta_saida, trabalhadores, usar_processos,
+            escritor, regras_contas, progresso, contadores, cache, livro
+        )
+    if tamanho_lote:
+        return _cruzar_em_lotes(
+            df_formatada, arquivo_movimentacoes, pasta_saida, escritor,
+            regras_contas, progresso, contadores, tamanho_lote, aproximacao, agrupamento
+        )
+    df_mov, contadores_leitura = ler_com_cache(
+        cache, 'movimentacoes', arquivo_movimentacoes, VERSAO_LEITURA_MOVIMENTACOES,
+        lambda: ler_movimentacoes(arquivo_movimentacoes, progresso)
+    )
+    contadores.update(contadores_leitura)
+    entrada = _linhas_e_centavos(df_mov['Valor (R$)'])
+
+    iniciar_fase(progresso, 'Relacionando as movimentações')
+    df_mov, nao_relacionados, relacionadas = _relacionar(df_formatada, df_mov)
+    diagnostico = DiagnosticoChaves(df_formatada['Movimentação'], df_formatada['Valor'])
+    diagnostico.registrar(df_mov['Código'], df_mov['Valor (R$)'])
+    sem_par = ~relacionadas
+    if aproximacao is not None or agrupamento is not None:
+        formas, usadas = _relacionar_sobras(
+            df_mov[sem_par], nao_relacionados, aproximacao, agrupamento,
+            regras_contas, pasta_saida, escritor, progresso, contadores
+        )
+        df_mov.loc[formas.index, 'Forma de Pagamento'] = formas
+        sem_par[formas.index.to_numpy(dtype='int64')] = False
+        nao_relacionados = nao_relacionados.drop(index=usadas).reset_index(drop=True)
+
+    relatorio = _montar_nao_relacionados(diagnostico, nao_relacionados, df_mov[sem_par], contadores)
+
+    return _gravar_contas(
+        df_mov, sem_par, entrada, pasta_saida, trabalhadores, usar_processos,
+        escritor, regras_contas, progresso, contadores, relatorio
+    )
@@ -0,0 +1,78 @@
+"""
+Confere se os motores de transformação chegam à mesma planilha formatada.
+
+Roda os três motores (vetorizado, linha_a_linha e streaming) sobre cada
+relatório de caixa, sem gravar nada, e compara cada um com o motor de
+referência (linha_a_linha). Serve para qualquer formato de entrada aceito
+(HTML salvo como .xls, .xls BIFF, .xlsx ou CSV), já que o motor streaming tem
+leitores de linhas próprios para cada formato.
+
+    python conferir_motores.py caixa.xls
+    python conferir_motores.py caixa.xls caixa_html.xls caixa.csv --mostrar 20
+"""
+import argparse
+import sys
+from typing import List, Set
+
+import pandas as pd
+
+from html_reader import COLUNAS_SAIDA_FORMATADA, MOTORES_TRANSFORMACAO, gerar_planilha_formatada
+
+MOTOR_REFERENCIA = 'linha_a_linha'
+
+def _linhas(df: pd.DataFrame) -> Set[tuple]:
+    colunas = df[COLUNAS_SAIDA_FORMATADA].astype(object)
+    return set(colunas.where(colunas.notna(), '').itertuples(index=False, name=None))
+
+def movimentacoes_divergentes(referencia: pd.DataFrame, outra: pd.DataFrame) -> List[str]:
+    """
+    Movimentações cujas linhas diferem entre duas planilhas formatadas.
+
+    A ordem das linhas não importa: o motor streaming mantém a ordem do
+    relatório e os motores em lote ordenam pelo número da movimentação.
+
+    Args:
+        referencia: Planilha formatada do motor de referência
+        outra: Planilha formatada de outro motor
+
+    Returns:
+        Números das movimentações que aparecem em só uma das planilhas ou com valores diferentes
+    """
+    return sorted({str(linha[0]) for linha in _linhas(referencia) ^ _linhas(outra)})
+
+def conferir_arquivo(caminho: str, mostrar: int) -> bool:
+    """
+    Roda os três motores sobre um relatório e imprime as divergências.
+
+    Returns:
+        True se todos os motores chegaram à mesma planilha
+    """
+    tabelas = {motor: gerar_planilha_formatada(caminho, None, motor) for motor in MOTORES_TRANSFORMACAO}
+    referencia = tabelas[MOTOR_REFERENCIA]
+    print(f'{caminho}:')
+    iguais = True
+    for motor, df in tabelas.items():
+        divergentes = [] if motor == MOTOR_REFERENCIA else movimentacoes_divergentes(referencia, df)
+        situacao = 'referência' if motor == MOTOR_REFERENCIA else ('igual' if not divergentes else 'DIVERGENTE')
+        print(f'  {motor:<14} {len(df):>8} movimentações  total {int(df["Valor"].sum()):>14} centavos  {situacao}')
+        if divergentes:
+            iguais = False
+            exemplos = ', '.join(divergentes[:mostrar])
+            print(f'    {len(divergentes)} movimentação(ões) diferente(s): {exemplos}')
+    return iguais
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Confere se os motores de transformação chegam ao mesmo resultado.')
+    parser.add_argument('arquivos', nargs='+', help='Relatórios de caixa (.xls, .xlsx, HTML ou CSV)')
+    parser.add_argument('--mostrar', type=int, default=10,
+                        help='Movimentações divergentes listadas por motor (padrão: 10)')
+    args = parser.parse_args()
+
+    resultados = [conferir_arquivo(caminho, args.mostrar) for caminho in args.arquivos]
+    if not all(resultados):
+        print('Os motores divergem')
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,331 @@
+import datetime
+import os
+from abc import ABC, abstractmethod
+import pandas as pd
+from typing import Dict, Iterable, List, Optional
+from zipfile import ZipFile, ZIP_DEFLATED
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+from openpyxl.utils import get_column_letter
+from openpyxl.writer.excel import ExcelWriter
+from utils import caminho_temporario
+from progress import Progresso
+
+FORMATO_DATA = 'dd/mm/yyyy'
+FORMATO_VALOR = '0.00'
+FORMATO_TEXTO = '@'
+
+COMPRESSAO_PADRAO = 6
+
+# Mesmo estilo de cabeçalho aplicado pelo DataFrame.to_excel
+_BORDA_FINA = Side(style='thin')
+ESTILO_CABECALHO = {
+    'font': Font(bold=True),
+    'border': Border(left=_BORDA_FINA, right=_BORDA_FINA, top=_BORDA_FINA, bottom=_BORDA_FINA),
+    'alignment': Alignment(horizontal='center', vertical='top'),
+}
+
+def larguras_colunas(df: pd.DataFrame) -> List[int]:
+    """
+    Calcula a largura de cada coluna (maior texto + 2) a partir do DataFrame.
+
+    Args:
+        df: Dados que serão escritos, com cabeçalho
+
+    Returns:
+        Largura de cada coluna, na ordem do DataFrame
+    """
+    larguras = []
+    for coluna in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[coluna]):
+            # Datas são exibidas como dd/mm/yyyy
+            tamanhos = df[coluna].notna() * len('00/00/0000')
+        else:
+            tamanhos = _valores_coluna(df[coluna]).astype(str).str.len()
+        maior = max(len(str(coluna)), int(tamanhos.max()) if len(tamanhos) else 0)
+        larguras.append(maior + 2)
+    return larguras
+
+def _valores_coluna(serie: pd.Series) -> pd.Series:
+    """Valores como objetos Python, com células nulas vazias (como o na_rep do to_excel)."""
+    return serie.astype(object).where(serie.notna(), '')
+
+def _aplicar_estilo_cabecalho(celula) -> None:
+    celula.font = ESTILO_CABECALHO['font']
+    celula.border = ESTILO_CABECALHO['border']
+    celula.alignment = ESTILO_CABECALHO['alignment']
+
+def _salvar_workbook(wb: Workbook, caminho: str, compressao: int) -> None:
+    """Salva o workbook com o nível de compressão zip informado (0 a 9)."""
+    if wb.write_only and not wb.worksheets:
+        wb.create_sheet()
+    wb.properties.modified = datetime.datetime.now(tz=datetime.timezone.utc).replace(tzinfo=None)
+    arquivo = ZipFile(caminho, 'w', ZIP_DEFLATED, allowZip64=True, compresslevel=compressao)
+    ExcelWriter(wb, arquivo).save()
+
+class PlanilhaIncremental:
+    """
+    Planilha write-only aberta para receber linhas em blocos.
+
+    Cada bloco é serializado no arquivo assim que é escrito, então a memória
+    usada não depende da quantidade total de linhas. Como as larguras precisam
+    ser definidas antes da primeira linha, elas vêm do parâmetro larguras ou,
+    na falta dele, do primeiro bloco escrito.
+    """
+
+    def __init__(
+        self,
+        caminho: str,
+        colunas: List[str],
+        formatos: Optional[Dict[str, str]] = None,
+        somente_preenchidas: Iterable[str] = (),
+        nome_aba: str = 'Sheet1',
+        compressao: int = COMPRESSAO_PADRAO,
+        larguras: Optional[List[int]] = None
+    ):
+        self.caminho = caminho
+        self.colunas = list(colunas)
+        self.compressao = compressao
+        self.larguras = larguras
+        self.linhas_escritas = 0
+        formatos = formatos or {}
+        somente_preenchidas = set(somente_preenchidas)
+
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet(nome_aba)
+        self._cabecalho_escrito = False
+
+        # Uma célula modelo por coluna: o estilo é registrado uma única vez e cada
+        # linha é serializada no momento do append, então as células são reaproveitadas
+        self._modelos, self._sem_formato = [], []
+        for coluna in self.colunas:
+            modelo = WriteOnlyCell(self._ws)
+            if coluna in formatos:
+                modelo.number_format = formatos[coluna]
+            self._modelos.append(modelo)
+            self._sem_formato.append(WriteOnlyCell(self._ws) if coluna in somente_preenchidas else None)
+
+    def _escrever_cabecalho(self, larguras: List[int]) -> None:
+        for indice, largura in enumerate(larguras, 1):
+            self._ws.column_dimensions[get_column_letter(indice)].width = largura
+
+        cabecalho = []
+        for coluna in self.colunas:
+            celula = WriteOnlyCell(self._ws, value=str(coluna))
+            _aplicar_estilo_cabecalho(celula)
+            cabecalho.append(celula)
+        self._ws.append(cabecalho)
+        self._cabecalho_escrito = True
+
+    def escrever(self, df: pd.DataFrame) -> None:
+        """Acrescenta as linhas do DataFrame (nas colunas da planilha)."""
+        df = df[self.colunas]
+        if not self._cabecalho_escrito:
+            self._escrever_cabecalho(self.larguras or larguras_colunas(df))
+
+        valores_colunas = [_valores_coluna(df[coluna]).tolist() for coluna in self.colunas]
+        for valores in zip(*valores_colunas):
+            linha = []
+            for valor, modelo, vazio in zip(valores, self._modelos, self._sem_formato):
+                celula = vazio if (vazio is not None and not valor) else modelo
+                celula.value = valor
+                linha.append(celula)
+            self._ws.append(linha)
+        self.linhas_escritas += len(df)
+
+    def fechar(self) -> None:
+        """Finaliza e grava o arquivo."""
+        if not self._cabecalho_escrito:
+            self._escrever_cabecalho(self.larguras or [len(str(c)) + 2 for c in self.colunas])
+        _salvar_workbook(self._wb, self.caminho, self.compressao)
+
+    def descartar(self) -> None:
+        """Abandona a planilha sem gravá-la (ex.: processamento cancelado)."""
+        if self._ws.closed:
+            return
+        # Encerra o fluxo XML e apaga o temporário interno do openpyxl agora,
+        # em vez de deixá-los para o coletor de lixo e para a saída do programa
+        self._ws.close()
+        escritor_aba = getattr(self._ws, '_writer', None)
+        if escritor_aba is not None:
+            escritor_aba.cleanup()
+
+class _PlanilhaAcumulada:
+    """Adapta um escritor sem escrita incremental: acumula os blocos e escreve ao fechar."""
+
+    def __init__(self, escritor, caminho, colunas, **opcoes):
+        self._escritor = escritor
+        self.caminho = caminho
+        self.colunas = list(colunas)
+        self._opcoes = opcoes
+        self._blocos = []
+        self.linhas_escritas = 0
+
+    def escrever(self, df: pd.DataFrame) -> None:
+        self._blocos.append(df[self.colunas])
+        self.linhas_escritas += len(df)
+
+    def fechar(self) -> None:
+        df = pd.concat(self._blocos) if self._blocos else pd.DataFrame(columns=self.colunas)
+        self._escritor.escrever(df, self.caminho, **self._opcoes)
+
+    def descartar(self) -> None:
+        self._blocos = []
+
+class EscritorPlanilha(ABC):
+    """
+    Interface dos escritores de planilhas de saída.
+
+    Subclasses implementam escrever; abrir tem uma implementação padrão que
+    acumula os blocos e escreve tudo ao fechar.
+
+    Args:
+        compressao: Nível de compressão do arquivo .xlsx (0 = sem compressão, 9 = máxima)
+    """
+
+    nome = ''
+
+    def __init__(self, compressao: int = COMPRESSAO_PADRAO):
+        if not 0 <= compressao <= 9:
+            raise ValueError(f"Nível de compressão inválido: {compressao}. Use de 0 a 9.")
+        self.compressao = compressao
+
+    @abstractmethod
+    def escrever(
+        self,
+        df: pd.DataFrame,
+        caminho: str,
+        formatos: Optional[Dict[str, str]] = None,
+        somente_preenchidas: Iterable[str] = (),
+        nome_aba: str = 'Sheet1'
+    ) -> None:
+        """
+        Escreve o DataFrame inteiro (sem o índice) em uma planilha.
+
+        Args:
+            df: Dados a escrever
+            caminho: Caminho do arquivo .xlsx
+            formatos: Formato numérico por nome de coluna
+            somente_preenchidas: Colunas cujo formato só vale para células não vazias
+            nome_aba: Nome da planilha
+        """
+
+    def abrir(self, caminho: str, colunas: List[str], **opcoes):
+        """
+        Abre uma planilha para escrita em blocos (métodos escrever(df), fechar() e descartar()).
+
+        Args:
+            caminho: Caminho do arquivo .xlsx
+            colunas: Colunas da planilha, na ordem
+            **opcoes: formatos, somente_preenchidas, nome_aba (e larguras no modo streaming)
+        """
+        opcoes.pop('larguras', None)
+        return _PlanilhaAcumulada(self, caminho, colunas, **opcoes)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(compressao={self.compressao})"
+
+class EscritorStreaming(EscritorPlanilha):
+    """Workbook write-only: as linhas vão direto para o arquivo, com memória constante."""
+
+    nome = 'streaming'
+
+    def escrever(self, df, caminho, formatos=None, somente_preenchidas=(), nome_aba='Sheet1'):
+        planilha = self.abrir(
+            caminho, list(df.columns), formatos=formatos,
+            somente_preenchidas=somente_preenchidas, nome_aba=nome_aba,
+            larguras=larguras_colunas(df)
+        )
+        planilha.escrever(df)
+        planilha.fechar()
+
+    def abrir(self, caminho, colunas, **opcoes):
+        return PlanilhaIncremental(caminho, colunas, compressao=self.compressao, **opcoes)
+
+class EscritorOpenpyxl(EscritorPlanilha):
+    """Workbook completo em memória, formatado célula a célula (modo anterior)."""
+
+    nome = 'openpyxl'
+
+    def escrever(self, df, caminho, formatos=None, somente_preenchidas=(), nome_aba='Sheet1'):
+        formatos = formatos or {}
+        somente_preenchidas = set(somente_preenchidas)
+
+        wb = Workbook()
+        ws = wb.active
+        ws.title = nome_aba
+        ws.append([str(coluna) for coluna in df.columns])
+        for celula in ws[1]:
+            _aplicar_estilo_cabecalho(celula)
+
+        for valores in zip(*[_valores_coluna(df[coluna]).tolist() for coluna in df.columns]):
+            ws.append(list(valores))
+
+        for indice, (coluna, largura) in enumerate(zip(df.columns, larguras_colunas(df)), 1):
+            letra = get_column_letter(indice)
+            ws.column_dimensions[letra].width = largura
+            if coluna not in formatos:
+                continue
+            for (celula,) in ws.iter_rows(min_row=2, min_col=indice, max_col=indice):
+                if coluna in somente_preenchidas and not celula.value:
+                    continue
+                celula.number_format = formatos[coluna]
+
+        _salvar_workbook(wb, caminho, self.compressao)
+
+ESCRITORES = {
+    EscritorStreaming.nome: EscritorStreaming,
+    EscritorOpenpyxl.nome: EscritorOpenpyxl,
+}
+
+def obter_escritor(nome: str = EscritorStreaming.nome, compressao: int = COMPRESSAO_PADRAO) -> EscritorPlanilha:
+    """
+    Cria o escritor de planilhas pelo nome.
+
+    Args:
+        nome: 'streaming' (padrão, memória constante) ou 'openpyxl' (workbook em memória)
+        compressao: Nível de compressão do .xlsx (0 a 9)
+
+    Returns:
+        Instância do escritor
+    """
+    if nome not in ESCRITORES:
+        raise ValueError(f"Escritor inválido: {nome}. Use um de: {', '.join(ESCRITORES)}")
+    return ESCRITORES[nome](compressao=compressao)
+
+def salvar_atomicamente(
+    escritor: Optional[EscritorPlanilha],
+    df: pd.DataFrame,
+    caminho: str,
+    progresso: Optional[Progresso] = None,
+    **opcoes
+) -> str:
+    """
+    Escreve a planilha em um arquivo temporário e o renomeia para o caminho final.
+
+    Em caso de erro ou cancelamento o temporário é removido e nenhum arquivo
+    parcial fica na pasta.
+
+    Args:
+        escritor: Escritor a usar (None = escritor padrão)
+        df: Dados a escrever
+        caminho: Caminho final do arquivo .xlsx
+        progresso: Verificado antes de publicar o arquivo (cancelamento); opcional
+        **opcoes: Repassadas para escritor.escrever
+
+    Returns:
+        Caminho do arquivo salvo
+    """
+    escritor = escritor or obter_escritor()
+    caminho_temp = caminho_temporario(caminho)
+    try:
+        escritor.escrever(df, caminho_temp, **opcoes)
+        if progresso is not None:
+            progresso.verificar()
+        os.replace(caminho_temp, caminho)
+    except Exception:
+        if os.path.exists(caminho_temp):
+            os.remove(caminho_temp)
+        raise
+    return caminho
@@ -0,0 +1,255 @@
+import time
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+from approximate_match import em_dias
+from log_config import ContadoresExecucao, obter_logger
+
+logger = obter_logger('grouped_match')
+
+# Movimentações do caixa somadas em um único lançamento, no máximo
+MAXIMO_MEMBROS_PADRAO = 6
+
+# Candidatos por lançamento: a busca enumera 2 ** (limite / 2) somas de cada metade
+LIMITE_CANDIDATOS_PADRAO = 24
+LIMITE_CANDIDATOS_MAXIMO = 40
+
+# Tempo de busca de cada filial/conta; passado o limite, os lançamentos restantes dela são pulados
+TEMPO_LIMITE_PADRAO = 5.0
+
+COLUNAS_GRUPOS = ['linha_mov', 'linhas_formatada', 'Conta Bancária']
+
+COLUNAS_RELATORIO_AGRUPADOS = [
+    'Código', 'Filial', 'Conta Bancária', 'Valor', 'Data Movimentação',
+    'Movimentações', 'Quantidade', 'Formas de Pagamento', 'Cliente/Fornecedor'
+]
+
+class CriteriosAgrupamento:
+    """
+    Critérios do cruzamento agrupado: várias movimentações do caixa liquidadas
+    em um único lançamento (maquininha, depósito de cheques).
+
+    Um grupo é aceito quando as movimentações do caixa são da mesma filial e
+    da mesma conta bancária, a soma dos valores é exatamente o valor do
+    lançamento e, com janela_dias, todas estão dentro da janela em torno da
+    data do lançamento.
+
+    Args:
+        janela_dias: Diferença máxima entre as datas, em dias (None = datas não são comparadas)
+        maximo_membros: Movimentações do caixa por grupo, no máximo
+        limite_candidatos: Movimentações do caixa consideradas por lançamento, das mais próximas na data
+        tempo_limite_segundos: Tempo de busca de cada filial/conta
+
+    Raises:
+        ValueError: Se algum dos limites estiver fora da faixa aceita
+    """
+
+    def __init__(
+        self,
+        janela_dias: Optional[int] = None,
+        maximo_membros: int = MAXIMO_MEMBROS_PADRAO,
+        limite_candidatos: int = LIMITE_CANDIDATOS_PADRAO,
+        tempo_limite_segundos: float = TEMPO_LIMITE_PADRAO
+    ):
+        if janela_dias is not None and janela_dias < 0:
+            raise ValueError(f"Janela de datas inválida: {janela_dias} dias")
+        if maximo_membros < 2:
+            raise ValueError(f"Máximo de movimentações por grupo inválido: {maximo_membros}")
+        if not 2 <= limite_candidatos <= LIMITE_CANDIDATOS_MAXIMO:
+            raise ValueError(
+                f"Limite de candidatos inválido: {limite_candidatos} (de 2 a {LIMITE_CANDIDATOS_MAXIMO})"
+            )
+        if tempo_limite_segundos <= 0:
+            raise ValueError(f"Tempo limite inválido: {tempo_limite_segundos} s")
+        self.janela_dias = janela_dias
+        self.maximo_membros = int(maximo_membros)
+        self.limite_candidatos = int(limite_candidatos)
+        self.tempo_limite_segundos = float(tempo_limite_segundos)
+
+    def __repr__(self) -> str:
+        return (
+            f"CriteriosAgrupamento(janela_dias={self.janela_dias}, maximo_membros={self.maximo_membros}, "
+            f"limite_candidatos={self.limite_candidatos}, tempo_limite_segundos={self.tempo_limite_segundos})"
+        )
+
+def _somas_subconjuntos(valores: np.ndarray, limite: int, maximo_membros: int):
+    """
+    Soma, máscara de bits e tamanho de cada subconjunto de valores (todos com o
+    mesmo sinal), descartando durante a enumeração os que já passam do limite
+    em módulo ou do máximo de membros: acrescentar valores só os afasta mais.
+    """
+    somas = np.zeros(1, dtype='int64')
+    mascaras = np.zeros(1, dtype='int64')
+    quantidades = np.zeros(1, dtype='int64')
+    for bit, valor in enumerate(valores):
+        novas = somas + valor
+        manter = (np.abs(novas) <= limite) & (quantidades < maximo_membros)
+        somas = np.concatenate([somas, novas[manter]])
+        mascaras = np.concatenate([mascaras, mascaras[manter] | (1 << bit)])
+        quantidades = np.concatenate([quantidades, quantidades[manter] + 1])
+    return somas, mascaras, quantidades
+
+def _combinacao(valores: np.ndarray, alvo: int, maximo_membros: int) -> Optional[np.ndarray]:
+    """
+    Posições do menor subconjunto de valores com soma exatamente alvo, por
+    encontro no meio: as somas de cada metade são enumeradas e as de uma delas,
+    ordenadas, são buscadas por busca binária a partir das da outra.
+
+    Returns:
+        Posições em valores (None se nenhum subconjunto de até maximo_membros servir)
+    """
+    meio = len(valores) // 2
+    somas_a, mascaras_a, quantidades_a = _somas_subconjuntos(valores[:meio], abs(alvo), maximo_membros)
+    somas_b, mascaras_b, quantidades_b = _somas_subconjuntos(valores[meio:], abs(alvo), maximo_membros)
+    # Em cada soma da metade b, o subconjunto com menos membros vem primeiro
+    ordem = np.lexsort((quantidades_b, somas_b))
+    somas_b, mascaras_b, quantidades_b = somas_b[ordem], mascaras_b[ordem], quantidades_b[ordem]
+
+    faltam = alvo - somas_a
+    posicoes = np.minimum(np.searchsorted(somas_b, faltam), len(somas_b) - 1)
+    encontradas = somas_b[posicoes] == faltam
+    if not encontradas.any():
+        return None
+    totais = np.where(encontradas, quantidades_a + quantidades_b[posicoes], maximo_membros + 1)
+    melhor = int(np.argmin(totais))
+    if totais[melhor] > maximo_membros:
+        return None
+    mascara = int(mascaras_a[melhor]) | (int(mascaras_b[posicoes[melhor]]) << meio)
+    return np.array([bit for bit in range(len(valores)) if mascara >> bit & 1], dtype='int64')
+
+class _GrupoCaixa:
+    """Movimentações do caixa de uma filial/conta, ordenadas pela data (sem data no fim)."""
+
+    def __init__(self, conta: str, posicoes: np.ndarray, dias: np.ndarray):
+        ordem = np.argsort(dias[posicoes], kind='stable')
+        self.conta = conta
+        self.posicoes = posicoes[ordem]
+        self.dias = dias[self.posicoes]
+        self.tempo = 0.0
+        self.interrompido = False
+
+def agrupar_liquidacoes(
+    movimentacoes: pd.DataFrame,
+    caixa: pd.DataFrame,
+    contas: pd.Series,
+    criterios: CriteriosAgrupamento,
+    contadores: Optional[ContadoresExecucao] = None
+) -> pd.DataFrame:
+    """
+    Grupos de movimentações do caixa cuja soma é exatamente o valor de um
+    lançamento da planilha de movimentações.
+
+    Os lançamentos são resolvidos na ordem da planilha. Para cada um, em cada
+    filial/conta, os candidatos são as movimentações do caixa ainda livres,
+    dentro da janela de datas, com o mesmo sinal e valor menor que o do
+    lançamento, limitados às limite_candidatos mais próximas na data; a busca
+    por encontro no meio poda as somas que passam do valor ou do máximo de
+    membros. Vale o grupo com menos membros (empate: a primeira conta). Cada
+    filial/conta tem tempo_limite_segundos de busca; passado o limite, os
+    lançamentos seguintes não são procurados nela e a interrupção é avisada.
+
+    Args:
+        movimentacoes: Lançamentos sem correspondente, com 'Valor (R$)' (centavos),
+            'Filial' e 'Data Movimentação' (datetime)
+        caixa: Movimentações do caixa sem correspondente, com 'Valor' (centavos),
+            'Filial' e 'Data' (datetime)
+        contas: Conta bancária de cada linha de caixa ('' = sem conta, fica de fora)
+        criterios: Janela de datas e limites da busca
+        contadores: Recebe as filiais/contas interrompidas pelo tempo limite (opcional)
+
+    Returns:
+        DataFrame com COLUNAS_GRUPOS: rótulo do lançamento, rótulos das
+        movimentações do caixa do grupo (na ordem do caixa) e a conta, na
+        ordem dos lançamentos
+    """
+    valores_mov = movimentacoes['Valor (R$)'].to_numpy(dtype='int64')
+    dias_mov = em_dias(movimentacoes['Data Movimentação'])
+    filiais_mov = movimentacoes['Filial'].astype(object).to_numpy()
+    valores_caixa = caixa['Valor'].to_numpy(dtype='int64')
+    dias_caixa = em_dias(caixa['Data'])
+    contas = contas.to_numpy(dtype=object)
+
+    grupos: Dict[str, List[_GrupoCaixa]] = {}
+    chaves = [caixa['Filial'].astype(object).to_numpy(), contas]
+    for (filial, conta), posicoes in pd.Series(np.arange(len(caixa))).groupby(chaves, sort=False).indices.items():
+        if conta:
+            grupos.setdefault(filial, []).append(_GrupoCaixa(conta, posicoes, dias_caixa))
+
+    usadas = np.zeros(len(caixa), dtype=bool)
+    encontrados = []
+    for linha in range(len(movimentacoes)):
+        alvo = int(valores_mov[linha])
+        if alvo == 0 or filiais_mov[linha] not in grupos:
+            continue
+        dia = dias_mov[linha]
+        if criterios.janela_dias is not None and np.isnan(dia):
+            continue
+        melhor = None
+        for grupo in grupos[filiais_mov[linha]]:
+            if grupo.interrompido:
+                continue
+            inicio_busca = time.monotonic()
+            posicoes = grupo.posicoes
+            if criterios.janela_dias is not None:
+                inicio = np.searchsorted(grupo.dias, dia - criterios.janela_dias, 'left')
+                fim = np.searchsorted(grupo.dias, dia + criterios.janela_dias, 'right')
+                posicoes = posicoes[inicio:fim]
+            valores = valores_caixa[posicoes]
+            livres = ~usadas[posicoes] & (np.sign(valores) == np.sign(alvo)) & (np.abs(valores) < abs(alvo))
+            candidatos = posicoes[livres]
+            if len(candidatos) >= 2 and abs(int(valores_caixa[candidatos].sum())) >= abs(alvo):
+                if len(candidatos) > criterios.limite_candidatos:
+                    distancia = np.nan_to_num(np.abs(dias_caixa[candidatos] - dia), nan=np.inf)
+                    ordem = np.lexsort((candidatos, -np.abs(valores_caixa[candidatos]), distancia))
+                    candidatos = np.sort(candidatos[ordem[:criterios.limite_candidatos]])
+                membros = _combinacao(valores_caixa[candidatos], alvo, criterios.maximo_membros)
+                if membros is not None and (melhor is None or len(membros) < len(melhor[1])):
+                    melhor = (grupo.conta, candidatos[membros])
+            grupo.tempo += time.monotonic() - inicio_busca
+            if grupo.tempo > criterios.tempo_limite_segundos:
+                grupo.interrompido = True
+                logger.warning(
+                    'Cruzamento agrupado interrompido em %s / %s depois de %.1f s; os lançamentos seguintes não foram procurados nela',
+                    filiais_mov[linha], grupo.conta, grupo.tempo
+                )
+        if melhor is not None:
+            usadas[melhor[1]] = True
+            encontrados.append((movimentacoes.index[linha], list(caixa.index[melhor[1]]), melhor[0]))
+
+    if contadores is not None:
+        contadores['agrupamentos_interrompidos'] = sum(
+            grupo.interrompido for lista in grupos.values() for grupo in lista
+        )
+    return pd.DataFrame(encontrados, columns=COLUNAS_GRUPOS)
+
+def montar_relatorio_agrupados(
+    movimentacoes: pd.DataFrame,
+    caixa: pd.DataFrame,
+    grupos: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Relatório dos grupos aceitos, com os números das movimentações do caixa de cada um.
+
+    Args:
+        movimentacoes: Lançamentos usados em agrupar_liquidacoes
+        caixa: Movimentações do caixa usadas em agrupar_liquidacoes
+        grupos: Resultado de agrupar_liquidacoes
+
+    Returns:
+        DataFrame com COLUNAS_RELATORIO_AGRUPADOS (Valor em centavos)
+    """
+    mov = movimentacoes.loc[grupos['linha_mov']].reset_index(drop=True)
+    membros = [caixa.loc[linhas] for linhas in grupos['linhas_formatada']]
+    return pd.DataFrame({
+        'Código': mov['Código'],
+        'Filial': mov['Filial'].astype(object),
+        'Conta Bancária': grupos['Conta Bancária'].to_numpy(),
+        'Valor': mov['Valor (R$)'].astype('int64'),
+        'Data Movimentação': mov['Data Movimentação'],
+        'Movimentações': [', '.join(grupo['Movimentação'].astype(str)) for grupo in membros],
+        'Quantidade': [len(grupo) for grupo in membros],
+        'Formas de Pagamento': [
+            ', '.join(grupo['Forma de Pagamento'].fillna('').astype(str).unique()) for grupo in membros
+        ],
+        'Cliente/Fornecedor': mov['Cliente/Fornecedor'],
+    }, columns=COLUNAS_RELATORIO_AGRUPADOS)
@@ -1,526 +1,649 @@
+import logging
+import math
 import pandas as pd
 import os
-from typing import List, Dict, Any
-from utils import extrair_loja, parse_valor
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Sequence
+from utils import parse_centavos, valor_em_centavos, centavos_para_reais, caminho_temporario
+from excel_writer import EscritorPlanilha, obter_escritor, salvar_atomicamente
+from input_reader import ler_linhas, ler_planilha_caixa
+from log_config import ContadoresExecucao, obter_logger
+from store_resolver import obter_resolvedor_lojas, resolver_lojas
+from parse_cache import CacheLeituras, ler_com_cache
+from progress import OperacaoCancelada, Progresso, avancar, iniciar_fase
 
-class ProcessadorPlanilha:
-    """Classe responsável por processar e transformar planilhas HTML desformatadas."""
+logger = obter_logger('html_reader')
+
+# Linhas de forma de pagamento reconhecidas no relatório (primeira coluna)
+FORMAS_PAGAMENTO_VALIDAS = {
+    'Dinheiro', 'Transferência Pix',
+    'Cartão de Débito VISA/ MASTER',
+    'Cartão de Crédito VISA / MASTER',
+    'Cartão de Débito ELO',
+    'Cartão de Crédito ELO',
+    'PIx Instantâneo Bradesco LJ02',
+    'CHEQUE RECEBIDO'
+}
+
+TIPOS_OPERACAO = {'Entrada', 'Saída'}
+
+MOTORES_TRANSFORMACAO = ('vetorizado', 'linha_a_linha', 'streaming')
+
+# 'Valor' circula em centavos (int64) e só volta a reais na escrita
+# 'Data' é o texto da primeira coluna da linha de Entrada/Saída, como no relatório
+COLUNAS_REGISTRO = [
+    'Movimentação', 'Código', 'Cliente/Fornecedor',
+    'Documento', 'Valor', 'Forma de Pagamento', 'Usuario', 'Data'
+]
+
+COLUNAS_SAIDA_FORMATADA = [
+    'Movimentação', 'Código', 'Cliente/Fornecedor',
+    'Filial', 'Valor', 'Forma de Pagamento', 'Data'
+]
+
+# Registros acumulados antes de cada escrita no motor streaming
+TAMANHO_LOTE_STREAMING = 1000
+
+FASE_PROCESSAMENTO = 'Processando movimentações'
+FASE_GRAVACAO = 'Gravando a planilha formatada'
+
+def _montar_registros_linha_a_linha(
+    df: pd.DataFrame,
+    contadores: ContadoresExecucao,
+    progresso: Optional[Progresso] = None
+) -> pd.DataFrame:
+    """
+    Motor de referência: percorre a planilha linha a linha em duas passagens.
     
-    FORMAS_PAGAMENTO_VALIDAS = {
-        'Dinheiro', 'Transferência Pix',
-        'Cartão de Débito VISA/ MASTER',
-        'Cartão de Crédito VISA / MASTER',
-        'Cartão de Débito ELO',
-        'Cartão de Crédito ELO',
-        'PIx Instantâneo Bradesco LJ02',
-        'CHEQUE RECEBIDO'
-    }
+    Mantido para comparação de resultados com o motor vetorizado.
+    
+    Args:
+        df: Planilha de entrada lida sem cabeçalho
+        contadores: Contadores da execução, atualizados pelo motor
+        progresso: Acompanhamento por linha nas duas passagens (opcional)
+        
+    Returns:
+        DataFrame com um registro por linha de dados (Valor em centavos), antes do agrupamento
+    """
+    iniciar_fase(progresso, FASE_PROCESSAMENTO, 2 * len(df))
+
+    # Primeiro, vamos mapear os usuários e valores para cada movimentação
+    logger.debug("Mapeando usuários e valores para cada movimentação")
+    usuarios_por_movimentacao = {}
+    valores_por_movimentacao = {}
+    tipos_por_movimentacao = {}
+    datas_por_movimentacao = {}
+    movimentacao_atual = None
+    
+    for idx, row in df.iterrows():
+        avancar(progresso)
+        # Se é uma nova movimentação
+        if pd.notna(row[0]):
+            # Extrai apenas os números da string
+            apenas_numeros = ''.join(filter(str.isdigit, str(row[0]).strip()))
+            if len(apenas_numeros) == 6:
+                movimentacao_atual = apenas_numeros
+                
+        # Se é uma linha de tipo de operação com usuário e valor
+        if pd.notna(row[4]) and str(row[4]).strip() in ['Entrada', 'Saída']:
+            if movimentacao_atual:
+                tipo_operacao = str(row[4]).strip()
+                tipos_por_movimentacao[movimentacao_atual] = tipo_operacao
+                datas_por_movimentacao[movimentacao_atual] = str(row[0]).strip() if pd.notna(row[0]) else ''
+                
+                # Captura o usuário
+                if pd.notna(row[6]):
+                    usuarios_por_movimentacao[movimentacao_atual] = str(row[6]).strip()
+                
+                # Captura o valor
+                if pd.notna(row[5]):
+                    if 'estornado' in str(row[5]).lower():
+                        contadores['estornos'] += 1
+                    valor = valor_em_centavos(row[5], tipo_operacao)
+                    valores_por_movimentacao[movimentacao_atual] = valor
+                    logger.debug(
+                        "Valor capturado para movimentação %s: %r -> %s centavos (Tipo: %s)",
+                        movimentacao_atual, row[5], valor, tipo_operacao
+                    )
+
+    dados_formatados = []
+    bloco_atual = []
+    movimentacao_atual = None
+    tipo_operacao = None
+    forma_pagamento = None
+
+    for i, row in df.iterrows():
+        avancar(progresso)
+        # Identifica nova movimentação
+        if pd.notna(row[0]) and str(row[0]).strip().isdigit() and len(str(row[0]).strip()) == 6:
+            if bloco_atual:
+                # Só processa se não for uma operação de Saída
+                if tipos_por_movimentacao.get(movimentacao_atual) != 'Saída':
+                    usuario_atual = usuarios_por_movimentacao.get(movimentacao_atual, '')
+                    valor_atual = valores_por_movimentacao.get(movimentacao_atual, 0)
+                    logger.debug("Finalizando bloco atual. Usuário: '%s', Valor: %s", usuario_atual, valor_atual)
+                    for item in bloco_atual:
+                        item['Forma de Pagamento'] = forma_pagamento if forma_pagamento else ''
+                        item['Usuario'] = usuario_atual
+                        item['Valor'] = valor_atual
+                        dados_formatados.append(item)
+                bloco_atual = []
+                forma_pagamento = None
+
+            movimentacao_atual = str(row[0]).strip()
+            tipo_operacao = tipos_por_movimentacao.get(movimentacao_atual)
+            contadores['movimentacoes'] += 1
+            logger.debug("Nova movimentação encontrada: %s", movimentacao_atual)
+            continue
+
+        # Captura forma de pagamento
+        if pd.notna(row[0]) and str(row[0]).strip() in FORMAS_PAGAMENTO_VALIDAS:
+            forma_pagamento = str(row[0]).strip()
+            logger.debug("Forma de pagamento definida para movimentação %s: %s", movimentacao_atual, forma_pagamento)
+            continue
+
+        # Linhas de dados (códigos de até 5 dígitos)
+        if pd.notna(row[0]) and str(row[0]).strip().isdigit() and len(str(row[0]).strip()) <= 5:
+            if tipo_operacao == 'Saída':
+                contadores['linhas_ignoradas'] += 1
+            # Só processa se não for uma operação de Saída
+            if tipo_operacao != 'Saída':
+                novo_item = {
+                    'Movimentação': movimentacao_atual,
+                    'Código': str(row[0]).strip(),
+                    'Cliente/Fornecedor': str(row[1]).strip() if pd.notna(row[1]) else '',
+                    'Documento': str(row[5]).strip() if pd.notna(row[5]) else '',
+                    'Valor': valores_por_movimentacao.get(movimentacao_atual, 0),
+                    'Forma de Pagamento': None,
+                    'Usuario': usuarios_por_movimentacao.get(movimentacao_atual, ''),
+                    'Data': datas_por_movimentacao.get(movimentacao_atual, '')
+                }
+                logger.debug(
+                    "Adicionando linha de dados com usuário: '%s' e valor: %s",
+                    novo_item['Usuario'], novo_item['Valor']
+                )
+                bloco_atual.append(novo_item)
+
+    # Processa o último bloco
+    if bloco_atual and tipos_por_movimentacao.get(movimentacao_atual) != 'Saída':
+        usuario_atual = usuarios_por_movimentacao.get(movimentacao_atual, '')
+        valor_atual = valores_por_movimentacao.get(movimentacao_atual, 0)
+        logger.debug("Processando último bloco. Usuário: '%s', Valor: %s", usuario_atual, valor_atual)
+        for item in bloco_atual:
+            item['Forma de Pagamento'] = forma_pagamento if forma_pagamento else ''
+            item['Usuario'] = usuario_atual
+            item['Valor'] = valor_atual
+            dados_formatados.append(item)
+
+    contadores['linhas_dados'] += len(dados_formatados)
+    registros = pd.DataFrame(dados_formatados, columns=COLUNAS_REGISTRO)
+    registros['Valor'] = registros['Valor'].astype('int64')
+    return registros
+
+def _texto_coluna(df: pd.DataFrame, coluna: int) -> pd.Series:
+    """Retorna a coluna como texto sem espaços nas bordas (vazio para células nulas)."""
+    serie = df[coluna]
+    return serie.astype(object).where(serie.notna(), '').astype(str).str.strip()
+
+def _ultimo_por_chave(valores: pd.Series, chaves: pd.Series) -> pd.Series:
+    """Mantém a última ocorrência de cada chave, como um dicionário preenchido em ordem."""
+    ultimos = ~chaves.duplicated(keep='last')
+    return pd.Series(valores[ultimos].to_numpy(), index=chaves[ultimos].to_numpy())
+
+def _montar_registros_vetorizado(df: pd.DataFrame, contadores: ContadoresExecucao) -> pd.DataFrame:
+    """
+    Motor vetorizado: classifica todas as linhas de uma vez com máscaras.
     
-    TIPOS_OPERACAO = {'Entrada', 'Saída'}
+    Reproduz o resultado de _montar_registros_linha_a_linha, inclusive a forma
+    de pagamento que só é reiniciada quando o bloco anterior teve itens.
     
-    def __init__(self, caminho_entrada: str, caminho_saida: str):
-        """
-        Inicializa o processador de planilhas.
+    Args:
+        df: Planilha de entrada lida sem cabeçalho
+        contadores: Contadores da execução, atualizados pelo motor
         
-        Args:
-            caminho_entrada: Caminho do arquivo de entrada
-            caminho_saida: Caminho onde será salvo o arquivo processado
-        """
-        self.caminho_entrada = caminho_entrada
-        self.caminho_saida = self._validar_caminho_saida(caminho_saida)
-        self.dados_formatados: List[Dict[str, Any]] = []
-        print(f"\nCaminhos configurados:")
-        print(f"Entrada: {self.caminho_entrada}")
-        print(f"Saída: {self.caminho_saida}")
+    Returns:
+        DataFrame com um registro por linha de dados (Valor em centavos), antes do agrupamento
+    """
+    preenchida0 = df[0].notna()
+    texto0 = _texto_coluna(df, 0)
+    texto4 = _texto_coluna(df, 4)
+    eh_digito0 = texto0.str.isdigit()
+    tamanho0 = texto0.str.len()
+
+    # Mapeamento de tipo, usuário e valor (número extraído apenas dos dígitos)
+    apenas_numeros = texto0.str.replace(r'\D', '', regex=True)
+    mov_mapeamento = apenas_numeros.where(preenchida0 & (apenas_numeros.str.len() == 6)).ffill()
+    eh_tipo = texto4.isin(TIPOS_OPERACAO) & mov_mapeamento.notna()
+
+    tipos_por_movimentacao = _ultimo_por_chave(texto4[eh_tipo], mov_mapeamento[eh_tipo])
+    datas_por_movimentacao = _ultimo_por_chave(texto0[eh_tipo], mov_mapeamento[eh_tipo])
+
+    com_usuario = eh_tipo & df[6].notna()
+    usuarios_por_movimentacao = _ultimo_por_chave(
+        _texto_coluna(df, 6)[com_usuario], mov_mapeamento[com_usuario]
+    )
+
+    com_valor = eh_tipo & df[5].notna()
+    valores, falhas = parse_centavos(df.loc[com_valor, 5], texto4[com_valor])
+    contadores['estornos'] += int(_texto_coluna(df, 5)[com_valor].str.lower().str.contains('estornado', regex=False).sum())
+    if falhas.any():
+        contadores['valores_invalidos'] += int(falhas.sum())
+        logger.warning("%d valor(es) não reconhecido(s) foram considerados 0", int(falhas.sum()))
+    valores_por_movimentacao = _ultimo_por_chave(valores, mov_mapeamento[com_valor])
+
+    # Classificação das linhas
+    eh_movimentacao = preenchida0 & eh_digito0 & (tamanho0 == 6)
+    eh_forma = ~eh_movimentacao & texto0.isin(FORMAS_PAGAMENTO_VALIDAS)
+    eh_dados = ~eh_movimentacao & ~eh_forma & eh_digito0 & (tamanho0 <= 5)
+
+    grupo = eh_movimentacao.cumsum()
+    movimentacao = texto0.where(eh_movimentacao).ffill()
+    tipo_linha = movimentacao.map(tipos_por_movimentacao)
+    incluida = eh_dados & (tipo_linha != 'Saída')
+
+    # A forma de pagamento só é reiniciada quando o bloco anterior teve itens
+    grupo_com_itens = incluida.groupby(grupo).any()
+    reinicio = eh_movimentacao & (grupo - 1).map(grupo_com_itens).fillna(False).astype(bool)
+    forma_corrente = texto0.where(eh_forma).groupby(reinicio.cumsum()).ffill()
+    forma_por_grupo = forma_corrente.groupby(grupo).last()
+
+    movimentacao_itens = movimentacao[incluida]
+    registros = pd.DataFrame({
+        'Movimentação': movimentacao_itens,
+        'Código': texto0[incluida],
+        'Cliente/Fornecedor': _texto_coluna(df, 1)[incluida],
+        'Documento': _texto_coluna(df, 5)[incluida],
+        'Valor': movimentacao_itens.map(valores_por_movimentacao).fillna(0).astype('int64'),
+        'Forma de Pagamento': grupo[incluida].map(forma_por_grupo).fillna(''),
+        'Usuario': movimentacao_itens.map(usuarios_por_movimentacao).fillna(''),
+        'Data': movimentacao_itens.map(datas_por_movimentacao).fillna(''),
+    }, columns=COLUNAS_REGISTRO)
+
+    contadores['movimentacoes'] += int(eh_movimentacao.sum())
+    contadores['linhas_dados'] += len(registros)
+    contadores['linhas_ignoradas'] += int((eh_dados & ~incluida).sum())
+    return registros.reset_index(drop=True)
+
+def _celula_vazia(linha: Sequence[Any], coluna: int) -> bool:
+    """Indica se a célula está ausente (linha curta), nula ou NaN."""
+    if coluna >= len(linha):
+        return True
+    valor = linha[coluna]
+    return valor is None or (isinstance(valor, float) and math.isnan(valor))
+
+def _texto_celula(linha: Sequence[Any], coluna: int) -> str:
+    """Texto da célula sem espaços nas bordas (vazio para células nulas ou ausentes)."""
+    return '' if _celula_vazia(linha, coluna) else str(linha[coluna]).strip()
+
+def _novo_bloco(movimentacao: Optional[str]) -> Dict[str, Any]:
+    return {
+        'movimentacao': movimentacao, 'tipo': None, 'usuario': '', 'valor': 0,
+        'data': '', 'primeiro_item': None, 'itens': 0
+    }
+
+def _atualizar_tipo_bloco(bloco: Dict[str, Any], linha: Sequence[Any], tipo_operacao: str) -> None:
+    """Aplica ao bloco o tipo, o usuário, o valor (em centavos) e a data de uma linha de Entrada/Saída."""
+    bloco['tipo'] = tipo_operacao
+    bloco['data'] = _texto_celula(linha, 0)
+    if not _celula_vazia(linha, 6):
+        bloco['usuario'] = _texto_celula(linha, 6)
+    if not _celula_vazia(linha, 5):
+        bloco['valor'] = valor_em_centavos(linha[5], tipo_operacao)
+
+def gerar_registros_movimentacao(
+    linhas: Iterable[Sequence[Any]],
+    contadores: Optional[ContadoresExecucao] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Consome as linhas do relatório e produz um registro por movimentação, bloco a bloco.
     
-    def _validar_caminho_saida(self, caminho: str) -> str:
-        """Valida e ajusta o caminho de saída."""
-        try:
-            # Normaliza o caminho
-            caminho = os.path.normpath(caminho)
-            
-            # Adiciona extensão se necessário
-            if not caminho.lower().endswith(('.xls', '.xlsx')):
-                caminho += '.xlsx'
-                print(f"Adicionada extensão .xlsx ao caminho de saída: {caminho}")
-            
-            # Cria diretório se não existir
-            output_dir = os.path.dirname(caminho)
-            if output_dir and not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-                print(f"Diretório criado: {output_dir}")
-            elif output_dir:
-                print(f"Diretório de saída existe: {output_dir}")
-            
-            # Verifica permissões de escrita
-            if output_dir and not os.access(output_dir, os.W_OK):
-                raise PermissionError(f"Sem permissão de escrita no diretório: {output_dir}")
-            
-            return caminho
-            
-        except Exception as e:
-            print(f"Erro ao validar caminho de saída: {e}")
-            raise
+    Só o bloco em andamento fica em memória (primeira linha de dados, tipo,
+    usuário, valor, data e forma de pagamento), além do conjunto de movimentações já
+    emitidas. Segue as regras dos motores em lote, exceto quando o mesmo número
+    de movimentação aparece em mais de um bloco: vale o primeiro bloco com
+    itens, com o tipo, o usuário e o valor desse próprio bloco.
     
-    def _processar_linha_dados(self, row: pd.Series, movimentacao: str, tipo_operacao: str) -> Dict[str, Any]:
-        """Processa uma linha de dados da planilha."""
-        # Alteração: Usar apenas o valor principal da movimentação
-        valor_num = parse_valor(row[5])  # Mudando de row[8] para row[5] que é a coluna F
+    Args:
+        linhas: Linhas do relatório (valores por coluna, None para células vazias)
+        contadores: Contadores da execução (opcional), atualizados a cada bloco
         
+    Yields:
+        Registro nas colunas de COLUNAS_REGISTRO (Valor em centavos)
+    """
+    contadores = contadores if contadores is not None else ContadoresExecucao()
+    emitidas = set()
+    mov_mapeamento = None
+    forma_pagamento = None
+    bloco = _novo_bloco(None)
+
+    def finalizar_bloco():
+        contadores['linhas_ignoradas' if bloco['tipo'] == 'Saída' else 'linhas_dados'] += bloco['itens']
+        # Mesmo critério dos motores em lote: só blocos com itens e que não sejam Saída
+        if bloco['primeiro_item'] is None or bloco['tipo'] == 'Saída':
+            return None
+        if bloco['movimentacao'] is None or bloco['movimentacao'] in emitidas:
+            return None
+        emitidas.add(bloco['movimentacao'])
         return {
-            'Movimentação': movimentacao,
-            'Código': str(row[0]).strip(),
-            'Cliente/Fornecedor': str(row[1]).strip() if pd.notna(row[1]) else '',
-            'Documento': str(row[5]).strip() if pd.notna(row[5]) else '',
-            'Valor': valor_num,
-            'Forma de Pagamento': None
+            'Movimentação': bloco['movimentacao'],
+            'Código': bloco['primeiro_item'][0],
+            'Cliente/Fornecedor': bloco['primeiro_item'][1],
+            'Documento': bloco['primeiro_item'][2],
+            'Valor': bloco['valor'],
+            'Forma de Pagamento': forma_pagamento or '',
+            'Usuario': bloco['usuario'],
+            'Data': bloco['data'],
         }
-    
-    def _eh_movimentacao(self, valor: str) -> bool:
-        """Verifica se uma string é um número de movimentação válido."""
-        try:
-            # Extrai apenas os números da string
-            apenas_numeros = ''.join(filter(str.isdigit, str(valor)))
-            return len(apenas_numeros) == 6
-        except:
-            return False
-    
-    def _eh_linha_dados(self, valor: str) -> bool:
-        """Verifica se uma string é um código de linha de dados válido."""
-        try:
-            return valor.isdigit() and len(valor) <= 5
-        except:
-            return False
-    
-    def processar(self) -> None:
-        """Processa a planilha de entrada e gera a saída formatada."""
-        try:
-            print(f"\nIniciando processamento do arquivo: {self.caminho_entrada}")
-            df = pd.read_excel(self.caminho_entrada, header=None)
-            print(f"Arquivo lido com sucesso. Total de linhas: {len(df)}")
-            
-            bloco_atual = []
-            movimentacao_atual = None
-            tipo_operacao = None
-            forma_pagamento = None
-            usuario_atual = None
-            valor_movimentacao = None
-            
-            total_movimentacoes = 0
-            total_linhas_dados = 0
-            
-            print("\nIniciando processamento linha a linha:")
-
-            for idx, row in df.iterrows():
-                # Verifica se a primeira coluna tem valor
-                if pd.isna(row[0]):
-                    continue
-                    
-                valor_col0 = str(row[0]).strip()
-                
-                # Nova movimentação (6 dígitos)
-                if self._eh_movimentacao(valor_col0):
-                    if bloco_atual:
-                        # Só adiciona o bloco se não for uma operação de Saída
-                        if tipo_operacao != 'Saída':
-                            print(f"\nFinalizando bloco atual. Usuário: '{usuario_atual}'")
-                            for item in bloco_atual:
-                                item['Forma de Pagamento'] = forma_pagamento or ''
-                                item['Usuario'] = usuario_atual or ''
-                                item['Valor'] = valor_movimentacao or 0.0  # Usa o valor da movimentação
-                                print(f"Adicionando item com usuário: '{item['Usuario']}' e valor: {item['Valor']}")
-                                self.dados_formatados.append(item)
-                    
-                    bloco_atual = []
-                    forma_pagamento = None
-                    usuario_atual = None
-                    valor_movimentacao = None
-                    movimentacao_atual = valor_col0
-                    tipo_operacao = None
-                    total_movimentacoes += 1
-                    print(f"\nNova movimentação encontrada: {movimentacao_atual}")
-                    continue
-
-                # Tipo de operação e usuário
-                if pd.notna(row[4]):
-                    valor_col4 = str(row[4]).strip()
-                    if valor_col4 in self.TIPOS_OPERACAO:
-                        tipo_operacao = valor_col4
-                        # Captura o valor da movimentação da coluna F (índice 5)
-                        if pd.notna(row[5]):
-                            valor_str = str(row[5]).strip()
-                            print(f"DEBUG - Valor original: {valor_str}")
-                            
-                            # Verifica se é um valor estornado (case insensitive)
-                            if 'estornado' in valor_str.lower():
-                                print(f"DEBUG - Valor estornado encontrado, convertendo para 0")
-                                valor = 0.0
-                            else:
-                                # Remove caracteres especiais primeiro
-                                valor_str = valor_str.replace('R$', '').strip()
-                                
-                                # Determina se o valor é negativo baseado nos parênteses
-                                is_negativo = '(' in valor_str and ')' in valor_str
-                                
-                                # Remove parênteses após verificar se é negativo
-                                valor_str = valor_str.replace('(', '').replace(')', '').strip()
-                                
-                                # Remove o + se existir
-                                if valor_str.startswith('+'):
-                                    valor_str = valor_str[1:]
-                                
-                                # Converte para float
-                                valor = parse_valor(valor_str)
-                                
-                                # Ajusta o sinal baseado no tipo de operação
-                                if tipo_operacao == 'Entrada':
-                                    # Para entradas, sempre deve ser positivo
-                                    valor = abs(valor)
-                                else:  # Saída
-                                    # Para saídas, sempre deve ser negativo
-                                    valor = -abs(valor)
-                            
-                            print(f"Valor da movimentação capturado: {valor}")
-                        
-                        if pd.notna(row[6]):
-                            usuario_atual = str(row[6]).strip()
-                            print(f"DEBUG - Capturando usuário da linha. Valor encontrado: '{usuario_atual}'")
-                        else:
-                            print("DEBUG - Coluna do usuário está vazia!")
-                        print(f"Tipo de operação definido para movimentação {movimentacao_atual}: {tipo_operacao}")
-                    continue
-
-                # Forma de pagamento
-                if pd.notna(row[0]) and str(row[0]).strip() in self.FORMAS_PAGAMENTO_VALIDAS:
-                    forma_pagamento = str(row[0]).strip()
-                    print(f"Forma de pagamento definida para movimentação {movimentacao_atual}: {forma_pagamento}")
-                    continue
-
-                # Linhas de dados (códigos de até 5 dígitos)
-                if self._eh_linha_dados(valor_col0):
-                    print(f"\nCódigo de linha de dados encontrado: {valor_col0}")
-                    if movimentacao_atual and tipo_operacao and tipo_operacao != 'Saída':
-                        novo_item = {
-                            'Movimentação': movimentacao_atual,
-                            'Código': str(row[0]).strip(),
-                            'Cliente/Fornecedor': str(row[1]).strip() if pd.notna(row[1]) else '',
-                            'Documento': str(row[5]).strip() if pd.notna(row[5]) else '',
-                            'Valor': 0.0,  # Será atualizado depois com valor_movimentacao
-                            'Forma de Pagamento': None,
-                            'Usuario': usuario_atual
-                        }
-                        print(f"DEBUG - Adicionando linha de dados com usuário: '{usuario_atual}'")
-                        bloco_atual.append(novo_item)
-                        total_linhas_dados += 1
-                        print(f"Linha de dados processada. Total atual: {total_linhas_dados}")
-                    else:
-                        print(f"AVISO: Linha de dados ignorada - movimentação: {movimentacao_atual}, tipo_operacao: {tipo_operacao}")
-
-            # Processa o último bloco
-            if bloco_atual and tipo_operacao != 'Saída':
-                print(f"\nProcessando último bloco. Usuário: '{usuario_atual}'")
-                for item in bloco_atual:
-                    item['Forma de Pagamento'] = forma_pagamento or ''
-                    item['Usuario'] = usuario_atual or ''
-                    item['Valor'] = valor_movimentacao or 0.0  # Usa o valor da movimentação
-                    print(f"Adicionando último item com usuário: '{item['Usuario']}' e valor: {item['Valor']}")
-                    self.dados_formatados.append(item)
-
-            print(f"\nResumo do processamento:")
-            print(f"Total de movimentações encontradas: {total_movimentacoes}")
-            print(f"Total de linhas de dados processadas: {total_linhas_dados}")
-            print(f"Total de registros formatados: {len(self.dados_formatados)}")
-
-            # Debug: Mostra todos os registros formatados
-            print("\nTodos os registros formatados:")
-            for idx, item in enumerate(self.dados_formatados):
-                print(f"Registro {idx}:")
-                print(f"  Movimentação: {item['Movimentação']}")
-                print(f"  Usuário: '{item['Usuario']}'")
-                print(f"  Valor: {item['Valor']}")
-                print(f"  Outros dados: {item}")
-
-            self._salvar_resultado()
-            
-        except Exception as e:
-            print(f"Erro ao ler o arquivo de entrada: {e}")
-            return
-    
-    def _salvar_resultado(self) -> None:
-        """Salva o resultado processado em um arquivo Excel."""
-        if not self.dados_formatados:
-            print("\nNenhum dado para processar. Verifique se:")
-            print("1. A planilha contém movimentações (números de 6 dígitos)")
-            print("2. Cada movimentação tem um tipo de operação (Entrada/Saída)")
-            print("3. Existem linhas de dados (códigos de até 5 dígitos)")
-            print("4. A estrutura da planilha está no formato esperado")
-            return
-            
-        try:
-            print(f"\nPreparando dados para salvar em: {self.caminho_saida}")
-            
-            colunas = [
-                'Movimentação', 'Código', 'Cliente/Fornecedor',
-                'Documento', 'Valor', 'Forma de Pagamento', 'Usuario'
-            ]
-            
-            df_formatado = pd.DataFrame(self.dados_formatados, columns=colunas)
-            print(f"Dados antes do agrupamento: {len(df_formatado)} linhas")
-            print("\nPrimeiras linhas antes do agrupamento:")
-            print(df_formatado.head())
-            
-            # Agrupa por movimentação
-            df_agrupado = df_formatado.groupby(['Movimentação']).agg({
-                'Código': 'first',
-                'Cliente/Fornecedor': 'first',
-                'Documento': 'first',
-                'Valor': 'first',
-                'Forma de Pagamento': 'first',
-                'Usuario': 'first'
-            }).reset_index()
-            
-            print(f"\nDados após agrupamento: {len(df_agrupado)} linhas")
-            print("\nPrimeiras linhas após agrupamento:")
-            print(df_agrupado.head())
-            
-            # Adiciona coluna Filial usando o usuário e remove Documento
-            print("\nAplicando função extrair_loja para determinar a Filial:")
-            df_agrupado['Filial'] = df_agrupado['Usuario'].apply(extrair_loja)
-            print("\nPrimeiras linhas após determinar Filial:")
-            print(df_agrupado[['Usuario', 'Filial']].head())
-            
-            df_agrupado.drop(columns=['Documento', 'Usuario'], inplace=True)
-            
-            # Reorganiza as colunas
-            colunas_saida = [
-                'Movimentação', 'Código', 'Cliente/Fornecedor',
-                'Filial', 'Valor', 'Forma de Pagamento'
-            ]
-            
-            print(f"Salvando arquivo em: {self.caminho_saida}")
-            
-            # Tenta criar um arquivo temporário primeiro
-            temp_file = self.caminho_saida + '.temp'
-            df_agrupado.to_excel(
-                temp_file,
-                index=False,
-                columns=colunas_saida,
-                engine='openpyxl'
-            )
-            
-            # Se chegou aqui, o arquivo temporário foi criado com sucesso
-            # Agora move para o arquivo final
-            if os.path.exists(self.caminho_saida):
-                os.remove(self.caminho_saida)
-            os.rename(temp_file, self.caminho_saida)
-            
-            print(f"Arquivo salvo com sucesso!")
-            print(f"Caminho completo: {os.path.abspath(self.caminho_saida)}")
-            
-            # Verifica se o arquivo realmente existe
-            if os.path.exists(self.caminho_saida):
-                tamanho = os.path.getsize(self.caminho_saida)
-                print(f"Arquivo criado com {tamanho:,} bytes")
-            else:
-                raise FileNotFoundError("Arquivo não encontrado após salvamento")
-                
-        except Exception as e:
-            print(f"\nErro ao salvar o arquivo de saída:")
-            print(f"Tipo do erro: {type(e).__name__}")
-            print(f"Descrição: {str(e)}")
-            print(f"Caminho tentado: {self.caminho_saida}")
-            raise
-
-def transformar_planilha(caminho_entrada: str, caminho_saida: str) -> None:
+
+    for linha in linhas:
+        preenchida0 = not _celula_vazia(linha, 0)
+        texto0 = _texto_celula(linha, 0)
+        texto4 = _texto_celula(linha, 4)
+
+        # Tipo, usuário e valor (movimentação identificada apenas pelos dígitos)
+        if preenchida0:
+            apenas_numeros = ''.join(filter(str.isdigit, texto0))
+            if len(apenas_numeros) == 6:
+                mov_mapeamento = apenas_numeros
+        eh_tipo = texto4 in TIPOS_OPERACAO and mov_mapeamento is not None
+        if eh_tipo and 'estornado' in _texto_celula(linha, 5).lower():
+            contadores['estornos'] += 1
+
+        # Nova movimentação (6 dígitos)
+        if preenchida0 and texto0.isdigit() and len(texto0) == 6:
+            registro = finalizar_bloco()
+            if registro is not None:
+                yield registro
+            # A forma de pagamento só é reiniciada quando o bloco anterior teve itens
+            if bloco['primeiro_item'] is not None and bloco['tipo'] != 'Saída':
+                forma_pagamento = None
+            bloco = _novo_bloco(texto0)
+            contadores['movimentacoes'] += 1
+            if eh_tipo and mov_mapeamento == texto0:
+                _atualizar_tipo_bloco(bloco, linha, texto4)
+            continue
+
+        if eh_tipo and mov_mapeamento == bloco['movimentacao']:
+            _atualizar_tipo_bloco(bloco, linha, texto4)
+
+        if texto0 in FORMAS_PAGAMENTO_VALIDAS:
+            forma_pagamento = texto0
+            continue
+
+        # Linhas de dados: só a primeira do bloco sobrevive ao agrupamento
+        if texto0.isdigit() and len(texto0) <= 5:
+            bloco['itens'] += 1
+            if bloco['primeiro_item'] is None:
+                bloco['primeiro_item'] = (texto0, _texto_celula(linha, 1), _texto_celula(linha, 5))
+
+    registro = finalizar_bloco()
+    if registro is not None:
+        yield registro
+
+def _em_lotes(itens: Iterable[Any], tamanho: int) -> Iterator[List[Any]]:
+    lote = []
+    for item in itens:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def _contar_usuarios_desconhecidos(df: pd.DataFrame, contadores: ContadoresExecucao) -> None:
+    """Conta as movimentações com usuário preenchido que não corresponde a nenhuma loja."""
+    desconhecidos = (df['Usuario'].fillna('') != '') & (df['Filial'] == '')
+    contadores['usuarios_desconhecidos'] += int(desconhecidos.sum())
+    if logger.isEnabledFor(logging.DEBUG) and desconhecidos.any():
+        logger.debug("Usuários sem loja: %s", sorted(df.loc[desconhecidos, 'Usuario'].unique()))
+
+def _transformar_streaming(
+    caminho_entrada: str,
+    caminho_saida: Optional[str],
+    escritor: Optional[EscritorPlanilha] = None,
+    contadores: Optional[ContadoresExecucao] = None,
+    progresso: Optional[Progresso] = None,
+    tamanho_lote: int = TAMANHO_LOTE_STREAMING,
+    coletar: Optional[List[pd.DataFrame]] = None
+) -> int:
     """
-    Transforma a planilha HTML desformatada em um formato estruturado.
+    Pipeline em streaming: leitor de linhas → blocos → registros → escrita em lotes.
+    
+    A memória depende do tamanho do lote, não do arquivo. As movimentações
+    saem na ordem do relatório (os motores em lote ordenam pelo número).
     
     Args:
-        caminho_entrada: Caminho do arquivo de entrada
-        caminho_saida: Caminho onde será salvo o arquivo processado
+        caminho_entrada: Caminho do relatório de caixa
+        caminho_saida: Caminho final da planilha formatada (None = não grava)
+        escritor: Escritor da planilha de saída (None = streaming)
+        contadores: Contadores da execução (opcional)
+        progresso: Acompanhamento pela leitura do arquivo e cancelamento (opcional)
+        tamanho_lote: Registros por escrita
+        coletar: Lista que recebe cada lote (COLUNAS_SAIDA_FORMATADA, Valor em centavos)
+        
+    Returns:
+        Quantidade de movimentações processadas
     """
+    escritor = escritor or obter_escritor()
+    contadores = contadores if contadores is not None else ContadoresExecucao()
+    caminho_temp = caminho_temporario(caminho_saida) if caminho_saida else None
+    total = 0
+    planilha = None
+    try:
+        if caminho_temp:
+            planilha = escritor.abrir(caminho_temp, COLUNAS_SAIDA_FORMATADA)
+        registros = gerar_registros_movimentacao(ler_linhas(caminho_entrada, progresso), contadores)
+        for lote in _em_lotes(registros, tamanho_lote):
+            df_lote = pd.DataFrame(lote, columns=COLUNAS_REGISTRO)
+            df_lote['Filial'] = resolver_lojas(df_lote['Usuario'])
+            _contar_usuarios_desconhecidos(df_lote, contadores)
+            if coletar is not None:
+                coletar.append(df_lote[COLUNAS_SAIDA_FORMATADA])
+            if planilha is not None:
+                planilha.escrever(df_lote[COLUNAS_SAIDA_FORMATADA].assign(Valor=centavos_para_reais(df_lote['Valor'])))
+            total += len(df_lote)
+        if planilha is not None:
+            iniciar_fase(progresso, FASE_GRAVACAO)
+            planilha.fechar()
+            if progresso is not None:
+                progresso.verificar()
+            os.replace(caminho_temp, caminho_saida)
+            planilha = None
+    except Exception:
+        if planilha is not None:
+            planilha.descartar()
+        if caminho_temp and os.path.exists(caminho_temp):
+            os.remove(caminho_temp)
+        raise
+    return total
+
+def _caminho_saida_xlsx(caminho_saida: str) -> str:
+    """Acrescenta a extensão .xlsx quando falta e cria a pasta de destino."""
     if not caminho_saida.lower().endswith(('.xls', '.xlsx')):
         caminho_saida += '.xlsx'
-        print(f"Adicionada extensão .xlsx ao caminho de saída: {caminho_saida}")
+        logger.debug("Adicionada extensão .xlsx ao caminho de saída: %s", caminho_saida)
     
     output_dir = os.path.dirname(caminho_saida)
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
-        print(f"Diretório criado: {output_dir}")
+        logger.info("Diretório criado: %s", output_dir)
+    return caminho_saida
 
-    try:
-        print(f"\nIniciando processamento do arquivo: {caminho_entrada}")
-        df = pd.read_excel(caminho_entrada, header=None)
-        print(f"Arquivo lido com sucesso. Total de linhas: {len(df)}")
-        
-        # Primeiro, vamos mapear os usuários e valores para cada movimentação
-        print("\nMapeando usuários e valores para cada movimentação...")
-        usuarios_por_movimentacao = {}
-        valores_por_movimentacao = {}
-        tipos_por_movimentacao = {}
-        movimentacao_atual = None
+def _novos_contadores() -> ContadoresExecucao:
+    return ContadoresExecucao(
+        movimentacoes=0, linhas_dados=0, linhas_ignoradas=0,
+        estornos=0, usuarios_desconhecidos=0, registros=0, erros=0
+    )
+
+def _juntar_lotes(lotes: List[pd.DataFrame]) -> pd.DataFrame:
+    """Planilha formatada a partir dos lotes do motor streaming (vazia, mas tipada, sem lotes)."""
+    if not lotes:
+        return pd.DataFrame({coluna: pd.Series(dtype='int64' if coluna == 'Valor' else object)
+                             for coluna in COLUNAS_SAIDA_FORMATADA})
+    return pd.concat(lotes, ignore_index=True)
+
+# Versão da leitura do relatório guardada no cache; mudar os motores exige incrementar
+VERSAO_LEITURA_CAIXA = '2'
+
+def _montar_planilha_formatada(
+    caminho_entrada: str,
+    motor: str,
+    contadores: ContadoresExecucao,
+    progresso: Optional[Progresso] = None
+) -> pd.DataFrame:
+    """Lê o relatório e monta a planilha formatada (Valor em centavos) com um motor em lote, sem gravar."""
+    df = ler_planilha_caixa(caminho_entrada, progresso)
+    logger.debug("Arquivo lido com sucesso. Total de linhas: %d", len(df))
+    
+    if motor == 'linha_a_linha':
+        df_formatado = _montar_registros_linha_a_linha(df, contadores, progresso)
+    else:
+        iniciar_fase(progresso, FASE_PROCESSAMENTO)
+        df_formatado = _montar_registros_vetorizado(df, contadores)
+
+    logger.debug("Primeiras linhas antes do agrupamento:\n%s", df_formatado.head())
+
+    df_agrupado = df_formatado.groupby(['Movimentação']).agg({
+        'Código': 'first',
+        'Cliente/Fornecedor': 'first',
+        'Documento': 'first',
+        'Valor': 'first',  # Mantém o primeiro valor já que todos são iguais
+        'Forma de Pagamento': 'first',
+        'Usuario': 'first',
+        'Data': 'first'
+    }).reset_index()
+
+    logger.debug("Dados após agrupamento: %d linhas\n%s", len(df_agrupado), df_agrupado.head())
+    
+    # Cria a nova coluna "Filial" usando o usuário
+    df_agrupado['Filial'] = resolver_lojas(df_agrupado['Usuario'])
+    _contar_usuarios_desconhecidos(df_agrupado, contadores)
+    logger.debug("Filial determinada pelo usuário:\n%s", df_agrupado[['Usuario', 'Filial']].head())
+    
+    # Elimina as colunas "Documento" e "Usuario"
+    return df_agrupado[COLUNAS_SAIDA_FORMATADA]
+
+def gerar_planilha_formatada(
+    caminho_entrada: str,
+    caminho_saida: Optional[str] = None,
+    motor: str = 'vetorizado',
+    escritor: Optional[EscritorPlanilha] = None,
+    progresso: Optional[Progresso] = None,
+    contadores: Optional[ContadoresExecucao] = None,
+    cache: Optional[CacheLeituras] = None
+) -> pd.DataFrame:
+    """
+    Monta a planilha formatada em memória e, opcionalmente, grava o arquivo.
+    
+    É a etapa 1 sem a volta pelo .xlsx: o resultado pode ir direto para
+    compare_movements.cruzar_planilhas_movimentacao, e o arquivo fica só
+    para conferência.
+    
+    Args:
+        caminho_entrada: Caminho do relatório de caixa
+        caminho_saida: Caminho da planilha formatada (None = não grava)
+        motor: 'vetorizado' (padrão), 'linha_a_linha' ou 'streaming'
+        escritor: Escritor da planilha de saída (None = streaming, ver excel_writer.obter_escritor)
+        progresso: Recebe o andamento e permite cancelar (ver progress.Progresso)
+        contadores: Contadores da execução, atualizados pela transformação (opcional)
+        cache: Cache dos relatórios já processados (None = sempre processa, ver parse_cache).
+            O motor streaming não usa o cache: ele lê e grava bloco a bloco
         
-        for idx, row in df.iterrows():
-            # Se é uma nova movimentação
-            if pd.notna(row[0]):
-                # Extrai apenas os números da string
-                apenas_numeros = ''.join(filter(str.isdigit, str(row[0]).strip()))
-                if len(apenas_numeros) == 6:
-                    movimentacao_atual = apenas_numeros
-                    
-            # Se é uma linha de tipo de operação com usuário e valor
-            if pd.notna(row[4]) and str(row[4]).strip() in ['Entrada', 'Saída']:
-                if movimentacao_atual:
-                    tipo_operacao = str(row[4]).strip()
-                    tipos_por_movimentacao[movimentacao_atual] = tipo_operacao
-                    
-                    # Captura o usuário
-                    if pd.notna(row[6]):
-                        usuarios_por_movimentacao[movimentacao_atual] = str(row[6]).strip()
-                    
-                    # Captura o valor
-                    if pd.notna(row[5]):
-                        valor_str = str(row[5]).strip()
-                        print(f"DEBUG - Valor original para movimentação {movimentacao_atual}: {valor_str}")
-                        
-                        # Verifica se é um valor estornado (case insensitive)
-                        if 'estornado' in valor_str.lower():
-                            print(f"DEBUG - Valor estornado encontrado, convertendo para 0")
-                            valor = 0.0
-                        else:
-                            # Remove caracteres especiais primeiro
-                            valor_str = valor_str.replace('R$', '').strip()
-                            
-                            # Determina se o valor é negativo baseado nos parênteses
-                            is_negativo = '(' in valor_str and ')' in valor_str
-                            
-                            # Remove parênteses após verificar se é negativo
-                            valor_str = valor_str.replace('(', '').replace(')', '').strip()
-                            
-                            # Remove o + se existir
-                            if valor_str.startswith('+'):
-                                valor_str = valor_str[1:]
-                        
-                            # Converte para float
-                            valor = parse_valor(valor_str)
-                        
-                            # Ajusta o sinal baseado no tipo de operação
-                            if tipo_operacao == 'Entrada':
-                                # Para entradas, sempre deve ser positivo
-                                valor = abs(valor)
-                            else:  # Saída
-                                # Para saídas, sempre deve ser negativo
-                                valor = -abs(valor)
-                        
-                        valores_por_movimentacao[movimentacao_atual] = valor
-                        print(f"Valor capturado para movimentação {movimentacao_atual}: {valor} (Tipo: {tipo_operacao})")
-
-        dados_formatados = []
-        bloco_atual = []
-        movimentacao_atual = None
-        tipo_operacao = None
-        forma_pagamento = None
-
-        for i, row in df.iterrows():
-            # Identifica nova movimentação
-            if pd.notna(row[0]) and str(row[0]).strip().isdigit() and len(str(row[0]).strip()) == 6:
-                if bloco_atual:
-                    # Só processa se não for uma operação de Saída
-                    if tipos_por_movimentacao.get(movimentacao_atual) != 'Saída':
-                        usuario_atual = usuarios_por_movimentacao.get(movimentacao_atual, '')
-                        valor_atual = valores_por_movimentacao.get(movimentacao_atual, 0.0)
-                        print(f"\nFinalizando bloco atual. Usuário: '{usuario_atual}', Valor: {valor_atual}")
-                        for item in bloco_atual:
-                            item['Forma de Pagamento'] = forma_pagamento if forma_pagamento else ''
-                            item['Usuario'] = usuario_atual
-                            item['Valor'] = valor_atual
-                            print(f"Adicionando item com usuário: '{item['Usuario']}' e valor: {item['Valor']}")
-                            dados_formatados.append(item)
-                    bloco_atual = []
-                    forma_pagamento = None
-
-                movimentacao_atual = str(row[0]).strip()
-                tipo_operacao = tipos_por_movimentacao.get(movimentacao_atual)
-                print(f"\nNova movimentação encontrada: {movimentacao_atual}")
-                continue
-
-            # Captura forma de pagamento
-            if pd.notna(row[0]) and str(row[0]).strip() in ProcessadorPlanilha.FORMAS_PAGAMENTO_VALIDAS:
-                forma_pagamento = str(row[0]).strip()
-                print(f"Forma de pagamento definida para movimentação {movimentacao_atual}: {forma_pagamento}")
-                continue
-
-            # Linhas de dados (códigos de até 5 dígitos)
-            if pd.notna(row[0]) and str(row[0]).strip().isdigit() and len(str(row[0]).strip()) <= 5:
-                # Só processa se não for uma operação de Saída
-                if tipo_operacao != 'Saída':
-                    novo_item = {
-                        'Movimentação': movimentacao_atual,
-                        'Código': str(row[0]).strip(),
-                        'Cliente/Fornecedor': str(row[1]).strip() if pd.notna(row[1]) else '',
-                        'Documento': str(row[5]).strip() if pd.notna(row[5]) else '',
-                        'Valor': valores_por_movimentacao.get(movimentacao_atual, 0.0),
-                        'Forma de Pagamento': None,
-                        'Usuario': usuarios_por_movimentacao.get(movimentacao_atual, '')
-                    }
-                    print(f"DEBUG - Adicionando linha de dados com usuário: '{novo_item['Usuario']}' e valor: {novo_item['Valor']}")
-                    bloco_atual.append(novo_item)
-
-        # Processa o último bloco
-        if bloco_atual and tipos_por_movimentacao.get(movimentacao_atual) != 'Saída':
-            usuario_atual = usuarios_por_movimentacao.get(movimentacao_atual, '')
-            valor_atual = valores_por_movimentacao.get(movimentacao_atual, 0.0)
-            print(f"\nProcessando último bloco. Usuário: '{usuario_atual}', Valor: {valor_atual}")
-            for item in bloco_atual:
-                item['Forma de Pagamento'] = forma_pagamento if forma_pagamento else ''
-                item['Usuario'] = usuario_atual
-                item['Valor'] = valor_atual
-                print(f"Adicionando último item com usuário: '{item['Usuario']}' e valor: {item['Valor']}")
-                dados_formatados.append(item)
-
-        colunas = [
-            'Movimentação', 'Código', 'Cliente/Fornecedor',
-            'Documento', 'Valor', 'Forma de Pagamento', 'Usuario'
-        ]
+    Returns:
+        DataFrame com COLUNAS_SAIDA_FORMATADA e Valor em centavos (int64)
         
-        print(f"\nCriando DataFrame com {len(dados_formatados)} registros")
-        df_formatado = pd.DataFrame(dados_formatados, columns=colunas)
-        print("\nPrimeiras linhas antes do agrupamento:")
-        print(df_formatado.head())
-
-        df_agrupado = df_formatado.groupby(['Movimentação']).agg({
-            'Código': 'first',
-            'Cliente/Fornecedor': 'first',
-            'Documento': 'first',
-            'Valor': 'first',  # Mantém o primeiro valor já que todos são iguais
-            'Forma de Pagamento': 'first',
-            'Usuario': 'first'
-        }).reset_index()
-
-        print(f"\nDados após agrupamento: {len(df_agrupado)} linhas")
-        print("\nPrimeiras linhas após agrupamento:")
-        print(df_agrupado.head())
+    Raises:
+        ValueError: Se o motor for inválido
+        OperacaoCancelada: Se o cancelamento for pedido (nenhum arquivo parcial é deixado)
+    """
+    if motor not in MOTORES_TRANSFORMACAO:
+        raise ValueError(f"Motor inválido: {motor}. Use um de: {', '.join(MOTORES_TRANSFORMACAO)}")
+    contadores = contadores if contadores is not None else _novos_contadores()
+    if caminho_saida:
+        caminho_saida = _caminho_saida_xlsx(caminho_saida)
+
+    logger.info("Iniciando processamento do arquivo: %s (motor: %s)", caminho_entrada, motor)
+
+    if motor == 'streaming':
+        if cache is not None:
+            logger.debug("O motor streaming não usa o cache de leituras")
+        lotes: List[pd.DataFrame] = []
+        contadores['registros'] = _transformar_streaming(
+            caminho_entrada, caminho_saida, escritor, contadores, progresso, coletar=lotes
+        )
+        if caminho_saida:
+            logger.info("Planilha formatada salva com sucesso em: %s", caminho_saida)
+        return _juntar_lotes(lotes)
+
+    def carregar():
+        parciais = ContadoresExecucao()
+        return _montar_planilha_formatada(caminho_entrada, motor, parciais, progresso), dict(parciais)
+
+    # A loja vem da configuração, então as regras de loja fazem parte da chave do cache
+    contexto = f'{motor}|{obter_resolvedor_lojas().regras!r}' if cache is not None else ''
+    df_formatada, contadores_leitura = ler_com_cache(
+        cache, 'caixa', caminho_entrada, VERSAO_LEITURA_CAIXA, carregar, contexto
+    )
+    contadores.update(contadores_leitura)
+
+    if caminho_saida:
+        iniciar_fase(progresso, FASE_GRAVACAO)
+        salvar_atomicamente(
+            escritor, df_formatada.assign(Valor=centavos_para_reais(df_formatada['Valor'])),
+            caminho_saida, progresso=progresso
+        )
+        logger.info("Planilha formatada salva com sucesso em: %s", caminho_saida)
+    contadores['registros'] = len(df_formatada)
+    return df_formatada
+
+def transformar_planilha(
+    caminho_entrada: str,
+    caminho_saida: str,
+    motor: str = 'vetorizado',
+    escritor: Optional[EscritorPlanilha] = None,
+    progresso: Optional[Progresso] = None,
+    cache: Optional[CacheLeituras] = None
+) -> ContadoresExecucao:
+    """
+    Transforma a planilha HTML desformatada em um formato estruturado.
+    
+    Args:
+        caminho_entrada: Caminho do arquivo de entrada
+        caminho_saida: Caminho onde será salvo o arquivo processado
+        motor: 'vetorizado' (padrão), 'linha_a_linha' (motor de referência) ou
+            'streaming' (memória limitada, saída na ordem do arquivo)
+        escritor: Escritor da planilha de saída (None = streaming, ver excel_writer.obter_escritor)
+        progresso: Recebe o andamento e permite cancelar (ver progress.Progresso)
+        cache: Cache dos relatórios já processados (None = sempre processa, ver parse_cache;
+            o motor streaming não o usa)
         
-        # Cria a nova coluna "Filial" usando o usuário
-        print("\nAplicando função extrair_loja para determinar a Filial:")
-        df_agrupado['Filial'] = df_agrupado['Usuario'].apply(extrair_loja)
-        print("\nPrimeiras linhas após determinar Filial:")
-        print(df_agrupado[['Usuario', 'Filial']].head())
+    Returns:
+        Contadores da execução (movimentações, linhas de dados, linhas ignoradas,
+        estornos, usuários desconhecidos, registros gravados e erros; os erros
+        são registrados no log e não interrompem quem chamou)
         
-        # Elimina as colunas "Documento" e "Usuario"
-        df_agrupado.drop(columns=['Documento', 'Usuario'], inplace=True)
-
-        # Reorganize as colunas conforme desejar
-        colunas_saida = [
-            'Movimentação', 'Código', 'Cliente/Fornecedor',
-            'Filial', 'Valor', 'Forma de Pagamento'
-        ]
-
-        try:
-            df_agrupado.to_excel(caminho_saida, index=False, columns=colunas_saida, engine='openpyxl')
-            print(f"Planilha formatada salva com sucesso em: {caminho_saida}")
-        except Exception as e:
-            print(f"Erro ao salvar o arquivo de saída: {e}")
+    Raises:
+        OperacaoCancelada: Se o cancelamento for pedido (nenhum arquivo parcial é deixado)
+    """
+    if motor not in MOTORES_TRANSFORMACAO:
+        raise ValueError(f"Motor inválido: {motor}. Use um de: {', '.join(MOTORES_TRANSFORMACAO)}")
+
+    contadores = _novos_contadores()
+    try:
+        if motor == 'streaming':
+            # Sem montar a tabela: cada lote vai direto para o arquivo e é descartado
+            caminho_saida = _caminho_saida_xlsx(caminho_saida)
+            logger.info("Iniciando processamento do arquivo: %s (motor: %s)", caminho_entrada, motor)
+            contadores['registros'] = _transformar_streaming(
+                caminho_entrada, caminho_saida, escritor, contadores, progresso
+            )
+            logger.info("Planilha formatada salva com sucesso em: %s", caminho_saida)
+        else:
+            gerar_planilha_formatada(caminho_entrada, caminho_saida, motor, escritor, progresso, contadores, cache)
+    except OperacaoCancelada:
+        logger.info("Transformação cancelada")
+        raise
     except Exception as e:
-        print(f"Erro ao ler o arquivo de entrada: {e}")
-        return
\ No newline at end of file
+        contadores['erros'] += 1
+        logger.error("Erro ao processar o arquivo de entrada: %s", e)
+    contadores.registrar_resumo(logger, "Resumo da transformação")
+    return contadores
@@ -0,0 +1,451 @@
+import codecs
+import csv
+import os
+import re
+import numpy as np
+import pandas as pd
+from html.parser import HTMLParser
+from typing import Iterator, List, Optional
+from log_config import obter_logger
+from progress import Progresso, iniciar_fase
+
+logger = obter_logger('input_reader')
+
+FORMATO_HTML = 'html'
+FORMATO_XLS = 'xls'
+FORMATO_XLSX = 'xlsx'
+FORMATO_CSV = 'csv'
+
+ASSINATURA_ZIP = b'PK\x03\x04'
+ASSINATURA_OLE2 = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+TAMANHO_AMOSTRA = 64 * 1024
+TAMANHO_BLOCO_LEITURA = 256 * 1024
+
+# Linhas lidas entre duas atualizações de progresso nos leitores linha a linha
+LINHAS_POR_PROGRESSO = 1000
+
+FASE_LEITURA = 'Lendo o relatório'
+
+# Exportações do ERP sem charset declarado costumam vir em latin-1; cp1252 é um
+# superconjunto que também cobre aspas e travessões do Windows
+CODIFICACAO_PADRAO = 'cp1252'
+
+_PADRAO_CHARSET = re.compile(rb'''charset\s*=\s*["']?\s*([A-Za-z0-9_:.-]+)''', re.IGNORECASE)
+_PADRAO_HTML = re.compile(rb'<\s*(!doctype\s+html|html|table|tr|td|meta)\b', re.IGNORECASE)
+
+def _ler_amostra(caminho: str, tamanho: int = TAMANHO_AMOSTRA) -> bytes:
+    with open(caminho, 'rb') as arquivo:
+        return arquivo.read(tamanho)
+
+def detectar_formato(caminho: str) -> str:
+    """
+    Identifica o formato real do arquivo pelos primeiros bytes, ignorando a extensão.
+
+    Args:
+        caminho: Caminho do arquivo
+
+    Returns:
+        'xlsx', 'xls', 'html' ou 'csv'
+    """
+    amostra = _ler_amostra(caminho, 4096)
+    if amostra.startswith(ASSINATURA_ZIP):
+        return FORMATO_XLSX
+    if amostra.startswith(ASSINATURA_OLE2):
+        return FORMATO_XLS
+
+    texto = amostra
+    for bom in (codecs.BOM_UTF8, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+        if texto.startswith(bom):
+            codificacao = 'utf-8' if bom == codecs.BOM_UTF8 else 'utf-16'
+            texto = amostra.decode(codificacao, errors='ignore').encode('ascii', errors='ignore')
+            break
+    if texto.lstrip().startswith(b'<') and _PADRAO_HTML.search(texto):
+        return FORMATO_HTML
+    return FORMATO_CSV
+
+def detectar_codificacao(caminho: str) -> str:
+    """
+    Detecta a codificação de arquivos de texto (HTML ou CSV).
+
+    Ordem: BOM, charset declarado no HTML, UTF-8 válido e, por fim, cp1252/latin-1.
+
+    Args:
+        caminho: Caminho do arquivo
+
+    Returns:
+        Nome da codificação
+    """
+    amostra = _ler_amostra(caminho)
+    if amostra.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if amostra.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+
+    declarado = _PADRAO_CHARSET.search(amostra)
+    if declarado:
+        nome = declarado.group(1).decode('ascii', errors='ignore')
+        try:
+            return codecs.lookup(nome).name
+        except LookupError:
+            pass
+
+    try:
+        amostra.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as erro:
+        # Caractere multibyte cortado no fim da amostra ainda é UTF-8 válido
+        if erro.start >= len(amostra) - 3 and len(amostra) == TAMANHO_AMOSTRA:
+            return 'utf-8'
+    return CODIFICACAO_PADRAO
+
+class _LeitorLinhasHTML(HTMLParser):
+    """
+    Parser incremental de tabelas HTML: acumula apenas a linha em andamento.
+
+    Células mescladas com colspan ocupam a primeira coluna e deixam as demais
+    vazias, como o Excel faz ao abrir o arquivo. rowspan não é expandido.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.linhas_prontas: List[List[Optional[str]]] = []
+        self._linha: Optional[List[Optional[str]]] = None
+        self._celula: Optional[List[str]] = None
+        self._colspan = 1
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tr':
+            self._fechar_linha()
+            self._linha = []
+        elif tag in ('td', 'th'):
+            self._fechar_celula()
+            if self._linha is None:
+                self._linha = []
+            self._celula = []
+            try:
+                self._colspan = max(1, int(dict(attrs).get('colspan') or 1))
+            except ValueError:
+                self._colspan = 1
+        elif tag == 'br' and self._celula is not None:
+            self._celula.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in ('td', 'th'):
+            self._fechar_celula()
+        elif tag in ('tr', 'table'):
+            self._fechar_linha()
+
+    def handle_data(self, data):
+        if self._celula is not None:
+            self._celula.append(data)
+
+    def _fechar_celula(self):
+        if self._celula is None:
+            return
+        texto = ' '.join(''.join(self._celula).split())
+        self._linha.append(texto if texto else None)
+        self._linha.extend([None] * (self._colspan - 1))
+        self._celula = None
+        self._colspan = 1
+
+    def _fechar_linha(self):
+        self._fechar_celula()
+        if self._linha is not None:
+            self.linhas_prontas.append(self._linha)
+            self._linha = None
+
+    def close(self):
+        super().close()
+        self._fechar_linha()
+
+def ler_linhas_html(
+    caminho: str,
+    codificacao: Optional[str] = None,
+    progresso: Optional[Progresso] = None
+) -> Iterator[List[Optional[str]]]:
+    """
+    Lê as linhas de tabela de um HTML em blocos, sem montar o DOM completo.
+
+    Args:
+        caminho: Caminho do arquivo HTML (mesmo com extensão .xls)
+        codificacao: Codificação do arquivo (None = detectar)
+        progresso: Recebe os bytes lidos do arquivo (opcional)
+
+    Yields:
+        Lista com o texto de cada célula (None para células vazias)
+    """
+    codificacao = codificacao or detectar_codificacao(caminho)
+    decodificador = codecs.getincrementaldecoder(codificacao)(errors='replace')
+    parser = _LeitorLinhasHTML()
+    tamanho = os.path.getsize(caminho)
+
+    with open(caminho, 'rb') as arquivo:
+        while True:
+            bloco = arquivo.read(TAMANHO_BLOCO_LEITURA)
+            if progresso is not None:
+                progresso.definir(arquivo.tell(), tamanho)
+            parser.feed(decodificador.decode(bloco, final=not bloco))
+            if parser.linhas_prontas:
+                yield from parser.linhas_prontas
+                parser.linhas_prontas = []
+            if not bloco:
+                break
+    parser.close()
+    yield from parser.linhas_prontas
+
+def _dialeto_csv(amostra: str):
+    try:
+        return csv.Sniffer().sniff(amostra, delimiters=';,\t|')
+    except csv.Error:
+        # Padrão das exportações brasileiras
+        class _PontoEVirgula(csv.excel):
+            delimiter = ';'
+        return _PontoEVirgula
+
+def ler_linhas_csv(
+    caminho: str,
+    codificacao: Optional[str] = None,
+    progresso: Optional[Progresso] = None
+) -> Iterator[List[Optional[str]]]:
+    """
+    Lê as linhas de um CSV detectando codificação e separador.
+
+    Yields:
+        Lista com o texto de cada célula (None para células vazias)
+    """
+    codificacao = codificacao or detectar_codificacao(caminho)
+    tamanho = os.path.getsize(caminho)
+    with open(caminho, 'r', encoding=codificacao, errors='replace', newline='') as arquivo:
+        dialeto = _dialeto_csv(arquivo.read(TAMANHO_AMOSTRA))
+        arquivo.seek(0)
+        for indice, linha in enumerate(csv.reader(arquivo, dialeto), 1):
+            if progresso is not None and indice % LINHAS_POR_PROGRESSO == 0:
+                # Posição do buffer binário: o tell() do modo texto fica bloqueado durante a iteração
+                progresso.definir(arquivo.buffer.tell(), tamanho)
+            yield [celula.strip() or None for celula in linha]
+
+def ler_linhas_xlsx(caminho: str, progresso: Optional[Progresso] = None) -> Iterator[tuple]:
+    """Lê as linhas da primeira planilha de um .xlsx em modo somente leitura."""
+    from openpyxl import load_workbook
+    wb = load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        planilha = wb.worksheets[0]
+        for indice, linha in enumerate(planilha.iter_rows(values_only=True), 1):
+            if progresso is not None and indice % LINHAS_POR_PROGRESSO == 0:
+                progresso.definir(indice, planilha.max_row)
+            yield linha
+    finally:
+        wb.close()
+
+def ler_linhas_xls(caminho: str, progresso: Optional[Progresso] = None) -> Iterator[list]:
+    """
+    Lê as linhas da primeira planilha de um .xls (BIFF) com o xlrd.
+
+    O xlrd devolve todo número como float e toda data como número de série;
+    as células são convertidas como no pd.read_excel (números inteiros como
+    int, datas como datetime), para o motor streaming ver os mesmos valores
+    que os motores em lote.
+    """
+    import xlrd
+    livro = xlrd.open_workbook(caminho, on_demand=True)
+    try:
+        planilha = livro.sheet_by_index(0)
+        for indice in range(planilha.nrows):
+            if progresso is not None and indice % LINHAS_POR_PROGRESSO == 0:
+                progresso.definir(indice, planilha.nrows)
+            linha = []
+            for tipo, valor in zip(planilha.row_types(indice), planilha.row_values(indice)):
+                if tipo in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR) or valor == '':
+                    valor = None
+                elif tipo == xlrd.XL_CELL_DATE:
+                    valor = xlrd.xldate_as_datetime(valor, livro.datemode)
+                elif tipo == xlrd.XL_CELL_BOOLEAN:
+                    valor = bool(valor)
+                linha.append(_valor_celula(valor))
+            yield linha
+    finally:
+        livro.release_resources()
+
+def ler_linhas(caminho: str, progresso: Optional[Progresso] = None) -> Iterator[list]:
+    """
+    Itera sobre as linhas do arquivo com o leitor adequado ao formato real.
+
+    Args:
+        caminho: Caminho do arquivo
+        progresso: Acompanhamento da leitura (opcional; a fase é iniciada aqui)
+
+    Yields:
+        Valores de cada linha (None para células vazias)
+    """
+    formato = detectar_formato(caminho)
+    iniciar_fase(progresso, FASE_LEITURA)
+    if formato == FORMATO_HTML:
+        return ler_linhas_html(caminho, progresso=progresso)
+    if formato == FORMATO_CSV:
+        return ler_linhas_csv(caminho, progresso=progresso)
+    if formato == FORMATO_XLS:
+        return ler_linhas_xls(caminho, progresso=progresso)
+    return ler_linhas_xlsx(caminho, progresso=progresso)
+
+def _linhas_para_dataframe(linhas) -> pd.DataFrame:
+    linhas = list(linhas)
+    largura = max((len(linha) for linha in linhas), default=0)
+    return pd.DataFrame(
+        [list(linha) + [None] * (largura - len(linha)) for linha in linhas],
+        columns=range(largura), dtype=object
+    )
+
+def ler_planilha_caixa(caminho: str, progresso: Optional[Progresso] = None) -> pd.DataFrame:
+    """
+    Lê o relatório de caixa sem cabeçalho (colunas 0..n), qualquer que seja o formato real.
+
+    O relatório costuma ser um HTML salvo com extensão .xls; cada formato vai
+    para o leitor mais rápido disponível em vez de depender do pd.read_excel.
+
+    Args:
+        caminho: Caminho do relatório
+        progresso: Acompanhamento da leitura (opcional; HTML e CSV informam os bytes lidos)
+
+    Returns:
+        DataFrame equivalente a pd.read_excel(caminho, header=None)
+    """
+    formato = detectar_formato(caminho)
+    logger.info("Formato detectado para %s: %s", caminho, formato)
+    iniciar_fase(progresso, FASE_LEITURA)
+
+    if formato == FORMATO_HTML:
+        return _linhas_para_dataframe(ler_linhas_html(caminho, progresso=progresso))
+    if formato == FORMATO_CSV:
+        return _linhas_para_dataframe(ler_linhas_csv(caminho, progresso=progresso))
+    if formato == FORMATO_XLS:
+        return pd.read_excel(caminho, header=None, engine='xlrd')
+    return pd.read_excel(caminho, header=None, engine='openpyxl')
+
+def _valor_celula(valor):
+    # Como o pd.read_excel: números inteiros gravados como float voltam a ser int
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    return valor
+
+def _texto_celula(valor):
+    # Como o pd.read_excel com dtype=str: números inteiros sem '.0' e células vazias como NaN
+    if valor is None:
+        return np.nan
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return valor if isinstance(valor, str) else str(valor)
+
+def ler_colunas_em_lotes(
+    caminho: str,
+    colunas: List[str],
+    tamanho_lote: Optional[int] = None,
+    progresso: Optional[Progresso] = None,
+    colunas_texto: Optional[List[str]] = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Lê só as colunas pedidas de uma planilha com o cabeçalho na primeira linha,
+    em blocos de até tamanho_lote linhas.
+
+    O cabeçalho é conferido antes das demais linhas, então um arquivo sem
+    alguma das colunas falha logo no início. Das linhas só são guardados os
+    valores das colunas pedidas; o pd.read_excel materializa todas as células
+    antes de descartar as colunas não usadas. Com tamanho_lote, a memória
+    depende do tamanho do bloco e não do arquivo (o .xls BIFF, lido pelo
+    pandas, é carregado inteiro e só entregue em blocos).
+
+    Args:
+        caminho: Caminho da planilha (.xlsx, .xls, CSV ou HTML)
+        colunas: Nomes das colunas, como no cabeçalho
+        tamanho_lote: Linhas por bloco (None = arquivo inteiro em um bloco)
+        progresso: Acompanhamento da leitura (opcional; usa a fase atual)
+        colunas_texto: Colunas entregues como texto (object), como no
+            pd.read_excel com dtype=str: números inteiros sem '.0' e células
+            vazias como NaN, mesmo quando a coluna mistura números e vazios
+
+    Yields:
+        DataFrames com as colunas na ordem pedida e os valores como estão na
+        planilha (exceto colunas_texto); ao menos um, mesmo sem linhas
+
+    Raises:
+        ValueError: Se faltar alguma das colunas no cabeçalho
+    """
+    def conferir_cabecalho(cabecalho) -> List[int]:
+        nomes = ['' if nome is None else str(nome).strip() for nome in cabecalho]
+        ausentes = [coluna for coluna in colunas if coluna not in nomes]
+        if ausentes:
+            raise ValueError(f"Coluna(s) ausente(s) em {caminho}: {', '.join(ausentes)}")
+        return [nomes.index(coluna) for coluna in colunas]
+
+    texto = set(colunas_texto or ())
+
+    def bloco(valores) -> pd.DataFrame:
+        return pd.DataFrame({
+            coluna: pd.Series([_texto_celula(valor) for valor in lista], dtype=object) if coluna in texto else lista
+            for coluna, lista in zip(colunas, valores)
+        }, columns=colunas)
+
+    formato = detectar_formato(caminho)
+    if formato == FORMATO_XLS:
+        conferir_cabecalho(pd.read_excel(caminho, nrows=0, engine='xlrd').columns)
+        df = pd.read_excel(caminho, usecols=colunas, dtype={coluna: str for coluna in texto}, engine='xlrd')[colunas]
+        passo = tamanho_lote or max(len(df), 1)
+        for inicio in range(0, max(len(df), 1), passo):
+            yield df.iloc[inicio:inicio + passo].reset_index(drop=True)
+        return
+
+    if formato == FORMATO_HTML:
+        linhas = ler_linhas_html(caminho, progresso=progresso)
+    elif formato == FORMATO_CSV:
+        linhas = ler_linhas_csv(caminho, progresso=progresso)
+    else:
+        linhas = ler_linhas_xlsx(caminho, progresso=progresso)
+
+    valores = [[] for _ in colunas]
+    vazias_pendentes = 0
+    entregues = 0
+    try:
+        posicoes = conferir_cabecalho(next(linhas, ()))
+        for linha in linhas:
+            # Como o pd.read_excel: linhas vazias no meio ficam, as do final não
+            if all(valor is None for valor in linha):
+                vazias_pendentes += 1
+                continue
+            for destino in valores:
+                destino.extend([None] * vazias_pendentes)
+            vazias_pendentes = 0
+            largura = len(linha)
+            for destino, posicao in zip(valores, posicoes):
+                destino.append(_valor_celula(linha[posicao]) if posicao < largura else None)
+            if tamanho_lote and len(valores[0]) >= tamanho_lote:
+                yield bloco(valores)
+                valores = [[] for _ in colunas]
+                entregues += 1
+    finally:
+        # Fecha o arquivo mesmo quando o cabeçalho é recusado ou a leitura é interrompida
+        linhas.close()
+    if valores[0] or not entregues:
+        yield bloco(valores)
+
+def ler_colunas(
+    caminho: str,
+    colunas: List[str],
+    progresso: Optional[Progresso] = None,
+    colunas_texto: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    Lê só as colunas pedidas de uma planilha, de uma vez (ver ler_colunas_em_lotes).
+
+    Args:
+        caminho: Caminho da planilha (.xlsx, .xls, CSV ou HTML)
+        colunas: Nomes das colunas, como no cabeçalho
+        progresso: Acompanhamento da leitura (opcional; usa a fase atual)
+        colunas_texto: Colunas entregues como texto (ver ler_colunas_em_lotes)
+
+    Returns:
+        DataFrame com as colunas na ordem pedida e os valores como estão na planilha
+
+    Raises:
+        ValueError: Se faltar alguma das colunas no cabeçalho
+    """
+    return next(ler_colunas_em_lotes(caminho, colunas, None, progresso, colunas_texto))
@@ -1,16 +1,24 @@
 import sys
 import os
+import importlib
+import threading
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
     QFileDialog, QLabel, QMessageBox, QFrame, QSizePolicy, QSpacerItem,
     QProgressBar
 )
 from PyQt5.QtGui import QFont, QColor, QPalette
-from PyQt5.QtCore import Qt, QSize, QPoint
-import qtawesome as qta
+from PyQt5.QtCore import Qt, QSize, QPoint, QThread, pyqtSignal
 
-from html_reader import transformar_planilha
-from compare_movements import cruzar_planilhas_movimentacao
+# html_reader, compare_movements e excel_writer (e com eles pandas, numpy e openpyxl)
+# não são importados aqui: a janela aparece antes e eles são carregados em segundo plano
+from log_config import obter_logger
+from progress import OperacaoCancelada, Progresso
+
+logger = obter_logger('interface')
+
+# Módulos de processamento carregados depois que a janela aparece
+MODULOS_PROCESSAMENTO = ('html_reader', 'compare_movements', 'pipeline')
 
 # Paleta de cores moderna - Tema Escuro
 CORES = {
@@ -26,6 +34,77 @@ CORES = {
     'aviso': "#FFD600"
 }
 
+# Ícones dos botões: nome → (ícone do qtawesome, cor)
+ICONES = {
+    'file': ('fa5s.file-alt', 'black'),
+    'folder': ('fa5s.folder-open', 'black'),
+    'process': ('fa5s.play', CORES['fundo']),
+    'back': ('fa5s.arrow-left', CORES['primaria'])
+}
+
+def aquecer_processamento():
+    """Importa a pilha de processamento (pandas, openpyxl...) fora da thread da interface."""
+    for modulo in MODULOS_PROCESSAMENTO:
+        try:
+            importlib.import_module(modulo)
+        except Exception as e:
+            # A etapa tentará de novo ao rodar e mostrará o erro ao usuário
+            logger.warning('Falha ao pré-carregar %s: %s', modulo, e)
+
+def executar_transformacao(*args, **kwargs):
+    from parse_cache import obter_cache_padrao
+    from pipeline import transformar_para_cruzamento
+    return transformar_para_cruzamento(*args, cache=obter_cache_padrao(), **kwargs)
+
+def executar_cruzamento(*args, **kwargs):
+    from compare_movements import cruzar_planilhas_movimentacao
+    from parse_cache import obter_cache_padrao
+    cache = obter_cache_padrao()
+    try:
+        return cruzar_planilhas_movimentacao(*args, cache=cache, **kwargs)
+    finally:
+        if cache is not None:
+            cache.estatisticas.registrar_resumo(logger, 'Cache de leituras (sessão)')
+
+def formatar_eta(segundos):
+    """Tempo restante no formato exibido na barra de status."""
+    if segundos is None:
+        return ''
+    minutos, segundos = divmod(int(round(segundos)), 60)
+    return f" — faltam {minutos} min {segundos:02d} s" if minutos else f" — faltam {segundos} s"
+
+class TrabalhadorEtapa(QThread):
+    """
+    Executa uma etapa fora da thread da interface.
+
+    A função recebe o argumento nomeado progresso; o andamento chega à janela
+    pelo sinal andamento e o resultado por concluido, falhou ou cancelado.
+    """
+    andamento = pyqtSignal(str, int, object, object)
+    concluido = pyqtSignal(object)
+    falhou = pyqtSignal(str)
+    cancelado = pyqtSignal()
+
+    def __init__(self, funcao, *args, **kwargs):
+        super().__init__()
+        self.funcao = funcao
+        self.args = args
+        self.kwargs = kwargs
+        self.progresso = Progresso(callback=self.andamento.emit)
+
+    def cancelar(self):
+        self.progresso.cancelar()
+
+    def run(self):
+        try:
+            resultado = self.funcao(*self.args, progresso=self.progresso, **self.kwargs)
+        except OperacaoCancelada:
+            self.cancelado.emit()
+        except Exception as e:
+            self.falhou.emit(str(e))
+        else:
+            self.concluido.emit(resultado)
+
 class MainWindow(QWidget):
     def __init__(self):
         super().__init__()
@@ -33,6 +112,10 @@ class MainWindow(QWidget):
         self.setWindowFlags(Qt.FramelessWindowHint)  # Remove a barra de título padrão
         self.setAttribute(Qt.WA_TranslucentBackground)  # Permite transparência
         self.oldPos = None  # Para controlar o arrasto da janela
+        self.escritor = None  # Escritor de planilhas usado nas duas etapas (None = streaming)
+        self.trabalhador = None  # Etapa em execução (TrabalhadorEtapa)
+        # Planilha formatada da etapa 1 desta sessão: (caminho gravado, tabela em memória)
+        self.planilha_formatada = None
         
         self.setStyleSheet(f"""
             QWidget {{
@@ -165,13 +248,9 @@ class MainWindow(QWidget):
         self.setMinimumWidth(900)
         self.setMinimumHeight(700)
         
-        # Configurar ícones com a nova cor primária
-        self.icons = {
-            'file': qta.icon('fa5s.file-alt', color='black'),
-            'folder': qta.icon('fa5s.folder-open', color='black'),
-            'process': qta.icon('fa5s.play', color=CORES['fundo']),
-            'back': qta.icon('fa5s.arrow-left', color=CORES['primaria'])
-        }
+        # Ícones carregados depois que a janela aparece (carregar_icones)
+        self.icons = {}
+        self._botoes_sem_icone = []
         
         self.initUI()
         
@@ -227,7 +306,27 @@ class MainWindow(QWidget):
         self.content_layout = content_layout
         self.show_etapa1()
 
+    def iniciar_aquecimento(self):
+        """Chamado com a janela já na tela: carrega os ícones e, em segundo plano, o processamento."""
+        self.carregar_icones()
+        threading.Thread(target=aquecer_processamento, name='aquecimento', daemon=True).start()
+
+    def carregar_icones(self):
+        import qtawesome as qta
+        self.icons = {nome: qta.icon(icone, color=cor) for nome, (icone, cor) in ICONES.items()}
+        for botao, nome in self._botoes_sem_icone:
+            botao.setIcon(self.icons[nome])
+        self._botoes_sem_icone = []
+
+    def definir_icone(self, botao, nome):
+        botao.setIconSize(QSize(20, 20))
+        if nome in self.icons:
+            botao.setIcon(self.icons[nome])
+        else:
+            self._botoes_sem_icone.append((botao, nome))
+
     def limpar_layout(self):
+        self._botoes_sem_icone = []
         while self.content_layout.count():
             item = self.content_layout.takeAt(0)
             widget = item.widget()
@@ -283,8 +382,7 @@ class MainWindow(QWidget):
         # INPUT arquivo
         hbox1 = QHBoxLayout()
         btn_infile = QPushButton("Selecionar Planilha")
-        btn_infile.setIcon(self.icons['file'])
-        btn_infile.setIconSize(QSize(20, 20))
+        self.definir_icone(btn_infile, 'file')
         btn_infile.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
         btn_infile.clicked.connect(self.select_etapa1_infile)
         self.infile_label = QLabel("Nenhum arquivo selecionado")
@@ -298,8 +396,7 @@ class MainWindow(QWidget):
         # INPUT pasta saída
         hbox2 = QHBoxLayout()
         btn_outfolder = QPushButton("Pasta de Saída")
-        btn_outfolder.setIcon(self.icons['folder'])
-        btn_outfolder.setIconSize(QSize(20, 20))
+        self.definir_icone(btn_outfolder, 'folder')
         btn_outfolder.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
         btn_outfolder.clicked.connect(self.select_etapa1_outfolder)
         self.outfolder_label = QLabel("Nenhuma pasta selecionada")
@@ -324,12 +421,21 @@ class MainWindow(QWidget):
         # Botão Rodar
         hbox_run = QHBoxLayout()
         btn_run1 = QPushButton("Iniciar Transformação")
-        btn_run1.setIcon(self.icons['process'])
-        btn_run1.setIconSize(QSize(20, 20))
+        self.definir_icone(btn_run1, 'process')
         btn_run1.clicked.connect(self.run_etapa1)
         btn_run1.setLayoutDirection(Qt.LeftToRight)  # Garante direção correta do layout
+        self.btn_run = btn_run1
+        self.btn_voltar = None
+
+        # Botão Cancelar (visível só durante o processamento)
+        self.btn_cancelar = QPushButton("Cancelar")
+        self.btn_cancelar.setObjectName("secondaryButton")
+        self.btn_cancelar.clicked.connect(self.cancelar_etapa)
+        self.btn_cancelar.setVisible(False)
+
         hbox_run.addStretch(1)
         hbox_run.addWidget(btn_run1, alignment=Qt.AlignCenter)  # Centraliza o botão
+        hbox_run.addWidget(self.btn_cancelar, alignment=Qt.AlignCenter)
         hbox_run.addStretch(1)
         container_layout.addLayout(hbox_run)
         
@@ -365,12 +471,15 @@ class MainWindow(QWidget):
         # INPUT planilha formatada
         hbox0 = QHBoxLayout()
         btn_formatada = QPushButton("Planilha Formatada")
-        btn_formatada.setIcon(self.icons['file'])
-        btn_formatada.setIconSize(QSize(20, 20))
+        self.definir_icone(btn_formatada, 'file')
         btn_formatada.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
         btn_formatada.clicked.connect(self.select_etapa2_formatada)
         self.formatada_label = QLabel("Nenhum arquivo selecionado")
         self.formatada_label.setObjectName("fileLabel")
+        if self.planilha_formatada is not None:
+            # Resultado da etapa 1 já está em memória: o cruzamento não relê o arquivo
+            self.etapa2_formatada = self.planilha_formatada[0]
+            self.formatada_label.setText(f"{os.path.basename(self.etapa2_formatada)} (etapa 1)")
         self.formatada_label.setAlignment(Qt.AlignLeft | Qt.AlignVCenter)
         hbox0.addWidget(btn_formatada)
         hbox0.addSpacing(16)
@@ -380,8 +489,7 @@ class MainWindow(QWidget):
         # INPUT planilha movimentações
         hbox1 = QHBoxLayout()
         btn_movfile = QPushButton("Planilha de Movimentações")
-        btn_movfile.setIcon(self.icons['file'])
-        btn_movfile.setIconSize(QSize(20, 20))
+        self.definir_icone(btn_movfile, 'file')
         btn_movfile.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
         btn_movfile.clicked.connect(self.select_etapa2_movfile)
         self.movfile_label = QLabel("Nenhum arquivo selecionado")
@@ -395,8 +503,7 @@ class MainWindow(QWidget):
         # INPUT pasta saída
         hbox2 = QHBoxLayout()
         btn_outfolder = QPushButton("Pasta de Saída")
-        btn_outfolder.setIcon(self.icons['folder'])
-        btn_outfolder.setIconSize(QSize(20, 20))
+        self.definir_icone(btn_outfolder, 'folder')
         btn_outfolder.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
         btn_outfolder.clicked.connect(self.select_etapa2_outfolder)
         self.etapa2_outfolder_label = QLabel("Nenhuma pasta selecionada")
@@ -424,18 +531,25 @@ class MainWindow(QWidget):
         # Botão Voltar
         btn_voltar = QPushButton("Voltar")
         btn_voltar.setObjectName("secondaryButton")
-        btn_voltar.setIcon(self.icons['back'])
-        btn_voltar.setIconSize(QSize(20, 20))
+        self.definir_icone(btn_voltar, 'back')
         btn_voltar.clicked.connect(self.show_etapa1)
         
         # Botão Rodar
         btn_run2 = QPushButton("Iniciar Cruzamento")
-        btn_run2.setIcon(self.icons['process'])
-        btn_run2.setIconSize(QSize(20, 20))
+        self.definir_icone(btn_run2, 'process')
         btn_run2.clicked.connect(self.run_etapa2)
+        self.btn_run = btn_run2
+        self.btn_voltar = btn_voltar
+
+        # Botão Cancelar (visível só durante o processamento)
+        self.btn_cancelar = QPushButton("Cancelar")
+        self.btn_cancelar.setObjectName("secondaryButton")
+        self.btn_cancelar.clicked.connect(self.cancelar_etapa)
+        self.btn_cancelar.setVisible(False)
         
         hbox_buttons.addWidget(btn_voltar)
         hbox_buttons.addStretch(1)
+        hbox_buttons.addWidget(self.btn_cancelar)
         hbox_buttons.addWidget(btn_run2)
         container_layout.addLayout(hbox_buttons)
         
@@ -469,16 +583,19 @@ class MainWindow(QWidget):
             self.status_label.setText("Selecione o arquivo e a pasta de saída.")
             QMessageBox.critical(self, "Erro", "Selecione o arquivo e a pasta de saída.")
             return
-        try:
-            nome_arquivo_saida = 'Planilha Formatada.xlsx'
-            caminho_saida = os.path.join(self.etapa1_outfolder, nome_arquivo_saida)
-            transformar_planilha(self.etapa1_infile, caminho_saida)
-            self.status_label.setText("✅ Planilha transformada com sucesso!")
-            QMessageBox.information(self, "Sucesso", "Planilha transformada com sucesso!")
-            self.show_etapa2()
-        except Exception as e:
-            self.status_label.setText(f"❌ Erro ao transformar: {e}")
-            QMessageBox.critical(self, "Erro", f"Erro ao transformar: {e}")
+        nome_arquivo_saida = 'Planilha Formatada.xlsx'
+        caminho_saida = os.path.join(self.etapa1_outfolder, nome_arquivo_saida)
+        self.iniciar_trabalhador(
+            TrabalhadorEtapa(executar_transformacao, self.etapa1_infile, caminho_saida, escritor=self.escritor),
+            self.etapa1_concluida, "Erro ao transformar"
+        )
+
+    def etapa1_concluida(self, resultado):
+        formatada, _contadores = resultado
+        self.planilha_formatada = (self.trabalhador.args[1], formatada)
+        self.status_label.setText("✅ Planilha transformada com sucesso!")
+        QMessageBox.information(self, "Sucesso", "Planilha transformada com sucesso!")
+        self.show_etapa2()
 
     def select_etapa2_formatada(self):
         file, _ = QFileDialog.getOpenFileName(
@@ -520,17 +637,85 @@ class MainWindow(QWidget):
             QMessageBox.critical(self, "Erro", "Selecione o arquivo de movimentações e a pasta de saída.")
             return
 
-        try:
-            cruzar_planilhas_movimentacao(
-                self.etapa2_formatada,
+        self.iniciar_trabalhador(
+            TrabalhadorEtapa(
+                executar_cruzamento,
+                self.formatada_para_cruzamento(),
                 self.etapa2_movfile,
-                self.etapa2_outfolder
-            )
-            self.status_label.setText("✅ Comparação concluída com sucesso!")
-            QMessageBox.information(self, "Sucesso", "Comparação concluída com sucesso!")
-        except Exception as e:
-            self.status_label.setText(f"❌ Erro ao comparar: {e}")
-            QMessageBox.critical(self, "Erro", f"Erro ao comparar: {e}")
+                self.etapa2_outfolder,
+                escritor=self.escritor
+            ),
+            self.etapa2_concluida, "Erro ao comparar"
+        )
+
+    def formatada_para_cruzamento(self):
+        """Tabela da etapa 1 em memória quando é a planilha escolhida; senão, o arquivo."""
+        if self.planilha_formatada is not None and self.etapa2_formatada == self.planilha_formatada[0]:
+            return self.planilha_formatada[1]
+        return self.etapa2_formatada
+
+    def etapa2_concluida(self, _resultado):
+        self.status_label.setText("✅ Comparação concluída com sucesso!")
+        QMessageBox.information(self, "Sucesso", "Comparação concluída com sucesso!")
+
+    def iniciar_trabalhador(self, trabalhador, ao_concluir, titulo_erro):
+        """Roda a etapa em segundo plano, com a janela livre e o botão Cancelar ativo."""
+        self.trabalhador = trabalhador
+        trabalhador.andamento.connect(self.atualizar_progresso)
+        trabalhador.concluido.connect(ao_concluir)
+        trabalhador.falhou.connect(lambda mensagem: self.etapa_falhou(titulo_erro, mensagem))
+        trabalhador.cancelado.connect(self.etapa_cancelada)
+        trabalhador.finished.connect(self.etapa_encerrada)
+
+        self.btn_run.setEnabled(False)
+        if self.btn_voltar is not None:
+            self.btn_voltar.setEnabled(False)
+        self.btn_cancelar.setEnabled(True)
+        self.btn_cancelar.setVisible(True)
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setVisible(True)
+        self.status_label.setText("Iniciando...")
+        trabalhador.start()
+
+    def atualizar_progresso(self, fase, feito, total, eta):
+        if total:
+            self.progress_bar.setRange(0, 100)
+            self.progress_bar.setValue(min(100, int(feito * 100 / total)))
+        else:
+            self.progress_bar.setRange(0, 0)  # Tamanho desconhecido: barra indeterminada
+        self.status_label.setText(f"{fase}...{formatar_eta(eta)}")
+
+    def cancelar_etapa(self):
+        if self.trabalhador is not None:
+            self.trabalhador.cancelar()
+            self.btn_cancelar.setEnabled(False)
+            self.status_label.setText("Cancelando...")
+
+    def etapa_falhou(self, titulo_erro, mensagem):
+        self.status_label.setText(f"❌ {titulo_erro}: {mensagem}")
+        QMessageBox.critical(self, "Erro", f"{titulo_erro}: {mensagem}")
+
+    def etapa_cancelada(self):
+        self.status_label.setText("Processamento cancelado. Nenhum arquivo incompleto foi gravado.")
+
+    def etapa_encerrada(self):
+        self.trabalhador = None
+        # A tela pode ter sido trocada (etapa 1 concluída abre a etapa 2)
+        try:
+            self.progress_bar.setVisible(False)
+            self.btn_cancelar.setVisible(False)
+            self.btn_run.setEnabled(True)
+            if self.btn_voltar is not None:
+                self.btn_voltar.setEnabled(True)
+        except RuntimeError:
+            pass
+
+    def closeEvent(self, event):
+        # Não deixa a thread de processamento órfã: cancela e espera terminar
+        if self.trabalhador is not None:
+            self.trabalhador.cancelar()
+            self.trabalhador.wait()
+        super().closeEvent(event)
 
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
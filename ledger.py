@@ -0,0 +1,326 @@
+import os
+import sqlite3
+from datetime import datetime
+import pandas as pd
+from typing import Dict, Iterable, List, Tuple
+from log_config import obter_logger
+
+logger = obter_logger('ledger')
+
+# Muda quando o esquema muda; um livro de outra versão precisa ser reiniciado
+VERSAO_LIVRO = '1'
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT NOT NULL);
+
+-- Linhas da planilha formatada (etapa 1), identificadas pela chave do cruzamento
+CREATE TABLE IF NOT EXISTS caixa (
+    id INTEGER PRIMARY KEY,
+    movimentacao TEXT NOT NULL,
+    valor INTEGER NOT NULL,
+    filial TEXT NOT NULL,
+    forma_pagamento TEXT NOT NULL,
+    codigo TEXT NOT NULL,
+    cliente TEXT NOT NULL,
+    data TEXT NOT NULL,
+    conteudo INTEGER NOT NULL,
+    UNIQUE (movimentacao, valor, filial)
+);
+CREATE INDEX IF NOT EXISTS caixa_filial_valor_data ON caixa (filial, valor, data);
+
+-- Linhas da planilha de movimentações (etapa 2), identificadas pelo código, a
+-- filial e a ocorrência do par no arquivo; caixa_id NULL = em aberto
+CREATE TABLE IF NOT EXISTS movimentos (
+    id INTEGER PRIMARY KEY,
+    codigo TEXT NOT NULL,
+    filial TEXT NOT NULL,
+    ocorrencia INTEGER NOT NULL,
+    valor INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    cliente TEXT NOT NULL,
+    conteudo INTEGER NOT NULL,
+    caixa_id INTEGER REFERENCES caixa (id),
+    forma_pagamento TEXT NOT NULL DEFAULT '',
+    execucao INTEGER,
+    UNIQUE (codigo, filial, ocorrencia)
+);
+CREATE INDEX IF NOT EXISTS movimentos_chave ON movimentos (codigo, valor, filial);
+CREATE INDEX IF NOT EXISTS movimentos_filial_valor_data ON movimentos (filial, valor, data);
+CREATE INDEX IF NOT EXISTS movimentos_caixa ON movimentos (caixa_id);
+
+CREATE TABLE IF NOT EXISTS execucoes (
+    id INTEGER PRIMARY KEY,
+    inicio TEXT NOT NULL,
+    movimentos_emitidos INTEGER
+);
+
+-- Movimentos que entram nas planilhas da execução em andamento
+CREATE TEMP TABLE IF NOT EXISTS delta (id INTEGER PRIMARY KEY);
+"""
+
+_TABELAS = ('movimentos', 'caixa', 'execucoes')
+
+def _texto(serie: pd.Series) -> List[str]:
+    return serie.astype(object).where(serie.notna(), '').astype(str).tolist()
+
+def _assinatura(df: pd.DataFrame) -> pd.Series:
+    """Hash de 64 bits do conteúdo de cada linha, para perceber alterações sem comparar texto."""
+    return pd.Series(pd.util.hash_pandas_object(df, index=False).to_numpy().view('int64'), index=df.index)
+
+class LivroConciliacao:
+    """
+    Livro local (SQLite) com as linhas do caixa e das movimentações já
+    processadas e a situação de cada movimentação no cruzamento.
+
+    Uma execução diária só grava o que é novo ou mudou desde a anterior (ver
+    compare_movements.cruzar_planilhas_movimentacao com livro). As alterações
+    de uma execução só são confirmadas por confirmar(); desfazer() as descarta,
+    então uma execução que falha ou é cancelada não deixa o livro pela metade.
+
+    Args:
+        caminho: Arquivo do livro (criado se não existir)
+
+    Raises:
+        ValueError: Se o livro foi criado por outra versão do esquema (use reiniciar)
+    """
+
+    def __init__(self, caminho: str):
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self.caminho = caminho
+        self._conexao = sqlite3.connect(caminho)
+        self._conexao.executescript(_ESQUEMA)
+        linha = self._conexao.execute("SELECT valor FROM meta WHERE chave = 'versao'").fetchone()
+        if linha is None:
+            self._conexao.execute("INSERT INTO meta (chave, valor) VALUES ('versao', ?)", (VERSAO_LIVRO,))
+            self._conexao.commit()
+        elif linha[0] != VERSAO_LIVRO:
+            self._conexao.close()
+            raise ValueError(
+                f'Livro de conciliação {caminho} na versão {linha[0]} (esperada {VERSAO_LIVRO}); reinicie o livro'
+            )
+
+    def __enter__(self) -> 'LivroConciliacao':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.fechar()
+
+    def fechar(self) -> None:
+        self._conexao.close()
+
+    def confirmar(self) -> None:
+        self._conexao.commit()
+
+    def desfazer(self) -> None:
+        self._conexao.rollback()
+
+    def reiniciar(self) -> None:
+        """Apaga todas as linhas: a próxima execução processa tudo de novo."""
+        for tabela in _TABELAS:
+            self._conexao.execute(f'DELETE FROM {tabela}')
+        self._conexao.commit()
+        logger.info('Livro de conciliação reiniciado: %s', self.caminho)
+
+    def resumo(self) -> Dict[str, int]:
+        """Quantidade de linhas do livro e das movimentações ainda em aberto."""
+        contar = lambda sql: self._conexao.execute(sql).fetchone()[0]
+        return {
+            'caixa': contar('SELECT COUNT(*) FROM caixa'),
+            'movimentos': contar('SELECT COUNT(*) FROM movimentos'),
+            'movimentos_abertos': contar('SELECT COUNT(*) FROM movimentos WHERE caixa_id IS NULL'),
+            'execucoes': contar('SELECT COUNT(*) FROM execucoes'),
+        }
+
+    def iniciar_execucao(self) -> int:
+        """Registra uma execução e esvazia o delta."""
+        self._conexao.execute('DELETE FROM delta')
+        cursor = self._conexao.execute(
+            'INSERT INTO execucoes (inicio) VALUES (?)', (datetime.now().isoformat(timespec='seconds'),)
+        )
+        return cursor.lastrowid
+
+    def _ao_delta(self, ids: Iterable[int]) -> None:
+        self._conexao.executemany('INSERT OR IGNORE INTO delta (id) VALUES (?)', ((int(i),) for i in ids))
+
+    def registrar_caixa(self, df_formatada: pd.DataFrame) -> Tuple[int, int]:
+        """
+        Grava as linhas novas ou alteradas da planilha formatada.
+
+        Uma linha alterada (forma de pagamento, código, cliente ou data) que já
+        estava relacionada leva as movimentações dela para o delta, com a nova
+        forma de pagamento.
+
+        Args:
+            df_formatada: Planilha formatada com Valor em centavos
+
+        Returns:
+            Tupla (linhas novas, linhas alteradas)
+        """
+        datas = df_formatada['Data'] if 'Data' in df_formatada.columns else pd.Series('', index=df_formatada.index)
+        entrada = pd.DataFrame({
+            'movimentacao': _texto(df_formatada['Movimentação']),
+            'valor': df_formatada['Valor'].astype('int64').tolist(),
+            'filial': _texto(df_formatada['Filial']),
+            'forma_pagamento': _texto(df_formatada['Forma de Pagamento']),
+            'codigo': _texto(df_formatada['Código']),
+            'cliente': _texto(df_formatada['Cliente/Fornecedor']),
+            'data': _texto(datas),
+        })
+        # Chave repetida: prevalece a última linha, como no cruzamento em memória
+        entrada = entrada[~entrada.duplicated(subset=['movimentacao', 'valor', 'filial'], keep='last')]
+        entrada['conteudo'] = _assinatura(entrada[['forma_pagamento', 'codigo', 'cliente', 'data']])
+        existentes = pd.read_sql_query(
+            'SELECT id, movimentacao, valor, filial, conteudo AS anterior FROM caixa', self._conexao,
+            dtype={'id': 'Int64', 'valor': 'int64', 'anterior': 'Int64'}
+        )
+        unido = entrada.merge(existentes, on=['movimentacao', 'valor', 'filial'], how='left')
+
+        novas = unido[unido['id'].isna()]
+        self._conexao.executemany(
+            'INSERT INTO caixa (movimentacao, valor, filial, forma_pagamento, codigo, cliente, data, conteudo) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            novas[['movimentacao', 'valor', 'filial', 'forma_pagamento', 'codigo', 'cliente', 'data', 'conteudo']]
+            .astype(object).itertuples(index=False, name=None)
+        )
+        alteradas = unido[unido['id'].notna() & (unido['conteudo'] != unido['anterior']).fillna(True)]
+        self._conexao.executemany(
+            'UPDATE caixa SET forma_pagamento = ?, codigo = ?, cliente = ?, data = ?, conteudo = ? WHERE id = ?',
+            zip(alteradas['forma_pagamento'], alteradas['codigo'], alteradas['cliente'], alteradas['data'],
+                alteradas['conteudo'].tolist(), alteradas['id'].astype('int64').tolist())
+        )
+        ids = alteradas['id'].astype('int64').tolist()
+        self._conexao.executemany(
+            'UPDATE movimentos SET forma_pagamento = ? WHERE caixa_id = ?', zip(alteradas['forma_pagamento'], ids)
+        )
+        self._conexao.executemany(
+            'INSERT OR IGNORE INTO delta (id) SELECT id FROM movimentos WHERE caixa_id = ?', ((i,) for i in ids)
+        )
+        return len(novas), len(alteradas)
+
+    def registrar_movimentos(self, df_mov: pd.DataFrame) -> Tuple[int, int]:
+        """
+        Grava as movimentações novas ou alteradas e as coloca no delta.
+
+        A identidade de uma linha é o código, a filial e a ocorrência desse par
+        no arquivo (1ª, 2ª...); uma linha com a mesma identidade e outro valor,
+        data ou cliente é alterada e volta a ficar em aberto.
+
+        Args:
+            df_mov: Movimentações normalizadas (ver compare_movements.ler_movimentacoes)
+
+        Returns:
+            Tupla (linhas novas, linhas alteradas)
+        """
+        datas = pd.to_datetime(df_mov['Data Movimentação'])
+        entrada = pd.DataFrame({
+            'codigo': _texto(df_mov['Código']),
+            'filial': _texto(df_mov['Filial']),
+            'valor': df_mov['Valor (R$)'].astype('int64').tolist(),
+            'data': datas.dt.strftime('%Y-%m-%d').fillna('').tolist(),
+            'cliente': _texto(df_mov['Cliente/Fornecedor']),
+        })
+        entrada['ocorrencia'] = entrada.groupby(['codigo', 'filial'], sort=False).cumcount()
+        entrada['conteudo'] = _assinatura(entrada[['valor', 'data', 'cliente']])
+        existentes = pd.read_sql_query(
+            'SELECT id, codigo, filial, ocorrencia, conteudo AS anterior FROM movimentos', self._conexao,
+            dtype={'id': 'Int64', 'ocorrencia': 'int64', 'anterior': 'Int64'}
+        )
+        unido = entrada.merge(existentes, on=['codigo', 'filial', 'ocorrencia'], how='left')
+
+        novas = unido[unido['id'].isna()]
+        colunas = ['codigo', 'filial', 'ocorrencia', 'valor', 'data', 'cliente', 'conteudo']
+        ultimo_id = self._conexao.execute('SELECT COALESCE(MAX(id), 0) FROM movimentos').fetchone()[0]
+        self._conexao.executemany(
+            'INSERT INTO movimentos (codigo, filial, ocorrencia, valor, data, cliente, conteudo) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)', novas[colunas].astype(object).itertuples(index=False, name=None)
+        )
+        self._conexao.execute('INSERT INTO delta (id) SELECT id FROM movimentos WHERE id > ?', (ultimo_id,))
+        alteradas = unido[unido['id'].notna() & (unido['conteudo'] != unido['anterior']).fillna(True)]
+        ids = alteradas['id'].astype('int64').tolist()
+        self._conexao.executemany(
+            "UPDATE movimentos SET valor = ?, data = ?, cliente = ?, conteudo = ?, caixa_id = NULL, "
+            "forma_pagamento = '' WHERE id = ?",
+            zip(alteradas['valor'].astype('int64').tolist(), alteradas['data'], alteradas['cliente'],
+                alteradas['conteudo'].tolist(), ids)
+        )
+        self._ao_delta(ids)
+        return len(novas), len(alteradas)
+
+    def relacionar_abertos(self) -> int:
+        """
+        Relaciona pela chave (movimentação, valor, filial) as movimentações em
+        aberto, novas ou antigas, com as linhas do caixa (novas ou antigas);
+        as que encontram correspondente entram no delta.
+
+        Returns:
+            Quantidade de movimentações relacionadas agora
+        """
+        encontrados = self._conexao.execute(
+            'SELECT m.id, c.id, c.forma_pagamento FROM movimentos m '
+            'JOIN caixa c ON c.movimentacao = m.codigo AND c.valor = m.valor AND c.filial = m.filial '
+            'WHERE m.caixa_id IS NULL'
+        ).fetchall()
+        self._conexao.executemany(
+            'UPDATE movimentos SET caixa_id = ?, forma_pagamento = ? WHERE id = ?',
+            ((caixa_id, forma, id_mov) for id_mov, caixa_id, forma in encontrados)
+        )
+        self._ao_delta(id_mov for id_mov, _, _ in encontrados)
+        return len(encontrados)
+
+    def movimentos_delta(self) -> pd.DataFrame:
+        """
+        Movimentações do delta no formato do cruzamento (colunas de
+        ler_movimentacoes mais 'Forma de Pagamento'), na ordem do livro, com
+        'Relacionada' indicando as que têm linha do caixa.
+        """
+        df = pd.read_sql_query(
+            'SELECT m.id, m.codigo, m.valor, m.filial, m.data, m.cliente, m.forma_pagamento, '
+            'm.caixa_id IS NOT NULL AS relacionada '
+            'FROM movimentos m JOIN delta d ON d.id = m.id ORDER BY m.id', self._conexao
+        )
+        return _como_movimentacoes(df).assign(Relacionada=df['relacionada'].astype(bool))
+
+    def marcar_emitidos(self, execucao: int) -> int:
+        """Registra o delta como emitido nesta execução e devolve o tamanho dele."""
+        self._conexao.execute('UPDATE movimentos SET execucao = ? WHERE id IN (SELECT id FROM delta)', (execucao,))
+        quantidade = self._conexao.execute('SELECT COUNT(*) FROM delta').fetchone()[0]
+        self._conexao.execute('UPDATE execucoes SET movimentos_emitidos = ? WHERE id = ?', (quantidade, execucao))
+        return quantidade
+
+    def movimentos_abertos(self) -> pd.DataFrame:
+        """Movimentações sem linha do caixa, no formato de movimentos_delta."""
+        df = pd.read_sql_query(
+            'SELECT id, codigo, valor, filial, data, cliente, forma_pagamento FROM movimentos '
+            'WHERE caixa_id IS NULL ORDER BY id', self._conexao
+        )
+        return _como_movimentacoes(df)
+
+    def chaves_movimentos(self) -> pd.DataFrame:
+        """Código e valor de todas as movimentações do livro (diagnóstico dos não relacionados)."""
+        return pd.read_sql_query('SELECT codigo AS "Código", valor AS "Valor (R$)" FROM movimentos', self._conexao)
+
+    def caixa(self, somente_abertas: bool = False) -> pd.DataFrame:
+        """
+        Linhas do caixa no formato da planilha formatada (Valor em centavos).
+
+        Args:
+            somente_abertas: Só as linhas sem nenhuma movimentação relacionada
+        """
+        filtro = ' WHERE NOT EXISTS (SELECT 1 FROM movimentos m WHERE m.caixa_id = c.id)' if somente_abertas else ''
+        return pd.read_sql_query(
+            'SELECT movimentacao AS "Movimentação", codigo AS "Código", cliente AS "Cliente/Fornecedor", '
+            'filial AS "Filial", valor AS "Valor", forma_pagamento AS "Forma de Pagamento", data AS "Data" '
+            f'FROM caixa c{filtro} ORDER BY id', self._conexao
+        )
+
+def _como_movimentacoes(df: pd.DataFrame) -> pd.DataFrame:
+    return pd.DataFrame({
+        'Código': df['codigo'],
+        'Valor (R$)': df['valor'].astype('int64'),
+        'Filial': df['filial'],
+        'Data Movimentação': pd.to_datetime(df['data'].replace('', None), format='%Y-%m-%d'),
+        'Cliente/Fornecedor': df['cliente'],
+        'Forma de Pagamento': df['forma_pagamento'],
+    })
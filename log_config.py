@@ -0,0 +1,67 @@
+import logging
+import os
+import sys
+from collections import Counter
+from typing import Optional
+
+LOGGER_RAIZ = 'caixasync'
+VARIAVEL_VERBOSO = 'CAIXASYNC_VERBOSE'
+FORMATO_LOG = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# Silencioso por padrão: sem configurar_log as mensagens não vão para lugar nenhum
+logging.getLogger(LOGGER_RAIZ).addHandler(logging.NullHandler())
+
+def obter_logger(nome: str) -> logging.Logger:
+    """
+    Retorna o logger de um módulo do CaixaSync.
+
+    Args:
+        nome: Nome do módulo (ex.: 'html_reader')
+
+    Returns:
+        Logger filho de 'caixasync'
+    """
+    return logging.getLogger(f'{LOGGER_RAIZ}.{nome}')
+
+def verboso_pelo_ambiente() -> bool:
+    """Indica se a variável de ambiente CAIXASYNC_VERBOSE pede o modo verboso."""
+    return os.environ.get(VARIAVEL_VERBOSO, '').strip().lower() in ('1', 'true', 'sim', 'yes')
+
+def configurar_log(verboso: bool = False, arquivo: Optional[str] = None) -> logging.Logger:
+    """
+    Liga a saída do log do CaixaSync.
+
+    No modo normal saem os avisos e os resumos de cada etapa; no modo verboso
+    sai também o rastro linha a linha usado para investigar exportações com problema.
+
+    Args:
+        verboso: True para o nível DEBUG, False para INFO
+        arquivo: Arquivo de log (None = stderr)
+
+    Returns:
+        Logger raiz do CaixaSync
+    """
+    raiz = logging.getLogger(LOGGER_RAIZ)
+    for handler in list(raiz.handlers):
+        if not isinstance(handler, logging.NullHandler):
+            raiz.removeHandler(handler)
+            handler.close()
+
+    handler = logging.FileHandler(arquivo, encoding='utf-8') if arquivo else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter(FORMATO_LOG))
+    raiz.addHandler(handler)
+    raiz.setLevel(logging.DEBUG if verboso else logging.INFO)
+    return raiz
+
+class ContadoresExecucao(Counter):
+    """
+    Contadores agregados de uma etapa, registrados uma única vez ao final.
+
+    Substituem as mensagens por linha: cada ocorrência só incrementa um
+    contador e o total aparece no resumo.
+    """
+
+    def registrar_resumo(self, logger: logging.Logger, titulo: str) -> None:
+        """Registra todos os contadores em uma única mensagem de nível INFO."""
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('%s: %s', titulo, ', '.join(f'{nome}={total}' for nome, total in self.items()))
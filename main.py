@@ -1,10 +1,20 @@
 import sys
 import os
+import multiprocessing
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtGui import QIcon
+from PyQt5.QtCore import QTimer
 from interface import MainWindow
+from log_config import configurar_log, verboso_pelo_ambiente
+
+# Definida pelo startup_benchmark.py: o programa fecha assim que a janela aparece
+VARIAVEL_MEDIR_INICIO = 'CAIXASYNC_MEDIR_INICIO'
 
 def main():
+    # Log silencioso por padrão; --verbose (ou CAIXASYNC_VERBOSE=1) mostra o rastro completo
+    if '--verbose' in sys.argv or '-v' in sys.argv or verboso_pelo_ambiente():
+        configurar_log(verboso=True)
+
     app = QApplication(sys.argv)
     
     # Define o ícone do aplicativo
@@ -15,7 +25,14 @@ def main():
     window = MainWindow()
     window.resize(750, 320)
     window.show()
+    if os.environ.get(VARIAVEL_MEDIR_INICIO):
+        QTimer.singleShot(0, app.quit)
+    else:
+        # Com a janela na tela, carrega ícones e a pilha de processamento
+        QTimer.singleShot(0, window.iniciar_aquecimento)
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
+    # Necessário para o pool de processos no executável do PyInstaller
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,249 @@
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import pandas as pd
+from typing import Any, Callable, Dict, Optional, Tuple
+from log_config import ContadoresExecucao, obter_logger
+from utils import caminho_temporario
+
+logger = obter_logger('parse_cache')
+
+# Muda quando o formato das entradas do cache muda (invalida todas)
+VERSAO_CACHE = '1'
+
+VARIAVEL_PASTA_CACHE = 'CAIXASYNC_CACHE'
+VARIAVEL_LIMITE_CACHE = 'CAIXASYNC_CACHE_MB'
+LIMITE_PADRAO_MB = 512
+TAMANHO_BLOCO_HASH = 1 << 20
+
+EXTENSOES = {'parquet': '.parquet', 'pickle': '.pkl'}
+
+def formato_padrao() -> str:
+    """Parquet quando o pyarrow está instalado; senão pickle (sem dependência extra)."""
+    return 'parquet' if importlib.util.find_spec('pyarrow') is not None else 'pickle'
+
+def pasta_cache_padrao() -> str:
+    """
+    Pasta do cache de leituras.
+
+    A variável de ambiente CAIXASYNC_CACHE tem prioridade; senão, a pasta de
+    cache do usuário (LOCALAPPDATA no Windows, XDG_CACHE_HOME ou ~/.cache).
+    """
+    if os.environ.get(VARIAVEL_PASTA_CACHE):
+        return os.environ[VARIAVEL_PASTA_CACHE]
+    if sys.platform == 'win32' and os.environ.get('LOCALAPPDATA'):
+        return os.path.join(os.environ['LOCALAPPDATA'], 'CaixaSync', 'cache')
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'caixasync')
+
+def hash_arquivo(caminho: str) -> str:
+    """SHA-256 do conteúdo do arquivo, lido em blocos."""
+    resumo = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO_HASH), b''):
+            resumo.update(bloco)
+    return resumo.hexdigest()
+
+class CacheLeituras:
+    """
+    Cache local das tabelas já lidas e normalizadas, endereçado pelo conteúdo.
+
+    A chave é o hash do conteúdo do arquivo de entrada junto com o tipo da
+    leitura, a versão do leitor e um contexto opcional (ex.: motor e regras de
+    loja), então renomear ou copiar o arquivo não perde a entrada, e alterar o
+    arquivo ou o leitor gera uma nova. Cada entrada é a tabela em formato
+    colunar (parquet, ou pickle sem pyarrow) mais os contadores da leitura em
+    JSON. Acima do limite de tamanho saem as entradas usadas há mais tempo.
+
+    Args:
+        pasta: Pasta do cache (criada se não existir)
+        limite_bytes: Tamanho máximo ocupado pelas entradas
+        formato: 'parquet' ou 'pickle' (None = formato_padrao())
+    """
+
+    def __init__(self, pasta: str, limite_bytes: int = LIMITE_PADRAO_MB << 20, formato: Optional[str] = None):
+        self.formato = formato or formato_padrao()
+        if self.formato not in EXTENSOES:
+            raise ValueError(f"Formato de cache inválido: {self.formato}. Use um de: {', '.join(EXTENSOES)}")
+        self.pasta = pasta
+        self.limite_bytes = limite_bytes
+        self.estatisticas = ContadoresExecucao(acertos=0, faltas=0, gravacoes=0, removidas=0, erros=0)
+        os.makedirs(pasta, exist_ok=True)
+
+    def chave(self, tipo: str, caminho: str, versao: str, contexto: str = '') -> str:
+        """Chave da entrada: hash do conteúdo, tipo, versão do leitor e contexto."""
+        identificacao = '|'.join((VERSAO_CACHE, tipo, versao, contexto, self.formato))
+        contexto_hash = hashlib.sha256(identificacao.encode('utf-8')).hexdigest()[:16]
+        return f'{tipo}-{hash_arquivo(caminho)}-{contexto_hash}'
+
+    def _caminhos(self, chave: str) -> Tuple[str, str]:
+        base = os.path.join(self.pasta, chave)
+        return base + EXTENSOES[self.formato], base + '.json'
+
+    def obter(
+        self,
+        tipo: str,
+        caminho: str,
+        versao: str,
+        carregar: Callable[[], Tuple[pd.DataFrame, Dict[str, Any]]],
+        contexto: str = ''
+    ) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        Tabela da entrada em cache ou, na falta dela, lida por carregar e guardada.
+
+        Args:
+            tipo: Tipo da leitura (ex.: 'movimentacoes')
+            caminho: Arquivo de entrada
+            versao: Versão do leitor; mudar a versão invalida as entradas antigas
+            carregar: Faz a leitura de fato e devolve (tabela, metadados em JSON)
+            contexto: Demais parâmetros que mudam o resultado da leitura
+
+        Returns:
+            Tupla (tabela, metadados da leitura)
+        """
+        chave = self.chave(tipo, caminho, versao, contexto)
+        encontrado = self._ler(chave)
+        if encontrado is not None:
+            self.estatisticas['acertos'] += 1
+            logger.info('%s lido do cache: %s', caminho, chave)
+            return encontrado
+
+        self.estatisticas['faltas'] += 1
+        df, metadados = carregar()
+        self._gravar(chave, df, metadados)
+        return df, metadados
+
+    def _ler(self, chave: str) -> Optional[Tuple[pd.DataFrame, Dict[str, Any]]]:
+        caminho_dados, caminho_meta = self._caminhos(chave)
+        if not (os.path.exists(caminho_dados) and os.path.exists(caminho_meta)):
+            return None
+        try:
+            with open(caminho_meta, 'r', encoding='utf-8') as arquivo:
+                metadados = json.load(arquivo)
+            if self.formato == 'parquet':
+                df = pd.read_parquet(caminho_dados)
+            else:
+                df = pd.read_pickle(caminho_dados)
+        except Exception as e:
+            self.estatisticas['erros'] += 1
+            logger.warning('Entrada do cache ilegível descartada (%s): %s', chave, e)
+            self._remover(chave)
+            return None
+        # A data de modificação marca o último uso, para a remoção das mais antigas
+        for caminho in (caminho_dados, caminho_meta):
+            os.utime(caminho, None)
+        return df, metadados
+
+    def _gravar(self, chave: str, df: pd.DataFrame, metadados: Dict[str, Any]) -> None:
+        caminho_dados, caminho_meta = self._caminhos(chave)
+        try:
+            # Metadados antes dos dados: a entrada só existe quando o arquivo de dados aparece
+            temp_meta = caminho_temporario(caminho_meta)
+            with open(temp_meta, 'w', encoding='utf-8') as arquivo:
+                json.dump(metadados, arquivo, ensure_ascii=False)
+            os.replace(temp_meta, caminho_meta)
+
+            temp_dados = caminho_temporario(caminho_dados)
+            if self.formato == 'parquet':
+                df.to_parquet(temp_dados)
+            else:
+                df.to_pickle(temp_dados)
+            os.replace(temp_dados, caminho_dados)
+        except Exception as e:
+            # Sem cache a leitura continua valendo; só a próxima não será acelerada
+            self.estatisticas['erros'] += 1
+            logger.warning('Não foi possível gravar no cache (%s): %s', chave, e)
+            self._remover(chave)
+            return
+        self.estatisticas['gravacoes'] += 1
+        self._limitar_tamanho()
+
+    def _remover(self, chave: str) -> None:
+        for caminho in self._caminhos(chave):
+            for candidato in (caminho, caminho_temporario(caminho)):
+                if os.path.exists(candidato):
+                    os.remove(candidato)
+
+    def _entradas(self):
+        """(último uso, tamanho, chave) de cada entrada, das usadas há mais tempo para as mais recentes."""
+        entradas = []
+        extensao = EXTENSOES[self.formato]
+        for nome in os.listdir(self.pasta):
+            if not nome.endswith(extensao) or nome.endswith('.temp' + extensao):
+                continue
+            chave = nome[:-len(extensao)]
+            caminho_dados, caminho_meta = self._caminhos(chave)
+            try:
+                tamanho = os.path.getsize(caminho_dados)
+                if os.path.exists(caminho_meta):
+                    tamanho += os.path.getsize(caminho_meta)
+                entradas.append((os.path.getmtime(caminho_dados), tamanho, chave))
+            except OSError:
+                continue
+        return sorted(entradas)
+
+    def tamanho(self) -> int:
+        """Bytes ocupados pelas entradas."""
+        return sum(tamanho for _, tamanho, _ in self._entradas())
+
+    def _limitar_tamanho(self) -> None:
+        entradas = self._entradas()
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        for _, tamanho, chave in entradas:
+            if total <= self.limite_bytes:
+                break
+            self._remover(chave)
+            total -= tamanho
+            self.estatisticas['removidas'] += 1
+            logger.debug('Entrada removida do cache pelo limite de tamanho: %s', chave)
+
+    def limpar(self) -> None:
+        """Remove todas as entradas."""
+        for _, _, chave in self._entradas():
+            self._remover(chave)
+
+    def resumo(self) -> Dict[str, Any]:
+        """Estatísticas da execução e ocupação do cache, para o resumo da execução."""
+        return {
+            'pasta': os.path.abspath(self.pasta),
+            'formato': self.formato,
+            'tamanho_bytes': self.tamanho(),
+            'limite_bytes': self.limite_bytes,
+            **self.estatisticas,
+        }
+
+def ler_com_cache(
+    cache: Optional[CacheLeituras],
+    tipo: str,
+    caminho: str,
+    versao: str,
+    carregar: Callable[[], Tuple[pd.DataFrame, Dict[str, Any]]],
+    contexto: str = ''
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Atalho para CacheLeituras.obter quando o cache é opcional (None = lê sempre)."""
+    if cache is None:
+        return carregar()
+    return cache.obter(tipo, caminho, versao, carregar, contexto)
+
+_cache_padrao: Optional[CacheLeituras] = None
+
+def obter_cache_padrao() -> Optional[CacheLeituras]:
+    """
+    Cache na pasta padrão (ver pasta_cache_padrao), criado uma única vez.
+
+    O limite vem de CAIXASYNC_CACHE_MB (padrão 512); CAIXASYNC_CACHE_MB=0
+    desliga o cache e a função devolve None.
+    """
+    global _cache_padrao
+    if _cache_padrao is None:
+        limite_mb = int(os.environ.get(VARIAVEL_LIMITE_CACHE, LIMITE_PADRAO_MB))
+        if limite_mb <= 0:
+            return None
+        try:
+            _cache_padrao = CacheLeituras(pasta_cache_padrao(), limite_mb << 20)
+        except OSError as e:
+            logger.warning('Cache de leituras desativado: %s', e)
+            return None
+    return _cache_padrao
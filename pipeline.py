@@ -0,0 +1,139 @@
+import pandas as pd
+from typing import Dict, Optional, Tuple
+from compare_movements import cruzar_planilhas_movimentacao
+from excel_writer import EscritorPlanilha
+from html_reader import gerar_planilha_formatada
+from log_config import ContadoresExecucao, obter_logger
+from account_rules import RegrasContas
+from approximate_match import CriteriosAproximacao
+from grouped_match import CriteriosAgrupamento
+from ledger import LivroConciliacao
+from parse_cache import CacheLeituras
+from progress import OperacaoCancelada, Progresso
+
+logger = obter_logger('pipeline')
+
+class ResultadoPipeline:
+    """
+    Resultado das duas etapas executadas em sequência.
+
+    Attributes:
+        formatada: Planilha formatada em memória (Valor em centavos)
+        caminho_formatada: Arquivo da planilha formatada (None se não foi gravado)
+        arquivos: Caminho da planilha salva para cada conta bancária
+        contadores_transformacao: Contadores da etapa 1
+        contadores_cruzamento: Contadores da etapa 2
+    """
+
+    def __init__(
+        self,
+        formatada: pd.DataFrame,
+        caminho_formatada: Optional[str],
+        arquivos: Dict[str, str],
+        contadores_transformacao: ContadoresExecucao,
+        contadores_cruzamento: ContadoresExecucao
+    ):
+        self.formatada = formatada
+        self.caminho_formatada = caminho_formatada
+        self.arquivos = arquivos
+        self.contadores_transformacao = contadores_transformacao
+        self.contadores_cruzamento = contadores_cruzamento
+
+def transformar_para_cruzamento(
+    arquivo_caixa: str,
+    caminho_formatada: Optional[str] = None,
+    motor: str = 'vetorizado',
+    escritor: Optional[EscritorPlanilha] = None,
+    progresso: Optional[Progresso] = None,
+    cache: Optional[CacheLeituras] = None
+) -> Tuple[pd.DataFrame, ContadoresExecucao]:
+    """
+    Etapa 1 com a planilha formatada mantida em memória para a etapa 2.
+
+    Diferente de html_reader.transformar_planilha, os erros são levantados
+    para quem chamou, já que sem a planilha não há cruzamento.
+
+    Args:
+        arquivo_caixa: Relatório de caixa
+        caminho_formatada: Onde gravar a planilha formatada para conferência (None = não grava)
+        motor: Motor da transformação (ver html_reader.MOTORES_TRANSFORMACAO)
+        escritor: Escritor da planilha de saída (None = streaming)
+        progresso: Recebe o andamento e permite cancelar (ver progress.Progresso)
+        cache: Cache dos arquivos já lidos (None = sempre lê, ver parse_cache)
+
+    Returns:
+        Tupla (planilha formatada com Valor em centavos, contadores da etapa)
+    """
+    contadores = ContadoresExecucao(
+        movimentacoes=0, linhas_dados=0, linhas_ignoradas=0,
+        estornos=0, usuarios_desconhecidos=0, registros=0, erros=0
+    )
+    try:
+        formatada = gerar_planilha_formatada(
+            arquivo_caixa, caminho_formatada, motor, escritor, progresso, contadores, cache
+        )
+    except OperacaoCancelada:
+        logger.info("Transformação cancelada")
+        raise
+    contadores.registrar_resumo(logger, "Resumo da transformação")
+    return formatada, contadores
+
+def executar_pipeline(
+    arquivo_caixa: str,
+    arquivo_movimentacoes: str,
+    pasta_saida: str,
+    caminho_formatada: Optional[str] = None,
+    motor: str = 'vetorizado',
+    trabalhadores: int = 1,
+    usar_processos: bool = False,
+    escritor: Optional[EscritorPlanilha] = None,
+    regras_contas: Optional[RegrasContas] = None,
+    progresso: Optional[Progresso] = None,
+    cache: Optional[CacheLeituras] = None,
+    tamanho_lote: Optional[int] = None,
+    aproximacao: Optional[CriteriosAproximacao] = None,
+    agrupamento: Optional[CriteriosAgrupamento] = None,
+    livro: Optional[LivroConciliacao] = None
+) -> ResultadoPipeline:
+    """
+    Executa a transformação e o cruzamento sem passar pelo .xlsx intermediário.
+
+    A planilha formatada vai tipada direto para o cruzamento; o arquivo só é
+    gravado quando caminho_formatada é informado, para conferência.
+
+    Args:
+        arquivo_caixa: Relatório de caixa (entrada da etapa 1)
+        arquivo_movimentacoes: Planilha de movimentações (entrada da etapa 2)
+        pasta_saida: Pasta das planilhas por conta e relatórios
+        caminho_formatada: Onde gravar a planilha formatada (None = não grava)
+        motor: Motor da transformação (ver html_reader.MOTORES_TRANSFORMACAO)
+        trabalhadores: Quantidade de planilhas de conta salvas simultaneamente
+        usar_processos: Usa um pool de processos em vez de threads
+        escritor: Escritor das planilhas de saída (None = streaming)
+        regras_contas: Tabela filial/forma de pagamento → conta (None = config/contas.json)
+        progresso: Recebe o andamento e permite cancelar (ver progress.Progresso)
+        cache: Cache dos arquivos já lidos (None = sempre lê, ver parse_cache)
+        tamanho_lote: Cruza as movimentações em blocos de linhas (None = arquivo
+            inteiro em memória, ver cruzar_planilhas_movimentacao)
+        aproximacao: Critérios do cruzamento aproximado (None = não faz)
+        agrupamento: Critérios do cruzamento agrupado (None = não faz)
+        livro: Livro do cruzamento incremental (None = cruza tudo, ver ledger)
+
+    Returns:
+        Resultado das duas etapas
+
+    Raises:
+        ErroEscritaContas: Se alguma conta falhar (as demais são salvas)
+        OperacaoCancelada: Se o cancelamento for pedido (nenhum arquivo parcial é deixado)
+    """
+    formatada, contadores_transformacao = transformar_para_cruzamento(
+        arquivo_caixa, caminho_formatada, motor, escritor, progresso, cache
+    )
+    contadores_cruzamento = ContadoresExecucao()
+    arquivos = cruzar_planilhas_movimentacao(
+        formatada, arquivo_movimentacoes, pasta_saida,
+        trabalhadores=trabalhadores, usar_processos=usar_processos, escritor=escritor,
+        regras_contas=regras_contas, progresso=progresso, contadores=contadores_cruzamento, cache=cache,
+        tamanho_lote=tamanho_lote, aproximacao=aproximacao, agrupamento=agrupamento, livro=livro
+    )
+    return ResultadoPipeline(formatada, caminho_formatada, arquivos, contadores_transformacao, contadores_cruzamento)
@@ -0,0 +1,111 @@
+import threading
+import time
+from typing import Callable, Optional
+
+# Intervalo mínimo entre duas notificações, para não inundar a interface
+INTERVALO_NOTIFICACAO = 0.1
+
+class OperacaoCancelada(Exception):
+    """O processamento foi interrompido a pedido do usuário."""
+
+class Progresso:
+    """
+    Canal de progresso e cancelamento entre o processamento e quem o acompanha.
+
+    O processamento divide o trabalho em fases (iniciar_fase) e avança dentro
+    de cada uma (avancar). O callback recebe (fase, feito, total, eta), com
+    total e eta None quando o tamanho da fase é desconhecido, e é chamado no
+    máximo a cada INTERVALO_NOTIFICACAO segundos, além do início e do fim de
+    cada fase. cancelar() pode ser chamado de outra thread: a próxima chamada
+    de avancar ou verificar levanta OperacaoCancelada.
+
+    Args:
+        callback: Função chamada a cada notificação (None = só cancelamento)
+        intervalo: Intervalo mínimo entre notificações, em segundos
+    """
+
+    def __init__(
+        self,
+        callback: Optional[Callable[[str, int, Optional[int], Optional[float]], None]] = None,
+        intervalo: float = INTERVALO_NOTIFICACAO
+    ):
+        self.callback = callback
+        self.intervalo = intervalo
+        self.fase = ''
+        self.feito = 0
+        self.total: Optional[int] = None
+        self._cancelado = threading.Event()
+        self._trava = threading.Lock()
+        self._inicio_fase = time.monotonic()
+        self._ultima_notificacao = 0.0
+
+    @property
+    def cancelado(self) -> bool:
+        return self._cancelado.is_set()
+
+    def cancelar(self) -> None:
+        """Pede a interrupção do processamento (seguro de chamar de qualquer thread)."""
+        self._cancelado.set()
+
+    def verificar(self) -> None:
+        """Levanta OperacaoCancelada se o cancelamento foi pedido."""
+        if self._cancelado.is_set():
+            raise OperacaoCancelada('Processamento cancelado pelo usuário')
+
+    def iniciar_fase(self, fase: str, total: Optional[int] = None) -> None:
+        """
+        Começa uma nova fase do processamento.
+
+        Args:
+            fase: Descrição exibida ao usuário
+            total: Quantidade de passos da fase (None = desconhecida)
+        """
+        self.verificar()
+        with self._trava:
+            self.fase = fase
+            self.feito = 0
+            self.total = total
+            self._inicio_fase = time.monotonic()
+        self._notificar(forcar=True)
+
+    def avancar(self, quantidade: int = 1) -> None:
+        """Registra passos concluídos na fase atual e verifica o cancelamento."""
+        self.verificar()
+        with self._trava:
+            self.feito += quantidade
+        self._notificar(forcar=self.total is not None and self.feito >= self.total)
+
+    def definir(self, feito: int, total: Optional[int] = None) -> None:
+        """Define a posição absoluta na fase atual (ex.: bytes lidos de um arquivo)."""
+        self.verificar()
+        with self._trava:
+            self.feito = feito
+            if total is not None:
+                self.total = total
+        self._notificar()
+
+    def eta(self) -> Optional[float]:
+        """Segundos estimados para o fim da fase, pelo ritmo desde o seu início."""
+        if not self.total or self.feito <= 0:
+            return None
+        decorrido = time.monotonic() - self._inicio_fase
+        return max(0.0, decorrido / self.feito * (self.total - self.feito))
+
+    def _notificar(self, forcar: bool = False) -> None:
+        if self.callback is None:
+            return
+        agora = time.monotonic()
+        if not forcar and agora - self._ultima_notificacao < self.intervalo:
+            return
+        self._ultima_notificacao = agora
+        self.callback(self.fase, self.feito, self.total, self.eta())
+
+def iniciar_fase(progresso: Optional[Progresso], fase: str, total: Optional[int] = None) -> None:
+    """Atalho para iniciar uma fase quando o progresso é opcional."""
+    if progresso is not None:
+        progresso.iniciar_fase(fase, total)
+
+def avancar(progresso: Optional[Progresso], quantidade: int = 1) -> None:
+    """Atalho para avançar quando o progresso é opcional."""
+    if progresso is not None:
+        progresso.avancar(quantidade)
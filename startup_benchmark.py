@@ -0,0 +1,103 @@
+"""
+Mede o tempo até a primeira janela do CaixaSync.
+
+Executa o programa várias vezes com CAIXASYNC_MEDIR_INICIO=1 (o programa fecha
+assim que a janela aparece) e mede o tempo de parede de cada execução, incluindo
+a descompactação do executável one-file do PyInstaller.
+
+    python startup_benchmark.py                          # código-fonte
+    python startup_benchmark.py --executavel dist/CaixaSync.exe
+    python startup_benchmark.py --limite 2.5             # falha se a mediana passar de 2,5 s
+    python startup_benchmark.py --importacoes            # módulos mais lentos de importar
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+VARIAVEL_MEDIR_INICIO = 'CAIXASYNC_MEDIR_INICIO'
+PASTA_PROJETO = os.path.dirname(os.path.abspath(__file__))
+
+def medir_execucao(comando: List[str], tempo_maximo: float) -> float:
+    """
+    Executa o programa uma vez até a janela aparecer e ele fechar.
+
+    Args:
+        comando: Comando que inicia o programa
+        tempo_maximo: Segundos até desistir da execução
+
+    Returns:
+        Segundos do início do processo até o seu fim
+    """
+    ambiente = dict(os.environ, **{VARIAVEL_MEDIR_INICIO: '1'})
+    inicio = time.perf_counter()
+    resultado = subprocess.run(
+        comando, env=ambiente, cwd=PASTA_PROJETO, timeout=tempo_maximo,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    decorrido = time.perf_counter() - inicio
+    if resultado.returncode != 0:
+        erro = resultado.stderr.decode(errors='replace').strip().splitlines()
+        raise RuntimeError(f"O programa terminou com código {resultado.returncode}: {erro[-1] if erro else ''}")
+    return decorrido
+
+def importacoes_mais_lentas(quantidade: int) -> List[str]:
+    """
+    Módulos com maior tempo acumulado de importação ao carregar a interface.
+
+    Usa python -X importtime importando main, sem abrir a janela.
+    """
+    resultado = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=PASTA_PROJETO, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True
+    )
+    tempos = []
+    for linha in resultado.stderr.decode(errors='replace').splitlines():
+        if not linha.startswith('import time:') or '|' not in linha:
+            continue
+        partes = [parte.strip() for parte in linha[len('import time:'):].split('|')]
+        if partes[1].isdigit():
+            tempos.append((int(partes[1]), partes[2]))
+    tempos.sort(reverse=True)
+    return [f'{acumulado / 1000:8.1f} ms  {modulo}' for acumulado, modulo in tempos[:quantidade]]
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Tempo até a primeira janela do CaixaSync.')
+    parser.add_argument('--executavel', help='Executável gerado pelo PyInstaller (padrão: main.py do código-fonte)')
+    parser.add_argument('-n', '--repeticoes', type=int, default=5, help='Quantidade de execuções medidas (padrão: 5)')
+    parser.add_argument('--aquecimento', type=int, default=1,
+                        help='Execuções descartadas antes da medição, para o cache de disco (padrão: 1)')
+    parser.add_argument('--limite', type=float, help='Orçamento em segundos: código de saída 1 se a mediana passar dele')
+    parser.add_argument('--tempo-maximo', type=float, default=60.0, help='Segundos até desistir de uma execução')
+    parser.add_argument('--importacoes', type=int, nargs='?', const=15, default=0,
+                        help='Lista os N módulos mais lentos de importar (padrão: 15)')
+    args = parser.parse_args()
+
+    if args.executavel:
+        comando, alvo = [os.path.abspath(args.executavel)], f'executável {args.executavel}'
+    else:
+        comando, alvo = [sys.executable, os.path.join(PASTA_PROJETO, 'main.py')], 'código-fonte'
+
+    for _ in range(args.aquecimento):
+        medir_execucao(comando, args.tempo_maximo)
+    tempos = [medir_execucao(comando, args.tempo_maximo) for _ in range(args.repeticoes)]
+    mediana = statistics.median(tempos)
+
+    print(f'Tempo até a primeira janela ({alvo}, {len(tempos)} execuções):')
+    print(f'  mediana {mediana:.3f} s | mínimo {min(tempos):.3f} s | máximo {max(tempos):.3f} s')
+
+    if args.importacoes and not args.executavel:
+        print('Importações mais lentas:')
+        for linha in importacoes_mais_lentas(args.importacoes):
+            print('  ' + linha)
+
+    if args.limite is not None and mediana > args.limite:
+        print(f'Acima do orçamento de {args.limite:.3f} s')
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
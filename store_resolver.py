@@ -0,0 +1,138 @@
+import re
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+from app_config import caminho_config, carregar_json
+from log_config import obter_logger
+
+logger = obter_logger('store_resolver')
+
+ARQUIVO_LOJAS = 'lojas.json'
+
+# Entradas com este prefixo são expressões regulares; as demais são trechos do nome
+PREFIXO_REGEX = 're:'
+
+class ResolvedorLojas:
+    """
+    Determina a loja de cada operador a partir de uma tabela de padrões.
+
+    Todos os padrões são compilados em uma única expressão regular. Em caso de
+    mais de um padrão no mesmo nome, vale o que aparece primeiro na tabela
+    (mesma prioridade da antiga sequência de if/elif). O resultado é
+    memorizado por usuário, então o custo depende dos usuários distintos e
+    não da quantidade de linhas.
+
+    Args:
+        regras: Pares (padrão, loja) em ordem de prioridade
+    """
+
+    def __init__(self, regras: List[Tuple[str, str]]):
+        self.regras = list(regras)
+        self._lojas: Dict[str, str] = {}
+        self._cache: Dict[str, str] = {}
+
+        alternativas = []
+        for indice, (padrao, loja) in enumerate(self.regras):
+            if padrao.startswith(PREFIXO_REGEX):
+                expressao = padrao[len(PREFIXO_REGEX):]
+            else:
+                expressao = re.escape(padrao.strip().lower())
+            nome_grupo = f'r{indice}'
+            self._lojas[nome_grupo] = loja
+            # Lookahead a partir do início: a primeira alternativa que casa é a de maior prioridade
+            alternativas.append(f'(?=.*?(?P<{nome_grupo}>{expressao}))')
+        self._padrao = re.compile('|'.join(alternativas), re.IGNORECASE | re.DOTALL) if alternativas else None
+
+    @classmethod
+    def de_config(cls, config: Dict) -> 'ResolvedorLojas':
+        """
+        Cria o resolvedor a partir do conteúdo do arquivo de configuração.
+
+        Formato: {"lojas": {"Loja 1": ["jozimara", "neide"], "Loja 2": ["re:^gei"]}}
+
+        Args:
+            config: Configuração já carregada
+
+        Returns:
+            Resolvedor com as regras na ordem do arquivo
+        """
+        lojas = config.get('lojas')
+        if not isinstance(lojas, dict):
+            raise ValueError("Configuração de lojas inválida: esperado um objeto 'lojas' com listas de padrões")
+        regras = []
+        for loja, padroes in lojas.items():
+            if isinstance(padroes, str):
+                padroes = [padroes]
+            regras.extend((str(padrao), str(loja)) for padrao in padroes if str(padrao).strip())
+        return cls(regras)
+
+    @classmethod
+    def de_arquivo(cls, caminho: Optional[str] = None) -> 'ResolvedorLojas':
+        """
+        Carrega o resolvedor de um arquivo JSON.
+
+        Args:
+            caminho: Caminho do arquivo (None = config/lojas.json, ver app_config)
+
+        Returns:
+            Resolvedor carregado
+        """
+        caminho = caminho or caminho_config(ARQUIVO_LOJAS)
+        resolvedor = cls.de_config(carregar_json(caminho))
+        logger.debug("Regras de loja carregadas de %s: %d padrão(ões)", caminho, len(resolvedor.regras))
+        return resolvedor
+
+    def resolver(self, usuario) -> str:
+        """
+        Determina a loja de um usuário.
+
+        Args:
+            usuario: Nome do usuário que fez a movimentação
+
+        Returns:
+            Nome da loja ou string vazia se nenhum padrão casar
+        """
+        if usuario is None or (isinstance(usuario, float) and pd.isna(usuario)):
+            return ''
+        chave = str(usuario).strip().lower()
+        if chave not in self._cache:
+            encontrado = self._padrao.match(chave) if (chave and self._padrao) else None
+            self._cache[chave] = self._lojas[encontrado.lastgroup] if encontrado else ''
+            if chave and not encontrado:
+                logger.debug("Usuário não reconhecido: '%s'", chave)
+        return self._cache[chave]
+
+    def resolver_coluna(self, usuarios: pd.Series) -> pd.Series:
+        """
+        Determina a loja de cada linha avaliando cada usuário distinto uma única vez.
+
+        Args:
+            usuarios: Coluna com os nomes dos usuários
+
+        Returns:
+            Série alinhada com as lojas ('' quando não reconhecido)
+        """
+        distintos = usuarios.dropna().unique()
+        lojas = {usuario: self.resolver(usuario) for usuario in distintos}
+        return usuarios.map(lojas).fillna('').astype(object)
+
+_resolvedor_padrao: Optional[ResolvedorLojas] = None
+
+def obter_resolvedor_lojas() -> ResolvedorLojas:
+    """Resolvedor carregado do arquivo de configuração padrão (lido uma única vez)."""
+    global _resolvedor_padrao
+    if _resolvedor_padrao is None:
+        _resolvedor_padrao = ResolvedorLojas.de_arquivo()
+    return _resolvedor_padrao
+
+def resolver_lojas(usuarios: pd.Series, resolvedor: Optional[ResolvedorLojas] = None) -> pd.Series:
+    """
+    Coluna de lojas a partir da coluna de usuários.
+
+    Args:
+        usuarios: Coluna com os nomes dos usuários
+        resolvedor: Resolvedor a usar (None = configuração padrão)
+
+    Returns:
+        Série com a loja de cada linha
+    """
+    return (resolvedor or obter_resolvedor_lojas()).resolver_coluna(usuarios)
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+from typing import Mapping, Tuple
+from utils import centavos_para_reais
+
+# Origem de cada linha do relatório de não relacionados
+ORIGEM_CAIXA = 'Caixa'
+ORIGEM_MOVIMENTACOES = 'Movimentações'
+
+# Motivo de cada linha, do diagnóstico pelas chaves parciais do outro lado
+MOTIVO_CODIGO = 'Código não encontrado'
+MOTIVO_VALOR = 'Código encontrado, valor diferente'
+MOTIVO_FILIAL = 'Código e valor encontrados, filial diferente'
+MOTIVOS = (MOTIVO_CODIGO, MOTIVO_VALOR, MOTIVO_FILIAL)
+
+COLUNAS_NAO_RELACIONADOS = [
+    'Origem', 'Motivo', 'Movimentação', 'Código', 'Cliente/Fornecedor',
+    'Filial', 'Valor', 'Forma de Pagamento', 'Data'
+]
+
+def _motivos(tem_codigo: np.ndarray, tem_codigo_valor: np.ndarray) -> np.ndarray:
+    return np.where(tem_codigo_valor, MOTIVO_FILIAL, np.where(tem_codigo, MOTIVO_VALOR, MOTIVO_CODIGO)).astype(object)
+
+class DiagnosticoChaves:
+    """
+    Motivo de cada linha sem correspondente, pelas chaves parciais (código) e
+    (código, valor) do outro lado do cruzamento.
+
+    As chaves parciais da planilha formatada ficam em dois índices hash,
+    montados uma única vez. As movimentações são consultadas neles por uma
+    busca vetorizada e, em registrar, marcam quais dessas chaves apareceram;
+    as linhas da planilha formatada são diagnosticadas por essas marcas. Assim
+    os dois lados são diagnosticados em tempo linear, mesmo com as
+    movimentações lidas em blocos (ver compare_movements).
+
+    Args:
+        codigos: Coluna Movimentação da planilha formatada
+        valores: Coluna Valor da planilha formatada (centavos)
+    """
+
+    def __init__(self, codigos: pd.Series, valores: pd.Series):
+        self._codigos = pd.Index(codigos).unique()
+        # O par usa a posição do código no primeiro índice: chaves inteiras, mais rápidas que texto
+        self._pares = pd.MultiIndex.from_arrays([self._codigos.get_indexer(codigos), np.asarray(valores)]).unique()
+        self._codigo_visto = np.zeros(len(self._codigos), dtype=bool)
+        self._par_visto = np.zeros(len(self._pares), dtype=bool)
+
+    def _buscar(self, codigos: pd.Series, valores: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+        posicoes_codigo = self._codigos.get_indexer(codigos)
+        posicoes_par = self._pares.get_indexer(pd.MultiIndex.from_arrays([posicoes_codigo, np.asarray(valores)]))
+        return posicoes_codigo, posicoes_par
+
+    def registrar(self, codigos: pd.Series, valores: pd.Series) -> None:
+        """Marca as chaves parciais da planilha formatada que aparecem nestas movimentações."""
+        posicoes_codigo, posicoes_par = self._buscar(codigos, valores)
+        self._codigo_visto[posicoes_codigo[posicoes_codigo >= 0]] = True
+        self._par_visto[posicoes_par[posicoes_par >= 0]] = True
+
+    def motivos_movimentacoes(self, codigos: pd.Series, valores: pd.Series) -> np.ndarray:
+        """Motivo de cada movimentação sem correspondente (colunas Código e Valor (R$))."""
+        posicoes_codigo, posicoes_par = self._buscar(codigos, valores)
+        return _motivos(posicoes_codigo >= 0, posicoes_par >= 0)
+
+    def motivos_caixa(self, codigos: pd.Series, valores: pd.Series) -> np.ndarray:
+        """
+        Motivo de cada linha da planilha formatada sem correspondente (colunas
+        Movimentação e Valor), pelas movimentações registradas até aqui.
+        """
+        posicoes_codigo, posicoes_par = self._buscar(codigos, valores)
+        return _motivos(self._codigo_visto[posicoes_codigo], self._par_visto[posicoes_par])
+
+def linhas_caixa(nao_relacionados: pd.DataFrame, motivos: np.ndarray) -> pd.DataFrame:
+    """
+    Linhas da planilha formatada sem correspondente nas COLUNAS_NAO_RELACIONADOS.
+
+    Args:
+        nao_relacionados: Linhas da planilha formatada (Valor em centavos)
+        motivos: Motivo de cada linha (ver DiagnosticoChaves.motivos_caixa)
+    """
+    linhas = nao_relacionados.reindex(columns=COLUNAS_NAO_RELACIONADOS[2:])
+    linhas.insert(0, 'Motivo', motivos)
+    linhas.insert(0, 'Origem', ORIGEM_CAIXA)
+    linhas['Forma de Pagamento'] = linhas['Forma de Pagamento'].fillna('')
+    linhas['Data'] = linhas['Data'].fillna('')
+    return linhas.reset_index(drop=True)
+
+def linhas_movimentacoes(movimentacoes: pd.DataFrame, motivos: np.ndarray) -> pd.DataFrame:
+    """
+    Movimentações sem correspondente nas COLUNAS_NAO_RELACIONADOS: o código vai
+    para Movimentação, como na chave do cruzamento, e a data sai como texto
+    dd/mm/yyyy, como a do caixa.
+
+    Args:
+        movimentacoes: Movimentações normalizadas (ver compare_movements.ler_movimentacoes)
+        motivos: Motivo de cada linha (ver DiagnosticoChaves.motivos_movimentacoes)
+    """
+    datas = pd.to_datetime(movimentacoes['Data Movimentação'])
+    return pd.DataFrame({
+        'Origem': ORIGEM_MOVIMENTACOES,
+        'Motivo': motivos,
+        'Movimentação': movimentacoes['Código'].to_numpy(),
+        'Código': '',
+        'Cliente/Fornecedor': movimentacoes['Cliente/Fornecedor'].to_numpy(),
+        'Filial': movimentacoes['Filial'].astype(object).to_numpy(),
+        'Valor': movimentacoes['Valor (R$)'].to_numpy(dtype='int64'),
+        'Forma de Pagamento': '',
+        'Data': datas.dt.strftime('%d/%m/%Y').fillna('').to_numpy(),
+    }, columns=COLUNAS_NAO_RELACIONADOS)
+
+def em_reais(linhas: pd.DataFrame) -> pd.DataFrame:
+    """Linhas de linhas_caixa ou linhas_movimentacoes com o Valor em reais, como no relatório."""
+    return linhas.assign(Valor=centavos_para_reais(linhas['Valor'].astype('int64')))
+
+def montar_relatorio_nao_relacionados(caixa: pd.DataFrame, movimentacoes: pd.DataFrame) -> pd.DataFrame:
+    """
+    Relatório único dos dois lados: primeiro as linhas do caixa, depois as
+    movimentações, cada lado na ordem original, com o Valor em reais.
+
+    Args:
+        caixa: Resultado de linhas_caixa
+        movimentacoes: Resultado de linhas_movimentacoes
+    """
+    return em_reais(pd.concat([caixa, movimentacoes], ignore_index=True))
+
+def resumir_motivos(contagem: Mapping[Tuple[str, str], int]) -> str:
+    """Resumo 'origem / motivo: quantidade' para o log, a partir de uma contagem por (origem, motivo)."""
+    return '; '.join(f'{origem} / {motivo}: {quantidade}' for (origem, motivo), quantidade in contagem.items())
+
+def contar_motivos(relatorio: pd.DataFrame) -> str:
+    """Resumo 'origem / motivo: quantidade' para o log."""
+    return resumir_motivos(relatorio.groupby(['Origem', 'Motivo'], sort=False).size())
@@ -1,40 +1,32 @@
+import math
+import os
 import re
 import pandas as pd
-from typing import Union, Optional
+from typing import Union, Optional, Tuple
+from store_resolver import obter_resolvedor_lojas
+from account_rules import obter_regras_contas
+
+# Primeiro número de uma string (fallback quando a conversão direta falha)
+PADRAO_NUMERO = re.compile(r'-?\d*\.?\d+')
+
+# Número decimal já limpo (ponto decimal, sem milhar): sinal, parte inteira e casas.
+# A parte inteira vai até 13 dígitos para os centavos caberem exatos em um float
+PADRAO_DECIMAL = re.compile(r'^(-?)(\d{0,13})(?:\.(\d*))?$')
 
 def extrair_loja(usuario: str) -> str:
     """
     Determina a loja com base no usuário.
     
+    As regras vêm de config/lojas.json (ver store_resolver). Para colunas
+    inteiras use store_resolver.resolver_lojas, que avalia cada usuário uma vez.
+    
     Args:
         usuario: Nome do usuário que fez a movimentação
         
     Returns:
         String formatada 'Loja X' ou string vazia se não encontrar
     """
-    print(f"\nExtraindo loja para usuário: '{usuario}'")
-    if not usuario:
-        print("Usuário vazio, retornando string vazia")
-        return ''
-    
-    usuario = str(usuario).lower().strip()
-    print(f"Usuário normalizado: '{usuario}'")
-    
-    if 'jozimara' in usuario:
-        print("Usuário contém jozimara -> Loja 1")
-        return 'Loja 1'
-    elif 'neide' in usuario:
-        print("Usuário contém neide -> Loja 1")
-        return 'Loja 1'
-    elif 'geizy' in usuario:
-        print("Usuário contém geizy -> Loja 2")
-        return 'Loja 2'
-    elif 'amanda' in usuario:
-        print("Usuário contém amanda -> Loja 2")
-        return 'Loja 2'
-    
-    print(f"Usuário não reconhecido: '{usuario}' -> retornando string vazia")
-    return ''
+    return obter_resolvedor_lojas().resolver(usuario)
 
 def normalizar_filial(filial: str, padrao: str = r'Loja\s*0?(\d+)') -> str:
     """
@@ -54,40 +46,201 @@ def normalizar_filial(filial: str, padrao: str = r'Loja\s*0?(\d+)') -> str:
         return f'Loja {int(match.group(1))}'
     return ''
 
+def _limpar_valor(texto: str) -> str:
+    """Tira 'R$', parênteses e '+' inicial e, havendo vírgula, deixa o número com ponto decimal."""
+    texto = texto.replace('R$', '').replace('(', '').replace(')', '').strip()
+    if texto.startswith('+'):
+        texto = texto[1:].strip()
+    if ',' in texto:
+        texto = texto.replace('.', '').replace(',', '.')
+    return texto
+
+def _centavos_de_texto(texto: str) -> Optional[int]:
+    """
+    Centavos de um número decimal já limpo, lido dígito a dígito, sem passar por float.
+
+    A terceira casa decimal arredonda o centavo (metade para longe do zero).
+    Retorna None se o texto não for um número decimal (ver PADRAO_DECIMAL).
+    """
+    encontrado = PADRAO_DECIMAL.match(texto)
+    if not encontrado or not (encontrado.group(2) or encontrado.group(3)):
+        return None
+    sinal, inteiro, fracao = encontrado.group(1), encontrado.group(2), encontrado.group(3) or ''
+    casas = (fracao + '000')[:3]
+    centavos = int(inteiro or '0') * 100 + int(casas[:2]) + (casas[2] >= '5')
+    return -centavos if sinal else centavos
+
+def _centavos_de_textos(textos: pd.Series) -> pd.Series:
+    """Versão vetorizada de _centavos_de_texto (NaN onde o texto não é um número decimal)."""
+    partes = textos.str.extract(PADRAO_DECIMAL.pattern)
+    inteiro, fracao = partes[1], partes[2].fillna('')
+    valido = inteiro.notna() & ((inteiro.str.len() > 0) | (fracao.str.len() > 0))
+    casas = (fracao + '000').str[:3]
+    centavos = (
+        pd.to_numeric(inteiro.where(valido & (inteiro != ''), '0')) * 100
+        + pd.to_numeric(casas.str[:2].where(valido, '0'))
+        + (casas.str[2] >= '5')
+    ).astype(float)
+    return centavos.where(partes[0] != '-', -centavos).where(valido)
+
+def valor_em_centavos(valor: Union[str, int, float], tipo_operacao: Optional[str] = None) -> int:
+    """
+    Converte um valor monetário para centavos inteiros, com as regras de parse_centavos.
+
+    Texto é lido dígito a dígito, sem float ('1.234,56', 'R$ 10,00', '(5,00)';
+    'estornado' vira 0). Células numéricas já chegam em float do leitor e são
+    arredondadas ao centavo, o que é exato até 10^13 reais.
+
+    Args:
+        valor: Valor a ser convertido (string, int ou float)
+        tipo_operacao: 'Entrada' ou 'Saída'; quando informado, Entrada fica
+            sempre positiva e Saída sempre negativa
+
+    Returns:
+        Valor em centavos (0 para vazios, estornos e textos sem número)
+    """
+    centavos = None
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        if math.isfinite(valor):
+            centavos = int(round(valor * 100))
+    elif not pd.isna(valor):
+        texto = str(valor).strip()
+        if 'estornado' in texto.lower():
+            return 0
+        texto = _limpar_valor(texto)
+        centavos = _centavos_de_texto(texto)
+        if centavos is None:
+            try:
+                # Notação científica e outros formatos que só o float entende
+                numero = float(texto)
+                if math.isfinite(numero):
+                    centavos = int(round(numero * 100))
+            except ValueError:
+                numero_encontrado = PADRAO_NUMERO.search(texto)
+                if numero_encontrado:
+                    centavos = _centavos_de_texto(numero_encontrado.group(0))
+    centavos = centavos or 0
+    if tipo_operacao is None:
+        return centavos
+    return abs(centavos) if tipo_operacao == 'Entrada' else -abs(centavos)
+
 def parse_valor(valor: Union[str, int, float]) -> float:
     """
-    Converte uma string de valor monetário para float.
+    Converte um valor monetário para reais (ver valor_em_centavos).
     
     Args:
         valor: Valor a ser convertido (string, int ou float)
         
     Returns:
-        Valor convertido para float
-    """
-    if pd.isna(valor):
-        return 0.0
-    if isinstance(valor, (int, float)):
-        return float(valor)
-    
-    valor_str = str(valor).strip()
-    
-    # Se tiver vírgula, formato brasileiro
-    if ',' in valor_str:
-        # Remove pontos de milhar e troca vírgula por ponto
-        valor_str = valor_str.replace('.', '').replace(',', '.')
-    
-    try:
-        return float(valor_str)
-    except ValueError:
-        # Se falhar, tenta remover caracteres não numéricos
-        import re
-        numeros = re.findall(r'-?\d*\.?\d+', valor_str)
-        if numeros:
-            try:
-                return float(numeros[0])
-            except ValueError:
-                return 0.0
-        return 0.0
+        Valor em reais, com 2 casas decimais
+    """
+    return valor_em_centavos(valor) / 100
+
+def parse_centavos(valores: pd.Series, tipos_operacao: Optional[pd.Series] = None) -> Tuple[pd.Series, pd.Series]:
+    """
+    Converte uma coluna inteira de valores monetários brasileiros para centavos inteiros.
+    
+    Remove 'R$', parênteses e '+' inicial e, havendo vírgula, os pontos de
+    milhar; 'estornado' vira 0. O texto é lido dígito a dígito, sem float (a
+    terceira casa decimal arredonda o centavo). Colunas numéricas já chegam em
+    float do leitor e são arredondadas ao centavo, o que é exato até 10^13 reais;
+    textos que só o float entende (notação científica) seguem o mesmo caminho.
+    
+    Args:
+        valores: Série com os valores (texto ou numéricos)
+        tipos_operacao: Série alinhada com 'Entrada'/'Saída'; quando informada,
+            Entrada fica sempre positiva e Saída sempre negativa
+        
+    Returns:
+        Tupla (centavos int64, máscara das células que não puderam ser convertidas)
+    """
+    ausente = valores.isna()
+
+    if pd.api.types.is_numeric_dtype(valores) and not pd.api.types.is_bool_dtype(valores):
+        numeros = valores.astype(float)
+        centavos = (numeros.where(numeros.abs() != float('inf')) * 100).round()
+        estornado = pd.Series(False, index=valores.index)
+    else:
+        texto = valores.astype(object).where(~ausente, '').astype(str).str.strip()
+        estornado = texto.str.lower().str.contains('estornado', regex=False)
+
+        limpo = (
+            texto.str.replace('R$', '', regex=False)
+            .str.replace(r'[()]', '', regex=True)
+            .str.strip()
+            .str.replace(r'^\+', '', regex=True)
+            .str.strip()
+        )
+        com_virgula = limpo.str.contains(',', regex=False)
+        limpo = limpo.where(
+            ~com_virgula,
+            limpo.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+        )
+
+        centavos = _centavos_de_textos(limpo)
+        falhou = centavos.isna()
+        if falhou.any():
+            # Notação científica e outros formatos que só o float entende
+            numeros = pd.to_numeric(limpo[falhou], errors='coerce')
+            numeros = numeros.where(numeros.abs() != float('inf'))
+            centavos = centavos.fillna((numeros * 100).round())
+            falhou = centavos.isna()
+        if falhou.any():
+            extraido = limpo[falhou].str.extract(f'({PADRAO_NUMERO.pattern})', expand=False)
+            centavos = centavos.fillna(_centavos_de_textos(extraido.fillna('')))
+
+    falhas = centavos.isna() & ~ausente & ~estornado
+    resultado = centavos.fillna(0).astype('int64')
+
+    if tipos_operacao is not None:
+        entrada = tipos_operacao.reindex(valores.index).astype(str).str.strip() == 'Entrada'
+        resultado = resultado.abs().where(entrada, -resultado.abs())
+
+    resultado = resultado.mask(estornado | ausente, 0)
+    return resultado.rename(valores.name), falhas.rename(valores.name)
+
+def parse_valores(valores: pd.Series, tipos_operacao: Optional[pd.Series] = None) -> Tuple[pd.Series, pd.Series]:
+    """
+    Versão de parse_centavos que retorna reais (float, 2 casas decimais).
+    
+    Args:
+        valores: Série com os valores (texto ou numéricos)
+        tipos_operacao: Série alinhada com 'Entrada'/'Saída' (opcional)
+        
+    Returns:
+        Tupla (valores em reais, máscara das células que não puderam ser convertidas)
+    """
+    centavos, falhas = parse_centavos(valores, tipos_operacao)
+    return centavos_para_reais(centavos), falhas
+
+def valores_para_centavos(valores: pd.Series) -> pd.Series:
+    """
+    Converte valores em reais (float) para centavos inteiros.
+    
+    Usado na volta dos valores já escritos em reais; o arredondamento é exato
+    até 10^13 reais.
+    
+    Args:
+        valores: Série numérica em reais
+        
+    Returns:
+        Série int64 em centavos
+    """
+    return (valores.astype(float) * 100).round().astype('int64')
+
+def centavos_para_reais(centavos: pd.Series) -> pd.Series:
+    """
+    Converte centavos inteiros de volta para reais com 2 casas decimais.
+    
+    Usado apenas na escrita das planilhas de saída.
+    
+    Args:
+        centavos: Série inteira em centavos
+        
+    Returns:
+        Série float em reais
+    """
+    return (centavos.astype('int64') / 100).round(2)
 
 def sanitizar_nome_arquivo(nome: str) -> str:
     """
@@ -102,6 +255,21 @@ def sanitizar_nome_arquivo(nome: str) -> str:
     caracteres_invalidos = r'[\/:*?"<>|]'
     return re.sub(caracteres_invalidos, '_', nome)
 
+def caminho_temporario(caminho: str) -> str:
+    """
+    Caminho temporário para escrita atômica, mantendo a extensão original.
+    
+    O pandas valida a extensão ao escolher o engine, por isso o sufixo vai antes dela.
+    
+    Args:
+        caminho: Caminho final do arquivo
+        
+    Returns:
+        Caminho temporário na mesma pasta (ex.: 'saida.temp.xlsx')
+    """
+    raiz, extensao = os.path.splitext(caminho)
+    return f"{raiz}.temp{extensao}"
+
 def formatar_data(data: Union[str, pd.Timestamp]) -> str:
     """
     Formata uma data para o padrão dd/mm/yyyy.
@@ -116,34 +284,69 @@ def formatar_data(data: Union[str, pd.Timestamp]) -> str:
         return ''
     return pd.to_datetime(data).strftime('%d/%m/%Y')
 
+# Formatos aceitos para datas em texto, na ordem de tentativa (dia antes do mês)
+FORMATOS_DATA = (
+    '%d/%m/%Y', '%Y-%m-%d', '%Y-%m-%d %H:%M:%S',
+    '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%y', '%d-%m-%Y', '%d.%m.%Y'
+)
+
+def converter_datas(datas: pd.Series, formatos: Tuple[str, ...] = FORMATOS_DATA) -> Tuple[pd.Series, pd.Series]:
+    """
+    Converte uma coluna de datas em texto para datetime, com dia antes do mês.
+    
+    Cada texto distinto é convertido uma única vez (datas se repetem muito nos
+    relatórios) e cada formato explícito é aplicado a todos os textos restantes
+    de uma vez. O que não casar com nenhum formato passa pela inferência do
+    pandas com dayfirst=True, como o formatar_data do cruzamento.
+    
+    Args:
+        datas: Coluna com datas (texto, datetime ou vazias)
+        formatos: Formatos strptime tentados em ordem
+        
+    Returns:
+        Tupla (datas convertidas, máscara das células preenchidas que não
+        puderam ser convertidas)
+    """
+    if pd.api.types.is_datetime64_any_dtype(datas):
+        return datas.dt.normalize(), pd.Series(False, index=datas.index)
+
+    texto = datas.astype(object).where(datas.notna(), '').astype(str).str.strip()
+    distintos = pd.Series(texto.unique())
+    distintos = distintos[distintos != '']
+    convertidas = pd.Series(pd.NaT, index=distintos.to_numpy(), dtype='datetime64[ns]')
+
+    for formato in formatos:
+        pendentes = convertidas.isna()
+        if not pendentes.any():
+            break
+        convertidas[pendentes] = pd.to_datetime(
+            convertidas.index[pendentes], format=formato, errors='coerce'
+        ).to_numpy()
+
+    for valor in convertidas.index[convertidas.isna()]:
+        try:
+            convertidas[valor] = pd.to_datetime(valor, dayfirst=True)
+        except (ValueError, TypeError, OverflowError):
+            pass
+
+    resultado = pd.Series(convertidas.reindex(texto).to_numpy(), index=texto.index).dt.normalize()
+    falhas = resultado.isna() & (texto != '')
+    return resultado.rename(datas.name), falhas.rename(datas.name)
+
 def obter_conta_bancaria(forma_pagamento: str, filial: str) -> str:
     """
     Determina a conta bancária com base na forma de pagamento e filial.
     
+    Usa a mesma tabela do cruzamento (config/contas.json, ver account_rules).
+    
     Args:
         forma_pagamento: Forma de pagamento utilizada
         filial: Filial onde foi realizada a operação
         
     Returns:
-        Nome da conta bancária correspondente
-    """
-    if filial == "Loja 1":
-        if forma_pagamento == "Dinheiro":
-            return "CAIXA 01"
-        elif forma_pagamento == "Transferência Pix":
-            return "SICOOB"
-        elif forma_pagamento in ["Cartão de Débito VISA/ MASTER", "Cartão de Crédito VISA / MASTER"]:
-            return "MAQUINETA ÚNICA"
-            
-    elif filial == "Loja 2":
-        if forma_pagamento == "Dinheiro":
-            return "CAIXA 02"
-        elif forma_pagamento in ["Transferência Pix", "PIx Instantâneo Bradesco LJ02"]:
-            return "BRADESCO C/C"
-        elif forma_pagamento in ["Cartão de Débito VISA/ MASTER", "Cartão de Crédito VISA / MASTER"]:
-            return "MAQUINETA ÚNICA"
-            
-    return ""
+        Nome da conta bancária correspondente ou string vazia se não houver regra
+    """
+    return obter_regras_contas().conta(forma_pagamento, filial)
 
 def obter_centro_custo(filial: str) -> str:
     """